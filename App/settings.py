@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,8 +25,17 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", get_random_secret_key())
 
+# development or production. production keeps database connections open, loads templates through the cached loader
+# only, logs at INFO and leaves out everything that is only there for debugging.
+DJANGO_PROFILE = os.getenv("DJANGO_PROFILE", "development")
+if DJANGO_PROFILE not in ("development", "production"):
+    raise ImproperlyConfigured(f"DJANGO_PROFILE must be development or production, not {DJANGO_PROFILE!r}")
+PRODUCTION = DJANGO_PROFILE == "production"
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv("DEBUG", "False") == "True"
+if PRODUCTION and DEBUG:
+    raise ImproperlyConfigured("DEBUG cannot be True with DJANGO_PROFILE=production")
 
 ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS", "127.0.0.1,localhost,testserver").split(",")
 
@@ -43,7 +54,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'CinnamonSwirl',
-    'debug_toolbar',
     'crispy_forms',
     'django_tables2',
     'django_filters',
@@ -51,7 +61,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'CinnamonSwirl.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,11 +71,18 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# debug_toolbar is slow to import and not safe to expose, so it is only loaded when asked for, and never in production.
+# Defaults to DEBUG.
+DEBUG_TOOLBAR = os.getenv("DEBUG_TOOLBAR", str(DEBUG)) == "True" and not PRODUCTION
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'App.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'CinnamonSwirl.middleware.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -79,6 +96,16 @@ TEMPLATES = [
     },
 ]
 
+if PRODUCTION:
+    # Templates are read and compiled once per process and never checked for changes. The debug context processor
+    # only ever adds anything with DEBUG on.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ])]
+    TEMPLATES[0]['OPTIONS']['context_processors'].remove('django.template.context_processors.debug')
+
 WSGI_APPLICATION = 'App.wsgi.application'
 
 
@@ -89,7 +116,9 @@ DATABASE_OPTIONS = {
     "DEBUG": {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'NAME': os.getenv("DJANGO_SQLITE_PATH", BASE_DIR / 'db.sqlite3'),
+            # Seconds to wait on another process's write, such as a second run_scheduler worker, before giving up.
+            'OPTIONS': {'timeout': int(os.getenv("SQLITE_TIMEOUT", "20"))},
         }
     },
     "SANDBOX": {
@@ -109,6 +138,48 @@ if os.getenv("MYSQL_HOST", None) is None:
 else:
     DATABASES = DATABASE_OPTIONS["SANDBOX"]
 
+# Seconds a worker keeps its database connection for, instead of connecting for every request. A kept connection is
+# checked before each request reuses it, so one the server dropped is replaced rather than failing the request.
+CONN_MAX_AGE = int(os.getenv("CONN_MAX_AGE", "600" if PRODUCTION else "0"))
+
+# Borrow connections from a pool shared by each worker's threads instead, so a worker with many threads holds no more
+# than DB_POOL_SIZE connections. A borrowed connection goes back to the pool at the end of every request, so
+# CONN_MAX_AGE is not used, and is checked before it is lent out again. A request that finds them all in use waits
+# up to DB_POOL_TIMEOUT seconds for one, then fails. Connections older than DB_POOL_MAX_AGE seconds are closed.
+DB_POOL = os.getenv("DB_POOL", "False") == "True"
+if DB_POOL:
+    CONN_MAX_AGE = 0
+for database in DATABASES.values():
+    database.update({'CONN_MAX_AGE': CONN_MAX_AGE, 'CONN_HEALTH_CHECKS': CONN_MAX_AGE > 0})
+    if DB_POOL:
+        database['ENGINE'] = database['ENGINE'].replace('django.db.backends.', 'CinnamonSwirl.db.')
+        database['POOL'] = {'SIZE': int(os.getenv("DB_POOL_SIZE", "10")),
+                            'TIMEOUT': float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                            'MAX_AGE': float(os.getenv("DB_POOL_MAX_AGE", "600"))}
+
+# Caches
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Defaults to memory local to each process. Point CACHE_BACKEND and CACHE_LOCATION at memcached or redis to share it
+# between gunicorn workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("CACHE_LOCATION", ''),
+    }
+}
+
+# Resolved users for DiscordAuthenticationBackend.get_user, kept in each process. An alias shared between workers
+# carries invalidations to all of them. See CinnamonSwirl.auth.UserCache
+USER_CACHE_ALIAS = os.getenv("USER_CACHE_ALIAS", None)
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+# Rendered reminder tables on the home page and calendar feeds. See CinnamonSwirl.fragments.reminder_fragments
+TABLE_CACHE_ALIAS = os.getenv("TABLE_CACHE_ALIAS", "default")
+TABLE_CACHE_TTL = int(os.getenv("TABLE_CACHE_TTL", "60"))
+TABLE_CACHE_LOCAL_TTL = int(os.getenv("TABLE_CACHE_LOCAL_TTL", "5"))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -137,7 +208,7 @@ LOGGING = {
     },
     'root': {
         'handlers': ['console'],
-        'level': os.getenv("DJANGO_LOGGING_LEVEL", 'DEBUG'),
+        'level': os.getenv("DJANGO_LOGGING_LEVEL", 'INFO' if PRODUCTION else 'DEBUG'),
     },
     'loggers': {
         'nplusone': {
@@ -188,9 +259,49 @@ DISCORD_CLIENT_SECRET = os.getenv("DISCORD_CLIENT_SECRET")
 DISCORD_REDIRECT_URI = os.getenv("DISCORD_REDIRECT_URI")
 DISCORD_SERVER_INVITE_LINK = os.getenv("DISCORD_SERVER_INVITE_LINK", "/")
 DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL", None)
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_POOL_SIZE = int(os.getenv("WEBHOOK_POOL_SIZE", "4"))
 
 REGISTRATIONS_ENABLED = os.getenv("REGISTRATIONS_ENABLED", "False") == "True"
 
+# How many compiled reminder schedules each process keeps. See CinnamonSwirl.schedule.rule_cache
+RULE_CACHE_SIZE = int(os.getenv("RULE_CACHE_SIZE", "10000"))
+
+# How many reminders the home page lists at a time.
+REMINDERS_PAGE_SIZE = int(os.getenv("REMINDERS_PAGE_SIZE", "25"))
+
+# Bot-facing dispatch API. Disabled while DISPATCH_API_TOKEN is unset.
+DISPATCH_API_TOKEN = os.getenv("DISPATCH_API_TOKEN", None)
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "100"))
+DISPATCH_MAX_BATCH_SIZE = int(os.getenv("DISPATCH_MAX_BATCH_SIZE", "500"))
+DISPATCH_LEASE_SECONDS = int(os.getenv("DISPATCH_LEASE_SECONDS", "60"))
+DISPATCH_MAX_LEASE_SECONDS = int(os.getenv("DISPATCH_MAX_LEASE_SECONDS", "3600"))
+
+# run_scheduler workers split reminders into this many buckets by recipient and share the buckets out between them.
+# Changing it moves recipients between buckets, so stop every worker first.
+SCHEDULER_BUCKETS = int(os.getenv("SCHEDULER_BUCKETS", "64"))
+SCHEDULER_SHARD_TTL = int(os.getenv("SCHEDULER_SHARD_TTL", "30"))
+
+# Per request timing. See CinnamonSwirl.middleware.RequestTimingMiddleware
+REQUEST_TIMING = os.getenv("REQUEST_TIMING", "True") == "True"
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "True") == "True"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_SQL = int(os.getenv("SLOW_REQUEST_SQL", "10"))
+
+# Latency histograms, shared between worker processes through files in METRICS_DIR. See CinnamonSwirl.metrics
+# The endpoint that serves them is disabled while METRICS_TOKEN is unset.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "cinnamonswirl-metrics"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", None)
+
+# Profiling single requests on demand. Off while PROFILE_DIR is unset. See CinnamonSwirl.profiling
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_RATE_LIMIT = int(os.getenv("PROFILE_RATE_LIMIT", "6"))
+PROFILE_TOKEN_MAX_AGE = int(os.getenv("PROFILE_TOKEN_MAX_AGE", "3600"))
+PROFILE_STAFF_IDS = {int(user_id) for user_id in os.getenv("PROFILE_STAFF_IDS", "").split(",") if user_id.strip()}
+
 SESSION_COOKIE_SECURE = True
 
 CSRF_COOKIE_SECURE = True
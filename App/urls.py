@@ -13,13 +13,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-import debug_toolbar
 from django.contrib import admin
 from django.urls import path, include
 
+from App import settings
 
 urlpatterns = [
     path('', include('CinnamonSwirl.urls')),
-    path('admin/', admin.site.urls),
-    path('__debug__/', include(debug_toolbar.urls))
+    path('admin/', admin.site.urls)
 ]
+
+if settings.DEBUG_TOOLBAR:
+    import debug_toolbar
+    urlpatterns.append(path('__debug__/', include(debug_toolbar.urls)))
@@ -0,0 +1,109 @@
+import heapq
+import itertools
+import zoneinfo
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, NamedTuple
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from CinnamonSwirl import models, schedule
+from CinnamonSwirl.api import compact_json, login_json_required, utc_isoformat
+
+# How many occurrences an agenda shows unless asked for more, and the most it ever shows.
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 500
+
+
+class Occurrence(NamedTuple):
+    """
+    | One firing of a reminder. at is in UTC, like everything stored, and local is the same moment in the reminder's
+        timezone.
+    """
+    at: datetime
+    reminder: models.Reminder
+
+    @property
+    def local(self) -> datetime:
+        return self.at.replace(tzinfo=timezone.utc).astimezone(zoneinfo.ZoneInfo(self.reminder.timezone))
+
+
+def parse_utc(value: str | None) -> datetime | None:
+    """
+    | Reads a time from the query string. Times without an offset are taken to be UTC.
+    :raises ValueError: If the time is not ISO 8601
+
+    >>> parse_utc("2022-12-01T09:00:00-06:00")
+    datetime.datetime(2022, 12, 1, 15, 0)
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def read_window(request) -> tuple[datetime, datetime | None, int]:
+    """
+    | The start, end and limit of an agenda from ?start=, ?end= and ?limit=. start defaults to now, and there is no end
+        unless one is given.
+    :raises ValueError: If a time does not parse, limit is not a positive number, or end comes before start
+    """
+    start = parse_utc(request.GET.get('start')) or datetime.utcnow()
+    end = parse_utc(request.GET.get('end'))
+    limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    if limit < 1 or (end is not None and end < start):
+        raise ValueError("Not a valid window")
+    return start, end, limit
+
+
+def _tagged(reminder, start: datetime) -> Iterator[tuple]:
+    # Nothing before next_fire_at is still to come, so there is no need to look there.
+    after = max(start, reminder.next_fire_at)
+    for at in schedule.iter_occurrences(reminder, after):
+        yield at, reminder.pk, reminder  # pk breaks ties, so reminders are never compared
+
+
+def merge_occurrences(reminders: Iterable, start: datetime, end: datetime | None = None,
+                      limit: int = DEFAULT_LIMIT) -> list[Occurrence]:
+    """
+    | The next limit occurrences of all the reminders together, from start up to end, in order.
+    | Each reminder's schedule is a lazy generator and heapq.merge only ever holds the next occurrence of each, so the
+        work done is about limit steps plus one per reminder, however often the reminders fire. Schedules expanded in
+        local time are read a few hours ahead as well, to keep them in order across DST changes. See
+        schedule.in_order.
+    """
+    merged = heapq.merge(*(_tagged(reminder, start) for reminder in reminders if reminder.next_fire_at is not None))
+    if end is not None:
+        merged = itertools.takewhile(lambda item: item[0] <= end, merged)
+    return [Occurrence(at, reminder) for at, _, reminder in itertools.islice(merged, limit)]
+
+
+def upcoming(user_id, start: datetime, end: datetime | None = None, limit: int = DEFAULT_LIMIT) -> list[Occurrence]:
+    """
+    | The user's upcoming occurrences. Reminders that are finished, or whose next occurrence is past end, are not read.
+    """
+    reminders = models.Reminder.objects.filter(recipient=user_id, finished=False, next_fire_at__isnull=False)
+    if end is not None:
+        reminders = reminders.filter(next_fire_at__lte=end)
+    return merge_occurrences(reminders, start, end, limit)
+
+
+@require_http_methods(["GET"])
+@login_json_required
+def agenda(request):
+    """
+    | |login|
+    | Optional ?limit= (20 by default, up to 500), ?start= (now by default) and ?end=, as ISO 8601 times.
+    | |contains| JSON with the user's upcoming occurrences across all their reminders, in order. Each has the time in
+        the reminder's own timezone and in UTC.
+    """
+    try:
+        start, end, limit = read_window(request)
+    except ValueError:
+        return JsonResponse({'error': 'start, end or limit was not understood.'}, status=400)
+    return compact_json({'occurrences': [{'id': occurrence.reminder.pk, 'message': occurrence.reminder.message,
+                                          'timezone': occurrence.reminder.timezone,
+                                          'at': occurrence.local.isoformat(), 'at_utc': utc_isoformat(occurrence.at)}
+                                         for occurrence in upcoming(request.user.id, start, end, limit)]})
@@ -0,0 +1,347 @@
+import hashlib
+import hmac
+import json
+from datetime import datetime
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.shortcuts import reverse
+from django.utils.cache import patch_cache_control
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+
+from CinnamonSwirl import filters, forms, models, schedule, views
+from CinnamonSwirl.pagination import KeysetPaginator
+from CinnamonSwirl.auth import user_cache
+from CinnamonSwirl.fragments import reminder_fragments
+
+from App import settings
+
+# The most reminders one page of the reminders API returns.
+MAX_PAGE_SIZE = 500
+
+
+def utc_isoformat(value: datetime | None) -> str | None:
+    """
+    | Datetimes are stored as naive UTC. This marks them as UTC for API clients.
+
+    >>> utc_isoformat(datetime(2022, 12, 1, 15, 0))
+    '2022-12-01T15:00:00Z'
+    """
+    if value is None:
+        return None
+    return f"{value.isoformat()}Z"
+
+
+def read_json(request) -> dict:
+    """
+    | Reads a JSON object from the request body. An empty body is treated as an empty object.
+    :raises ValueError: If the body is not a JSON object
+    """
+    if not request.body:
+        return {}
+    body = json.loads(request.body)
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object.")
+    return body
+
+
+class JsonFields(dict):
+    """
+    | A JSON object that views.parse_reminder can read the same way as request.POST.
+
+    >>> JsonFields({"schedule_days": 0}).getlist("schedule_days")
+    [0]
+    """
+    def getlist(self, key, default=None):
+        value = self.get(key, default)
+        if value is None or isinstance(value, list):
+            return value
+        return [value]
+
+
+def compact_json(data, **kwargs) -> JsonResponse:
+    """
+    | A JsonResponse without the optional whitespace. Responses depend on the session, so they are only cached by the
+        client, which has to check back with the ETag before reusing them.
+    """
+    response = JsonResponse(data, json_dumps_params={'separators': (',', ':')}, **kwargs)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def login_json_required(view):
+    """
+    | The API's version of login_required: a 401 instead of a redirect to the login page.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Log in first.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def has_bot_token(request) -> bool:
+    """
+    | Whether the request carries DISPATCH_API_TOKEN as a bearer token. Never while that setting is empty.
+    """
+    expected = settings.DISPATCH_API_TOKEN
+    supplied = request.headers.get('Authorization', '')
+    return bool(expected) and hmac.compare_digest(supplied.encode(), f"Bearer {expected}".encode())
+
+
+def bot_token_required(view):
+    """
+    | Only lets requests through that carry DISPATCH_API_TOKEN as a bearer token. The dispatch API is switched off
+        entirely while that setting is empty.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not has_bot_token(request):
+            return JsonResponse({'error': 'A valid bot token is required.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class BotRecipient:
+    """
+    | Stands in for request.user when the bot calls the reminders API for a Discord user, who need not have logged in
+        to the site. Only id is read from it.
+    """
+    is_authenticated = True
+
+    def __init__(self, user_id: int):
+        self.id = self.pk = user_id
+
+
+def login_or_bot_json_required(view):
+    """
+    | login_json_required, or the bot token for clients without a session, such as the bot. A bot request must name
+        the user it acts for with ?recipient=, and sees and changes only that user's reminders.
+    | Requests with a session still go through the CSRF check, so the view itself can be csrf_exempt. A bot request
+        carries no cookies, so a page in someone's browser cannot make one.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if 'Authorization' in request.headers:
+            if not has_bot_token(request):
+                return JsonResponse({'error': 'A valid bot token is required.'}, status=401)
+            try:
+                recipient = int(request.GET['recipient'])
+            except (KeyError, ValueError):
+                return JsonResponse({'error': 'Name the user to act for with ?recipient=.'}, status=400)
+            request.user = BotRecipient(recipient)
+            return view(request, *args, **kwargs)
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Log in first.'}, status=401)
+        csrf = CsrfViewMiddleware(lambda _request: None)
+        rejected = csrf.process_view(request, None, (), {})
+        return rejected or view(request, *args, **kwargs)
+    return wrapper
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@bot_token_required
+def dispatch_claim(request):
+    """
+    | |requires| Bot token. Optional JSON body with limit and lease_seconds, up to DISPATCH_MAX_LEASE_SECONDS.
+    | |contains| JSON with the lease token, when it expires, and the claimed reminders.
+
+    Claims up to limit reminders that are due now. The claimed reminders will not be handed to any other caller until
+    the lease expires or they are acknowledged through dispatch_ack.
+    """
+    try:
+        body = read_json(request)
+        limit = min(int(body.get('limit', settings.DISPATCH_BATCH_SIZE)), settings.DISPATCH_MAX_BATCH_SIZE)
+        lease_seconds = int(body.get('lease_seconds', settings.DISPATCH_LEASE_SECONDS))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest()
+    if limit < 1 or not 1 <= lease_seconds <= settings.DISPATCH_MAX_LEASE_SECONDS:
+        return HttpResponseBadRequest()
+
+    now = datetime.utcnow()
+    token, reminders = models.Reminder.objects.lease_due(limit=limit, lease_seconds=lease_seconds, now=now)
+    return JsonResponse({
+        'lease': token,
+        'lease_expires': utc_isoformat(reminders[0].leased_until) if reminders else None,
+        'reminders': [{'id': reminder.pk, 'recipient': reminder.recipient, 'message': reminder.message,
+                       'timezone': reminder.timezone, 'fire_at': utc_isoformat(reminder.next_fire_at)}
+                      for reminder in reminders]
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@bot_token_required
+def dispatch_ack(request):
+    """
+    | |requires| Bot token. JSON body with lease, delivered (list of ids) and optionally failed (list of ids).
+    | |contains| JSON counts of advanced, finished and released reminders.
+
+    Delivered reminders move on to their next occurrence, or are finished when their schedule is exhausted. Failed
+    reminders are released so they can be claimed again straight away.
+    """
+    try:
+        body = read_json(request)
+        token = str(body['lease'])
+        delivered = [int(pk) for pk in body.get('delivered', [])]
+        failed = [int(pk) for pk in body.get('failed', [])]
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest()
+
+    result = models.Reminder.objects.acknowledge(token=token, delivered=delivered, failed=failed)
+    return JsonResponse(result)
+
+
+@require_http_methods(["GET"])
+@bot_token_required
+def cache_stats(request):
+    """
+    | |requires| Bot token.
+    | |contains| JSON hits, misses and hit_ratio of each cache in the process that answered.
+
+    The counters are per process and start over when it restarts.
+    """
+    return JsonResponse({'reminder_fragments': reminder_fragments.stats.as_dict(),
+                         'users': user_cache.stats.as_dict(),
+                         'rules': schedule.rule_cache.stats.as_dict()})
+
+
+# Reminders
+# The fields use the same names and formats as ReminderForm, in the reminder's own timezone, so a reminder read from
+# the API can be changed and sent straight back.
+
+def reminder_json(reminder: models.Reminder) -> dict:
+    change_timezone = forms.ReminderForm.change_timezone
+    start_date, start_time = change_timezone(time=reminder.dtstart, primary_timezone=reminder.timezone)
+    end_date, end_time = change_timezone(time=reminder.until, primary_timezone=reminder.timezone) \
+        if reminder.until else (None, None)
+    return {'id': reminder.pk, 'version': reminder.version, 'message': reminder.message,
+            'timezone': reminder.timezone, 'startDate': start_date, 'startTime': start_time,
+            'schedule_interval': reminder.interval, 'schedule_units': reminder.freq, 'count': reminder.count,
+            'schedule_days': schedule.from_mask(reminder.byweekday, "byweekday") or [],
+            'schedule_hours': schedule.from_mask(reminder.byhour, "byhour") or [],
+            'schedule_end_date': end_date, 'schedule_end_time': end_time, 'finished': reminder.finished,
+            'next_fire_at': utc_isoformat(reminder.next_fire_at)}
+
+
+def reminder_etag(reminder_id, version) -> str:
+    return f'"{reminder_id}-{version}"'
+
+
+def owned_reminders(request):
+    """
+    | The user's reminders, narrowed by RemindersFilter from the query string, such as ?finished=false.
+    """
+    return filters.RemindersFilter(request.GET, request=request, queryset=models.Reminder.objects.all()).qs
+
+
+def reminders_page(request, queryset):
+    """
+    | One page of queryset, by id. ?limit= sets the page size, up to MAX_PAGE_SIZE, and ?cursor= continues from the
+        previous page's next cursor.
+    :raises ValueError: If limit is not a positive number
+    """
+    limit = min(int(request.GET.get('limit', settings.REMINDERS_PAGE_SIZE)), MAX_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return KeysetPaginator(queryset=queryset, order_by='pk', page_size=limit).page(request.GET.get('cursor'))
+
+
+def reminders_list_etag(request):
+    """
+    | Hashes the id and version of every reminder on the requested page. Only those two columns are read, so a client
+        polling an unchanged list gets its 304 for one narrow query.
+    """
+    if not request.user.is_authenticated or request.method != 'GET':
+        return None
+    try:
+        page = reminders_page(request, owned_reminders(request).only('id', 'version'))
+    except ValueError:
+        return None
+    rows = ",".join(f"{row.pk}-{row.version}" for row in page.rows)
+    return f'"{hashlib.md5(f"{request.GET.urlencode()}|{rows}".encode()).hexdigest()}"'
+
+
+def reminder_detail_etag(request, reminder_id: int):
+    if not request.user.is_authenticated:
+        return None
+    version = models.Reminder.objects.filter(pk=reminder_id, recipient=request.user.id) \
+        .values_list('version', flat=True).first()
+    return None if version is None else reminder_etag(reminder_id, version)
+
+
+def save_reminder(request, reminder_id: int | None = None) -> JsonResponse:
+    """
+    | Creates or replaces a reminder from a JSON body, through the same validation as the reminder form.
+    """
+    try:
+        data = JsonFields(read_json(request))
+    except ValueError:
+        return JsonResponse({'error': 'Expected a JSON object.'}, status=400)
+    data['recipient'] = request.user.id
+    data['reminder_id'] = reminder_id
+    try:
+        reminder_id = views.parse_reminder(request, data=data)
+    except AssertionError:
+        return JsonResponse({'error': 'One or more required values were missing.'}, status=400)
+    except (ValueError, TypeError, ValidationError):
+        return JsonResponse({'error': 'One or more values were not understood.'}, status=400)
+    except PermissionError:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+
+    reminder = models.Reminder.objects.get(pk=reminder_id)
+    response = compact_json(reminder_json(reminder), status=200 if data['reminder_id'] else 201)
+    response['ETag'] = reminder_etag(reminder.pk, reminder.version)
+    response['Location'] = reverse('api_reminder', args=[reminder.pk])
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+@login_or_bot_json_required
+@condition(etag_func=reminders_list_etag)
+def reminders(request):
+    """
+    | |login| Or the bot token and ?recipient=.
+    | GET: Optional ?finished=, ?limit= and ?cursor=. |contains| JSON with a page of the user's reminders and the
+        cursor of the next page. Send the ETag back as If-None-Match to get a 304 when nothing on the page changed.
+    | POST: |requires| A JSON object with the reminder form's fields. |contains| The new reminder, with a 201.
+    """
+    if request.method == 'POST':
+        return save_reminder(request)
+    try:
+        page = reminders_page(request, owned_reminders(request))
+    except ValueError:
+        return HttpResponseBadRequest()
+    return compact_json({'reminders': [reminder_json(reminder) for reminder in page.rows],
+                         'next': page.next_cursor})
+
+
+@csrf_exempt
+@require_http_methods(["GET", "PUT", "DELETE"])
+@login_or_bot_json_required
+@condition(etag_func=reminder_detail_etag)
+def reminder(request, reminder_id: int):
+    """
+    | |login| Or the bot token and ?recipient=.
+    | GET: |contains| One of the user's reminders. Supports If-None-Match.
+    | PUT: |requires| A JSON object with all of the reminder form's fields. |contains| The replaced reminder.
+    | DELETE: Deletes the reminder, with a 204.
+    | PUT and DELETE honour If-Match, and answer 412 when the reminder changed since the client read it.
+    """
+    if request.method == 'PUT':
+        return save_reminder(request, reminder_id)
+    try:
+        instance = models.Reminder.objects.get(pk=reminder_id, recipient=request.user.id)
+    except models.Reminder.DoesNotExist:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+    if request.method == 'DELETE':
+        schedule.rule_cache.invalidate(instance.pk)
+        instance.delete()
+        return HttpResponse(status=204)
+    return compact_json(reminder_json(instance))
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CinnamonswirlConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'CinnamonSwirl'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import metrics, signals  # noqa: F401 Connects the receivers
+        connection_created.connect(metrics.install_query_timer, dispatch_uid="metrics_query_timer")
@@ -1,24 +1,105 @@
+import time
+
 from django.contrib.auth.backends import BaseBackend
+from django.core.cache import caches
 from django.core.exceptions import ObjectDoesNotExist
+from .caching import CacheStats, LRUCache, is_shared
 from .models import DiscordUser
+from App import settings
+
+
+class UserCache:
+    """
+    | Remembers resolved DiscordUsers so that authenticated requests do not each load the user from the database.
+    | Entries live in this process for ttl seconds. A change made through this worker drops its entry straight away,
+        but the other workers only see it once their own entry runs out.
+    | Setting alias to a CACHES alias shared by every worker makes invalidations reach all of them at once. Each user
+        then has a generation number there, and entries only count while it is unchanged. That costs a cache lookup
+        per request, which is still cheaper than the database.
+    | Only the column values are cached. Each lookup builds a fresh DiscordUser, so requests never share an instance.
+    """
+    def __init__(self, alias: str | None = None, ttl: float = 30, maxsize: int = 10000):
+        self.alias = alias
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.field_names = [field.attname for field in DiscordUser._meta.concrete_fields]
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.local.stats
+
+    @property
+    def shared(self) -> bool:
+        return self.alias is not None and is_shared(self.alias)
+
+    @staticmethod
+    def generation_key(user_id) -> str:
+        return f"discord_user:generation:{user_id}"
+
+    def generation(self, user_id) -> int | None:
+        if not self.shared:
+            return None
+        cache, key = caches[self.alias], self.generation_key(user_id)
+        generation = cache.get(key)
+        if generation is None:
+            # Started from the clock, so a generation that was evicted never comes back to one old entries hold.
+            generation = time.time_ns()
+            if not cache.add(key, generation, timeout=None):
+                generation = cache.get(key, generation)
+        return generation
+
+    def get(self, user_id, generation: int | None = None) -> DiscordUser | None:
+        """
+        | The cached user, or None. Pass the generation read before loading the user to set as well, so a user loaded
+            while another worker changed them is stored under the generation that is already out of date.
+        """
+        values = self.local.get(int(user_id), version=generation)
+        if values is None:
+            return None
+        return DiscordUser.from_db('default', self.field_names, values)
+
+    def set(self, user: DiscordUser, generation: int | None = None):
+        self.local.set(user.pk, tuple(getattr(user, name) for name in self.field_names), version=generation)
+
+    def invalidate(self, user_id):
+        self.local.invalidate(int(user_id))
+        if self.shared:
+            try:
+                caches[self.alias].incr(self.generation_key(user_id))
+            except ValueError:
+                pass  # No generation yet, so no worker has the user cached under one
+
+
+# Kept current by the DiscordUser post_save and post_delete receivers in signals.
+user_cache = UserCache(alias=settings.USER_CACHE_ALIAS, ttl=settings.USER_CACHE_TTL, maxsize=settings.USER_CACHE_SIZE)
 
 
 class DiscordAuthenticationBackend(BaseBackend):
     """
     | The standard django authentication backend tries to verify an account using their username, but in this case,
         we want to use their discord ID.
+    | get_user runs on every authenticated request, so resolved users are kept in user_cache.
     | See: https://docs.djangoproject.com/en/4.1/topics/auth/
     """
     def authenticate(self, request, user=None):
-        find_user = DiscordUser.objects.filter(id=user['id'])
-        if len(find_user) == 0:
-            new_user = DiscordUser.objects.create_user(user=user)
-            return new_user
-        else:
-            return find_user[0]
+        """
+        | Logs in the user described by Discord's OAuth2 user object, refreshing their profile on the way. New users
+            are only created while REGISTRATIONS_ENABLED is True.
+        """
+        if not user or 'id' not in user:
+            return None
+        discord_user = DiscordUser.objects.login_from_discord(user, create=settings.REGISTRATIONS_ENABLED)
+        if discord_user is not None:
+            user_cache.invalidate(discord_user.pk)  # The upsert does not send post_save
+        return discord_user
 
     def get_user(self, user_id):
+        generation = user_cache.generation(user_id)
+        cached = user_cache.get(user_id, generation)
+        if cached is not None:
+            return cached
         try:
-            return DiscordUser.objects.get(pk=user_id)
+            user = DiscordUser.objects.get(pk=user_id)
         except ObjectDoesNotExist:
             return None
+        user_cache.set(user, generation)
+        return user
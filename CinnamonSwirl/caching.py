@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_MISSING = object()
+
+
+def is_shared(alias: str) -> bool:
+    """
+    | Whether every worker process sees the same entries in the cache called alias, so an entry one worker drops is
+        gone for all of them. Memory local to the process is not shared, and a dummy cache keeps nothing to share.
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+class CacheStats:
+    """
+    | Hit and miss counters for an in-process cache.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        | Share of lookups that were hits, 0.0 before the first lookup.
+
+        >>> stats = CacheStats()
+        >>> stats.hits, stats.misses = 3, 1
+        >>> stats.hit_ratio
+        0.75
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hit_ratio}
+
+
+class LRUCache:
+    """
+    | A bounded, thread safe, least recently used cache for one process.
+    | Entries can carry a version, such as a row version. Looking an entry up with a different version counts as a
+        miss and drops the stale entry. With a ttl in seconds, entries older than that are misses too.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set("a", 1, version=1)
+    >>> cache.get("a", version=1), cache.get("a", version=2)
+    (1, None)
+    """
+    def __init__(self, maxsize: int, ttl: float | None = None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, version=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, entry_version, expires = entry
+                if entry_version == version and (expires is None or expires > self.clock()):
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return value
+                del self._entries[key]
+            self.stats.misses += 1
+            return default
+
+    def set(self, key, value, version=None):
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, version, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,20 @@
+"""
+| Django's MySQL backend, with its connections borrowed from a ConnectionPool. Set ENGINE to CinnamonSwirl.db.mysql.
+"""
+from django.db.backends.mysql import base
+
+from CinnamonSwirl.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    @classmethod
+    def validate_connection(cls, connection) -> bool:
+        """
+        | A ping is a round trip to the server without running a query. It does not reconnect, since a connection
+            that reconnects on its own would lose its session settings.
+        """
+        try:
+            connection.ping()
+        except base.Database.Error:
+            return False
+        return True
@@ -0,0 +1,229 @@
+import collections
+import os
+import threading
+import time
+import weakref
+
+from CinnamonSwirl import metrics
+
+
+class PoolTimeout(Exception):
+    """
+    | No connection came free within the pool's timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    | Database connections for one alias, shared by every thread of the process. At most size connections are open at
+        once. A thread that wants one when they are all in use waits up to timeout seconds for another thread to give
+        one back.
+    | Connections are checked with validate as they are handed out, and ones older than max_age seconds are closed
+        instead, so a connection the server dropped is replaced rather than failing a request. The most recently
+        returned connection is handed out first, so a quiet period lets the rest go past max_age and close.
+    | validate returns whether a connection still works. It is given by the backend, as is how to open one.
+    """
+    def __init__(self, alias: str, validate, size: int = 10, timeout: float = 10, max_age: float = 600,
+                 clock=time.monotonic):
+        self.alias = alias
+        self.validate = validate
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.clock = clock
+        self.idle = collections.deque()  # (connection, opened at), most recently returned last
+        self.opened_at = {}  # Of the connections handed out, by id
+        self.open = 0  # Including the ones being opened
+        self.condition = threading.Condition()
+        self.stats = collections.Counter()
+
+    @property
+    def in_use(self) -> int:
+        return self.open - len(self.idle)
+
+    def acquire(self, connect):
+        """
+        | A connection for the calling thread to use until it calls release. connect is called to open one if none
+            are idle and fewer than size are open.
+        :raises PoolTimeout: If none came free within timeout
+        """
+        start = self.clock()
+        with self.condition:
+            while not self.idle and self.open >= self.size:
+                remaining = start + self.timeout - self.clock()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    metrics.observe(metrics.POOL_WAIT, self.clock() - start, alias=self.alias, outcome="timeout")
+                    raise PoolTimeout(f"No connection to {self.alias} came free within {self.timeout} seconds; all "
+                                      f"{self.size} are in use")
+                self.condition.wait(remaining)
+            connection, opened_at = self.idle.pop() if self.idle else (None, None)
+            if connection is None:
+                self.open += 1  # Taken now so no other thread opens one past size meanwhile
+        metrics.observe(metrics.POOL_WAIT, self.clock() - start, alias=self.alias, outcome="ok")
+
+        if connection is not None:
+            reason = "expired" if self.clock() - opened_at >= self.max_age else \
+                None if self.validate(connection) else "invalid"
+            if reason:
+                self.discard(connection, reason, counted=False)
+                connection = None
+        if connection is None:
+            try:
+                connection, opened_at = connect(), self.clock()
+            except BaseException:
+                with self.condition:
+                    self.open -= 1
+                    self.condition.notify()
+                raise
+            self.stats['opened'] += 1
+            metrics.increment(metrics.POOL_OPENED, alias=self.alias)
+        with self.condition:
+            self.opened_at[id(connection)] = opened_at
+            self.stats['acquired'] += 1
+        self.report()
+        return connection
+
+    def release(self, connection, reusable: bool = True):
+        """
+        | Gives back a connection from acquire. It is closed instead of kept if it is not reusable, such as when it
+            could not be rolled back, or it is past max_age.
+        """
+        with self.condition:
+            opened_at = self.opened_at.pop(id(connection), None)
+            if opened_at is None:
+                return  # Not one of ours, or already given back
+            keep = reusable and self.clock() - opened_at < self.max_age
+            if keep:
+                self.idle.append((connection, opened_at))
+                self.condition.notify()
+        if not keep:
+            self.discard(connection, "broken" if not reusable else "expired")
+            return
+        self.report()
+
+    def discard(self, connection, reason: str, counted: bool = True):
+        """
+        | Closes a connection for good. counted is whether it still counts towards open, which it does unless it was
+            taken from idle by acquire, which has already taken its place.
+        """
+        self.stats[f'discarded_{reason}'] += 1
+        metrics.increment(metrics.POOL_DISCARDED, alias=self.alias, reason=reason)
+        try:
+            connection.close()
+        except Exception:
+            pass  # It is being thrown away because it does not work
+        if counted:
+            with self.condition:
+                self.open -= 1
+                self.condition.notify()
+            self.report()
+
+    def close_idle(self):
+        """
+        | Closes every connection nobody is using.
+        """
+        with self.condition:
+            idle, self.idle = list(self.idle), collections.deque()
+            self.open -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self.report()
+
+    def report(self):
+        metrics.set_gauge(metrics.POOL_CONNECTIONS, self.in_use, alias=self.alias, state="in_use")
+        metrics.set_gauge(metrics.POOL_CONNECTIONS, len(self.idle), alias=self.alias, state="idle")
+
+    def status(self) -> dict:
+        """
+        | How many connections the pool has and what has happened to them, for tests and debugging.
+        """
+        return dict(self.stats, size=self.size, open=self.open, in_use=self.in_use, idle=len(self.idle))
+
+
+# One pool per alias in each process.
+pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, **options) -> ConnectionPool:
+    pool = pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = pools.get(alias)
+            if pool is None:
+                pool = pools[alias] = ConnectionPool(alias, **options)
+    return pool
+
+
+def forget_pools():
+    """
+    | A forked process must not use its parent's connections, so it starts with no pools. The parent's connections
+        are left alone rather than closed, since closing one could end the parent's session on the server too.
+    """
+    orphaned.extend(pools.values())
+    pools.clear()
+
+
+orphaned = []  # Pools inherited from the parent, kept referenced so their connections are never closed from here
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_pools)
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    | Makes a Django database backend borrow its connection from the alias's ConnectionPool instead of opening one,
+        and give it back instead of closing it. Each thread still has its own DatabaseWrapper, as Django expects, but
+        only while it has a connection checked out, so with CONN_MAX_AGE at 0 the number of connections follows the
+        pool's size rather than the number of threads.
+    | Configured by POOL in the alias's DATABASES entry: SIZE, TIMEOUT and MAX_AGE, all optional.
+    | A connection is rolled back before it goes back, so no transaction is carried over to the next borrower. If the
+        thread goes away without closing it, the connection is closed when the wrapper is garbage collected.
+    """
+    validation_query = "SELECT 1"  # Run on each connection as it is borrowed
+
+    @property
+    def pool(self) -> ConnectionPool:
+        options = self.settings_dict.get('POOL', {})
+        # The pool outlives this wrapper, so it is given nothing that refers to it
+        return get_pool(self.alias, validate=type(self).validate_connection, size=options.get('SIZE', 10),
+                        timeout=options.get('TIMEOUT', 10), max_age=options.get('MAX_AGE', 600))
+
+    @classmethod
+    def validate_connection(cls, connection) -> bool:
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(cls.validation_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.pool.acquire(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(
+                conn_params))
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error  # Raised by Django as OperationalError
+        self._pool_finalizer = weakref.finalize(self, self.pool.release, connection, False)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        finalizer = getattr(self, "_pool_finalizer", None)
+        if finalizer is not None:
+            finalizer.detach()
+        try:
+            self.connection.rollback()
+            reusable = True
+        except Exception:
+            reusable = False
+        self.pool.release(self.connection, reusable)
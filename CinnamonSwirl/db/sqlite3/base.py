@@ -0,0 +1,10 @@
+"""
+| Django's SQLite backend, with its connections borrowed from a ConnectionPool. Set ENGINE to CinnamonSwirl.db.sqlite3.
+"""
+from django.db.backends.sqlite3 import base
+
+from CinnamonSwirl.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
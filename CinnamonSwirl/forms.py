@@ -4,8 +4,85 @@ from crispy_forms.layout import Submit, Layout, Field, Fieldset, HTML
 from django.urls import reverse
 from datetime import datetime
 from typing import Tuple
-from zoneinfo import ZoneInfo
 from App import settings
+from CinnamonSwirl import schedule, zones
+
+SUPPORTED_TIMEZONES = ("US/Eastern", "US/Central", "US/Mountain", "US/Pacific")
+
+# Choices that never change are built once per process. Django copies them into each form's fields.
+DAY_CHOICES = ((5, "Saturday"), (4, "Friday"), (3, "Thursday"), (2, "Wednesday"), (1, "Tuesday"), (0, "Monday"),
+               (6, "Sunday"))
+INTERVAL_CHOICES = tuple((i, i) for i in range(1, 101))
+HOUR_CHOICES = tuple((i, i) for i in range(0, 24))
+COUNT_CHOICES = ((None, "Forever"),) + tuple((i, i) for i in range(1, 51))
+
+# The timezone choices show the current time in each zone, to the minute. They are rebuilt at most once a minute.
+_timezone_choices = (None, [])
+
+
+def timezone_choices(now: datetime | None = None) -> list:
+    """
+    | The timezone options for ReminderForm, labelled with the current time in each zone. The labels only show hours
+        and minutes, so the list is built once and reused until the minute changes.
+    """
+    global _timezone_choices
+    minute = (now or datetime.utcnow()).replace(second=0, microsecond=0)
+    built_for, choices = _timezone_choices
+    if built_for != minute:
+        choices = []
+        for timezone in SUPPORTED_TIMEZONES:
+            _date, _time = ReminderForm.change_timezone(time=minute, primary_timezone=timezone)
+            choices.append((timezone, f"{timezone} ({_time})"))
+        _timezone_choices = (minute, choices)
+    return choices
+
+
+_reminder_form_helper = None
+
+
+def reminder_form_helper() -> FormHelper:
+    """
+    | The FormHelper for ReminderForm. It is the same for every form, so it is built on first use and then shared.
+        Nothing may change it after that.
+    """
+    global _reminder_form_helper
+    if _reminder_form_helper is None:
+        helper = FormHelper()
+        helper.form_id = 'reminder_form'
+        helper.form_class = 'reminder_form_class'
+        helper.form_method = 'post'
+        helper.form_action = reverse('reminder')
+        helper.layout = Layout(
+            Fieldset("When do you want this reminder to start?",
+                     Field("startDate"),
+                     Field("startTime"),
+                     Field("timezone")
+                     ),
+            Fieldset("What do you want it to say?",
+                     Field("message"),
+                     Field("recipient_friendly"),
+                     Field("recipient"),
+                     Field("reminder_id")
+                     ),
+            Fieldset("Set up a schedule for this reminder:",
+                     Field("schedule_interval"),
+                     Field("schedule_units"),
+                     Field("count"),
+                     Fieldset("Reoccur on specific days of the week:",
+                              Field("schedule_days"),
+                              ),
+                     Fieldset("Reoccur on specific hours:",
+                              Field("schedule_hours")
+                              ),
+                     Fieldset("Stop on this date:",
+                              Field("schedule_end_date"),
+                              Field("schedule_end_time")
+                              )
+                     )
+        )
+        helper.add_input(Submit('submit', 'Submit'))
+        _reminder_form_helper = helper
+    return _reminder_form_helper
 
 
 class ReminderForm(forms.Form):
@@ -46,45 +123,13 @@ class ReminderForm(forms.Form):
         self.request = request
         self.reminder = reminder
         self.timezone = request.session.get('timezone')
-        self.helper = FormHelper()  # Required!!! Will not render in the template without it!!!
-        self.helper.form_id = 'reminder_form'
-        self.helper.form_class = 'reminder_form_class'
-        self.helper.form_method = 'post'
-        self.helper.layout = Layout(
-            Fieldset("When do you want this reminder to start?",
-                     Field("startDate"),
-                     Field("startTime"),
-                     Field("timezone")
-                     ),
-            Fieldset("What do you want it to say?",
-                     Field("message"),
-                     Field("recipient_friendly"),
-                     Field("recipient"),
-                     Field("reminder_id")
-                     ),
-            Fieldset("Set up a schedule for this reminder:",
-                     Field("schedule_interval"),
-                     Field("schedule_units"),
-                     Field("count"),
-                     Fieldset("Reoccur on specific days of the week:",
-                              Field("schedule_days"),
-                              ),
-                     Fieldset("Reoccur on specific hours:",
-                              Field("schedule_hours")
-                              ),
-                     Fieldset("Stop on this date:",
-                              Field("schedule_end_date"),
-                              Field("schedule_end_time")
-                              )
-                     )
-        )
+        self.helper = reminder_form_helper()  # Required!!! Will not render in the template without it!!!
 
         self.fields['timezone'].choices = self.timezones
-        self.fields['schedule_days'].choices = self.days
-        self.fields['schedule_interval'].choices = self.intervals(1, 101)
-        self.fields['schedule_hours'].choices = self.intervals(0, 24)
-        self.fields['count'].choices = self.intervals(1, 51)
-        self.fields['count'].choices.insert(0, (None, "Forever"))
+        self.fields['schedule_days'].choices = DAY_CHOICES
+        self.fields['schedule_interval'].choices = INTERVAL_CHOICES
+        self.fields['schedule_hours'].choices = HOUR_CHOICES
+        self.fields['count'].choices = COUNT_CHOICES
 
         session_timezone = self.request.session.get("timezone", None)
 
@@ -96,8 +141,6 @@ class ReminderForm(forms.Form):
                                     timezone=self.read_timezone(reminder.timezone), recipient=reminder.recipient,
                                     reminder_id=reminder.id, recipient_friendly=self.request.user.discord_tag)
 
-            self.helper.form_action = reverse('reminder')
-
             if reminder.byweekday or reminder.byhour or reminder.until or reminder.count:
                 if reminder.until:
                     _date, _time = self.change_timezone(time=reminder.until,
@@ -106,12 +149,11 @@ class ReminderForm(forms.Form):
                     self.set_initial_values(schedule_end_date=_date, schedule_end_time=_time)
 
                 if reminder.byweekday:
-                    self.set_initial_values(schedule_days=self.read_str_as_list(reminder.byweekday))
+                    self.set_initial_values(schedule_days=schedule.from_mask(reminder.byweekday, "byweekday"))
 
                 if reminder.byhour:
-                    hours = self.read_str_as_list(reminder.byhour)
-                    self.set_initial_values(schedule_hours=self.change_hours_from_utc(
-                                                hours, session_timezone, reminder.timezone))
+                    # Hours are kept in the reminder's own timezone, which is the one the form has selected.
+                    self.set_initial_values(schedule_hours=schedule.from_mask(reminder.byhour, "byhour"))
 
                 self.set_initial_values(count=getattr(reminder, 'count', None))
 
@@ -120,9 +162,6 @@ class ReminderForm(forms.Form):
             self.set_initial_values(recipient=self.request.user.id, recipient_friendly=self.request.user.discord_tag,
                                     timezone=self.read_timezone(session_timezone),
                                     reminder_id=request.GET.get('id'))
-            self.helper.form_action = reverse('reminder')
-
-        self.helper.add_input(Submit('submit', 'Submit'))
 
     def set_initial_values(self, **kwargs):
         """
@@ -138,13 +177,7 @@ class ReminderForm(forms.Form):
         | A list of tuples representing timezone options for use in the form.
             Note the first value in each tuple is what django sees. The second is what the user sees.
         """
-        supported_timezones = ("US/Eastern", "US/Central", "US/Mountain", "US/Pacific")
-        result = []
-        for timezone in supported_timezones:
-            _date, _time = self.change_timezone(time=datetime.utcnow(),
-                                                primary_timezone=timezone)
-            result.append((timezone, f"{timezone} ({_time})"))
-        return result
+        return timezone_choices()
 
     @property
     def timezones_as_dict(self) -> dict:
@@ -162,8 +195,7 @@ class ReminderForm(forms.Form):
         | A list of tuples representing day options for use in the form.
             Note the first value in each tuple is what django sees. The second is what the user sees.
         """
-        return [(5, "Saturday"), (4, "Friday"), (3, "Thursday"), (2, "Wednesday"), (1, "Tuesday"), (0, "Monday"),
-                (6, "Sunday")]
+        return list(DAY_CHOICES)
 
     @staticmethod
     def intervals(start: int, stop: int) -> list:
@@ -186,21 +218,6 @@ class ReminderForm(forms.Form):
         except KeyError:
             return None
 
-    @staticmethod
-    def read_str_as_list(string: str) -> list:
-        """
-        | Cleans an incoming string of comma-separated values, usually a list stored as str in the DB, to a list of
-            ints
-        """
-        dirty = string.replace("[", '').replace("]", '').split(',')
-        clean = []
-        for item in dirty:
-            try:
-                clean.append(int(item))
-            except ValueError:
-                clean.append(item)
-        return clean
-
     @staticmethod
     def change_timezone(time: datetime, primary_timezone: str | None,
                         fallback_timezone: str | None = None) -> Tuple[str, str]:
@@ -208,42 +225,11 @@ class ReminderForm(forms.Form):
         | Attempts to change the supplied datetime from UTC to the supplied primary timezone. A fallback timezone can be
             provided. Leaves the timezone in UTC if both timezones are None.
         """
-        utc = ZoneInfo("UTC")
-        time_in_utc = time.replace(tzinfo=utc)
-
-        if primary_timezone is not None:
-            local = ZoneInfo(primary_timezone)
-
-        elif fallback_timezone is not None:
-            local = ZoneInfo(fallback_timezone)
-
-        else:
-            local = ZoneInfo("UTC")
-
-        time_in_local = time_in_utc.astimezone(tz=local)
-        response = time_in_local.replace(tzinfo=None)
+        timezone = primary_timezone or fallback_timezone
+        response = time if timezone is None else zones.to_local(timezone, time)
         # Why the split? Because we have no datetime widget for both date and time, we have to split it into two.
         return response.strftime('%Y-%m-%d'), response.strftime('%H:%M')
 
-    @staticmethod
-    def change_hours_from_utc(hours: list, primary_timezone: str | None, fallback_timezone: str | None = None) -> list:
-        """
-        | Grabs the offset versus UTC from the supplied timezone(s) and adds that offset to an incoming value from the
-            DB to properly show the user what hours they selected. The inverse, subtracting the offset, is done
-            when saving in the view.
-        """
-        if primary_timezone is not None:
-            timezone = primary_timezone
-        else:
-            timezone = fallback_timezone
-
-        offset = int(datetime.utcnow().astimezone(ZoneInfo(timezone)).strftime('%z')[:3])
-        result = []
-        for hour in hours:
-            result.append(int(hour) + offset)
-
-        return result
-
 
 class DeleteConfirmationForm(forms.Form):
     """
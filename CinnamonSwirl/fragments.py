@@ -0,0 +1,91 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .caching import CacheStats, is_shared
+from App import settings
+
+
+class FragmentCache:
+    """
+    | Caches rendered pieces of a page per user. Every user has a generation number, and each fragment is stored
+        under the generation it was rendered in. Invalidating a user moves their generation on, so every fragment
+        they had, for every page, sort and filter, is missed at once without having to know the keys.
+    | Generations live in the same cache as the fragments. A generation that was evicted starts again from the clock
+        rather than from zero, so it can never come back around to a value that old fragments were stored under.
+    | While the alias is local to each process, fragments are only kept for local_ttl seconds. Invalidating only
+        moves on the generation of the worker that made the change, so that bounds how long the others serve what
+        they had. Point CACHE_BACKEND at a shared cache to keep them for ttl.
+    """
+    def __init__(self, prefix: str, alias: str = 'default', ttl: int = 60, local_ttl: int = 5):
+        self.prefix = prefix
+        self.alias = alias
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.stats = CacheStats()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def timeout(self) -> int:
+        return self.ttl if is_shared(self.alias) else self.local_ttl
+
+    def generation_key(self, user_id) -> str:
+        return f"{self.prefix}:generation:{user_id}"
+
+    def generation(self, user_id) -> int:
+        key = self.generation_key(user_id)
+        generation = self.cache.get(key)
+        if generation is None:
+            generation = time.time_ns()
+            if not self.cache.add(key, generation, timeout=None):
+                generation = self.cache.get(key, generation)
+        return generation
+
+    def key(self, user_id, variant: str, generation: int | None = None) -> str:
+        """
+        | The cache key of one fragment. variant tells apart the renderings of the same user and generation, such as
+            the page's query string.
+        | Pass the generation read before rendering to get and set, so a fragment rendered while the user's reminders
+            changed is stored under the generation it was rendered from, and never served.
+        """
+        if generation is None:
+            generation = self.generation(user_id)
+        digest = hashlib.md5(variant.encode()).hexdigest()
+        return f"{self.prefix}:{user_id}:{generation}:{digest}"
+
+    def get(self, user_id, variant: str, generation: int | None = None):
+        value = self.cache.get(self.key(user_id, variant, generation))
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    def set(self, user_id, variant: str, value, generation: int | None = None):
+        self.cache.set(self.key(user_id, variant, generation), value, timeout=self.timeout)
+
+    def invalidate(self, user_id):
+        """
+        | Drops every fragment of the user. Inside a transaction this happens again once it commits, so a page rendered
+            from the old rows while the transaction was open is not kept either.
+        """
+        self._bump(user_id)
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._bump(user_id))
+
+    def _bump(self, user_id):
+        try:
+            self.cache.incr(self.generation_key(user_id))
+        except ValueError:
+            pass  # No generation yet, so there is nothing cached to drop
+
+
+# Everything rendered from a user's reminders: the home page's table and the calendar feed. Kept current by the
+# Reminder receivers in signals and by the bulk updates that bypass them.
+reminder_fragments = FragmentCache(prefix="reminders", alias=settings.TABLE_CACHE_ALIAS, ttl=settings.TABLE_CACHE_TTL,
+                                   local_ttl=settings.TABLE_CACHE_LOCAL_TTL)
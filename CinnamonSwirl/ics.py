@@ -0,0 +1,330 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, Iterator
+from zoneinfo import ZoneInfo
+
+from django.core import signing
+from django.http import Http404, StreamingHttpResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.timezone import now
+from django.views.decorators.http import require_http_methods
+
+from CinnamonSwirl import models, schedule, zones
+from CinnamonSwirl.caching import LRUCache
+from CinnamonSwirl.fragments import reminder_fragments
+
+from App import settings
+
+CONTENT_TYPE = "text/calendar; charset=utf-8"
+PRODID = "-//CinnamonSwirl//Reminders//EN"
+TOKEN_SALT = "CinnamonSwirl.ics.feed"
+
+# Goes up whenever the feed's output changes, so feeds cached and ETags handed out by older code are not reused.
+FEED_FORMAT = 5
+FEED_VARIANT = f"calendar.ics/{FEED_FORMAT}"
+
+# Reminders whose events are missing from event_cache are read this many at a time.
+CHUNK_SIZE = 500
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# The by* fields of a Reminder and the RRULE parts they are written as, in the order RFC 5545 lists them.
+RULE_PARTS = (("bymonth", "BYMONTH"), ("byweekno", "BYWEEKNO"), ("byyearday", "BYYEARDAY"),
+              ("bymonthday", "BYMONTHDAY"), ("byweekday", "BYDAY"), ("byhour", "BYHOUR"), ("byminute", "BYMINUTE"),
+              ("bysecond", "BYSECOND"), ("bysetpos", "BYSETPOS"))
+
+
+def feed_token(user) -> str:
+    """
+    | The secret part of a DiscordUser's feed URL: their id and feed_secret, signed with SECRET_KEY. A new
+        feed_secret, from rotate_feed_secret, revokes every token handed out before, as does changing SECRET_KEY.
+        Users who delete their data and come back get a new feed_secret too.
+    """
+    return signing.Signer(salt=TOKEN_SALT).sign(f"{user.pk}:{user.feed_secret}")
+
+
+def read_token(token: str) -> tuple | None:
+    """
+    | The user id and feed secret a feed token was made with, or None if it was not made by feed_token. Whether the
+        secret is still the user's is up to the caller.
+
+    >>> read_token(feed_token(models.DiscordUser(id=42, feed_secret="abc")))
+    (42, 'abc')
+    >>> read_token("42:abc:forged") is None
+    True
+    """
+    try:
+        user_id, secret = signing.Signer(salt=TOKEN_SALT).unsign(token).split(":", 1)
+        return int(user_id), secret
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def rotate_feed_secret(user):
+    """
+    | Gives the user a new feed_secret, so their old feed URL stops working, and drops the feed cached for the old
+        one.
+    """
+    user.feed_secret = models.new_feed_secret()
+    user.feed_changed_at = now()
+    user.save(update_fields=['feed_secret', 'feed_changed_at'])
+    reminder_fragments.invalidate(user.pk)
+
+
+def escape_text(value: str) -> str:
+    r"""
+    | Escapes a TEXT value such as SUMMARY.
+
+    >>> escape_text("Water the plants; then, rest\nplease")
+    'Water the plants\\; then\\, rest\\nplease'
+    """
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line: str) -> str:
+    r"""
+    | Ends a content line with CRLF, folding it onto continuation lines so none is longer than 75 octets. Multibyte
+        characters are never split.
+
+    >>> fold("SUMMARY:" + "x" * 70)
+    'SUMMARY:xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx\r\n xxx\r\n'
+    """
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return f"{line}\r\n"
+    parts = []
+    start, limit = 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1  # Back off to the first byte of the character
+        parts.append(encoded[start:end].decode())
+        start, limit = end, 74  # The leading space of a continuation line counts too
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def format_utc(value: datetime) -> str:
+    """
+    >>> format_utc(datetime(2022, 12, 1, 15, 0, 30))
+    '20221201T150030Z'
+    """
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def format_start(reminder) -> str:
+    """
+    | DTSTART with its parameters. Rules expanded in the reminder's timezone, see schedule.local_zone, have their
+        start written as wall clock time there, so calendar apps expand them across DST changes the same way the
+        scheduler does.
+
+    >>> format_start(models.Reminder(freq="DAILY", dtstart=datetime(2022, 12, 1, 15), timezone="US/Central"))
+    'DTSTART;TZID=US/Central:20221201T090000'
+    >>> format_start(models.Reminder(freq="HOURLY", dtstart=datetime(2022, 12, 1, 15), timezone="US/Central"))
+    'DTSTART:20221201T150000Z'
+    """
+    zone = schedule.local_zone(reminder)
+    if zone is None:
+        return f"DTSTART:{format_utc(reminder.dtstart)}"
+    return f"DTSTART;TZID={zone}:{schedule.rule_start(reminder).strftime('%Y%m%dT%H%M%S')}"
+
+
+def format_offset(offset: timedelta) -> str:
+    """
+    >>> format_offset(timedelta(hours=-6)), format_offset(timedelta(hours=5, minutes=30))
+    ('-0600', '+0530')
+    """
+    seconds = int(offset.total_seconds())
+    hours, seconds = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{'-' if offset < timedelta(0) else '+'}{hours:02}{minutes:02}{f'{seconds:02}' if seconds else ''}"
+
+
+@lru_cache(maxsize=64)
+def render_timezone(name: str) -> str:
+    """
+    | The VTIMEZONE that a TZID written by format_start refers to, as RFC 5545 requires one for each. Built from the
+        zone's transitions in zones, so calendar apps change the offset at the same instants the scheduler does.
+    | Changes between the same two offsets are one STANDARD or DAYLIGHT component with an RDATE for each, written in
+        the wall clock time from before the change. The first covers the offset the table starts with.
+    """
+    zone = ZoneInfo(name)
+    table = zones.transitions(name)
+    components = {}
+    before = table.offsets[0]
+    for instant, offset in zip(table.instants, table.offsets):
+        moment = instant.replace(tzinfo=timezone.utc).astimezone(zone)
+        key = ("DAYLIGHT" if moment.dst() else "STANDARD", before, offset, moment.tzname())
+        components.setdefault(key, []).append((instant + before).strftime('%Y%m%dT%H%M%S'))
+        before = offset
+    lines = ["BEGIN:VTIMEZONE", f"TZID:{name}"]
+    for (kind, before, offset, abbreviation), starts in components.items():
+        lines += [f"BEGIN:{kind}", f"DTSTART:{starts[0]}"]
+        if len(starts) > 1:
+            lines.append(f"RDATE:{','.join(starts[1:])}")
+        lines += [f"TZOFFSETFROM:{format_offset(before)}", f"TZOFFSETTO:{format_offset(offset)}"]
+        if abbreviation:
+            lines.append(f"TZNAME:{escape_text(abbreviation)}")
+        lines.append(f"END:{kind}")
+    lines.append("END:VTIMEZONE")
+    return "".join(fold(line) for line in lines)
+
+
+def rrule_value(reminder) -> str:
+    """
+    | A Reminder's schedule as the value of an RRULE, meant to go with the DTSTART of format_start. UNTIL is always in
+        UTC.
+
+    >>> reminder = models.Reminder(freq="WEEKLY", interval=2, dtstart=datetime(2022, 12, 1, 15), byweekday=21, count=5)
+    >>> rrule_value(reminder)
+    'FREQ=WEEKLY;INTERVAL=2;COUNT=5;BYDAY=MO,WE,FR'
+    """
+    freq, dtstart, interval, wkst, count, until = schedule.rule_key(reminder)[:6]
+    parts = [f"FREQ={freq}"]
+    if interval != 1:
+        parts.append(f"INTERVAL={interval}")
+    if until:
+        parts.append(f"UNTIL={format_utc(reminder.until)}")
+    elif count:
+        parts.append(f"COUNT={count}")
+    for field, name in RULE_PARTS:
+        values = schedule.read_by_field(reminder, field)
+        if values is None:
+            continue
+        if field == "byweekday":
+            values = [WEEKDAYS[value] for value in values]
+        parts.append(f"{name}={','.join(str(value) for value in values)}")
+    if wkst is not None:
+        parts.append(f"WKST={WEEKDAYS[wkst]}")
+    return ";".join(parts)
+
+
+def render_event(reminder) -> str:
+    """
+    | One reminder as a VEVENT with an alarm at each occurrence. DTSTAMP is the start rather than the time of
+        rendering, so every worker renders the same bytes for the same version of a reminder.
+    """
+    summary = escape_text(reminder.message)
+    return "".join(fold(line) for line in (
+        "BEGIN:VEVENT",
+        f"UID:reminder-{reminder.pk}@cinnamonswirl",
+        f"DTSTAMP:{format_utc(reminder.dtstart)}",
+        format_start(reminder),
+        f"RRULE:{rrule_value(reminder)}",
+        f"SUMMARY:{summary}",
+        "BEGIN:VALARM",
+        "ACTION:DISPLAY",
+        f"DESCRIPTION:{summary}",
+        "TRIGGER:PT0S",
+        "END:VALARM",
+        "END:VEVENT"))
+
+
+# Rendered events of saved reminders, by primary key and checked against Reminder.version.
+event_cache = LRUCache(maxsize=settings.RULE_CACHE_SIZE)
+
+
+def feed_versions(user_id) -> tuple[list, datetime | None]:
+    """
+    | (id, version) of each of the user's reminders, in id order, and the newest changed_at among them. Read from
+        three columns only.
+    """
+    rows = models.Reminder.objects.filter(recipient=user_id).order_by('pk').values_list('pk', 'version', 'changed_at')
+    return [(pk, version) for pk, version, _ in rows], max((row[2] for row in rows), default=None)
+
+
+def feed_etag(versions: Iterable) -> str:
+    rows = ",".join(f"{pk}-{version}" for pk, version in versions)
+    return f'"{hashlib.md5(f"{FEED_FORMAT}|{rows}".encode()).hexdigest()}"'
+
+
+def feed_zones(user_id) -> list:
+    """
+    | The timezones the user's events are written in, each of which needs a VTIMEZONE. Read from the columns that
+        decide it only.
+    """
+    rules = models.Reminder.objects.filter(recipient=user_id).values_list('timezone', 'freq', 'byhour').distinct()
+    return sorted({zone for zone in (schedule.local_zone(models.Reminder(timezone=name, freq=freq, byhour=byhour))
+                                     for name, freq, byhour in rules) if zone is not None})
+
+
+def render_feed(user_id, versions: list) -> Iterator[str]:
+    """
+    | Yields the user's calendar a chunk at a time. Events come from event_cache where the version still matches, so
+        only reminders that changed since the last feed are read in full and rendered again.
+    """
+    yield "".join(fold(line) for line in ("BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN",
+                                          "METHOD:PUBLISH", "X-WR-CALNAME:CinnamonSwirl reminders"))
+    yield "".join(render_timezone(zone) for zone in feed_zones(user_id))
+    for offset in range(0, len(versions), CHUNK_SIZE):
+        chunk = versions[offset:offset + CHUNK_SIZE]
+        events = {pk: event_cache.get(pk, version=version) for pk, version in chunk}
+        missing = [pk for pk, event in events.items() if event is None]
+        if missing:
+            for reminder in models.Reminder.objects.filter(pk__in=missing, recipient=user_id):
+                event = render_event(reminder)
+                event_cache.set(reminder.pk, event, version=reminder.version)
+                events[reminder.pk] = event
+        yield "".join(event for event in events.values() if event is not None)  # None if deleted since
+    yield fold("END:VCALENDAR")
+
+
+def cached_feed(user_id, secret: str, versions: list, generation: int, etag: str,
+                last_modified: float) -> Iterator[str]:
+    """
+    | Passes the feed through and keeps it in reminder_fragments once all of it has been sent, with the feed secret it
+        was asked for with, so it is only served to tokens with that secret.
+    """
+    parts = []
+    for part in render_feed(user_id, versions):
+        parts.append(part)
+        yield part
+    reminder_fragments.set(user_id, FEED_VARIANT,
+                           {'body': "".join(parts), 'etag': etag, 'last_modified': last_modified, 'secret': secret},
+                           generation)
+
+
+@require_http_methods(["GET", "HEAD"])
+def feed(request, token: str):
+    """
+    | |requires| The token from the user's feed URL, in place of logging in, so calendar apps can subscribe to it.
+    | |contains| The user's reminders as an iCalendar feed. Supports If-None-Match and If-Modified-Since.
+
+    A feed is served from reminder_fragments, without touching the database, until one of the user's reminders
+    changes or the user's feed secret is replaced. It is then streamed as it is rebuilt, with only the changed
+    reminders rendered again.
+    """
+    read = read_token(token)
+    if read is None:
+        raise Http404()
+    user_id, secret = read
+
+    generation = reminder_fragments.generation(user_id)
+    cached = reminder_fragments.get(user_id, FEED_VARIANT, generation)
+    if cached is not None and cached['secret'] == secret:
+        etag, last_modified = cached['etag'], cached['last_modified']
+    else:
+        cached = None
+        feed_changed_at = models.DiscordUser.objects.filter(id=user_id, feed_secret=secret) \
+            .values_list('feed_changed_at', flat=True).first()
+        if feed_changed_at is None:
+            raise Http404()
+        versions, reminders_changed_at = feed_versions(user_id)
+        # Taken from the rows, like the ETag, so a feed rebuilt after an eviction or restart keeps its Last-Modified.
+        changed_at = max(feed_changed_at, reminders_changed_at or feed_changed_at)
+        etag, last_modified = feed_etag(versions), changed_at.replace(tzinfo=timezone.utc).timestamp()
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is None:
+        if cached is not None:
+            response = HttpResponse(cached['body'], content_type=CONTENT_TYPE)
+        else:
+            response = StreamingHttpResponse(cached_feed(user_id, secret, versions, generation, etag, last_modified),
+                                             content_type=CONTENT_TYPE)
+        response['Content-Disposition'] = 'inline; filename="reminders.ics"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
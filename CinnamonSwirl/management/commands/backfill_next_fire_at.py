@@ -0,0 +1,52 @@
+import logging
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from CinnamonSwirl import models, schedule
+
+
+class Command(BaseCommand):
+    """
+    | Fills in Reminder.next_fire_at for rows written before it existed. Walks the table by primary key in chunks so
+        memory stays flat and each chunk is committed on its own, which makes the command safe to stop and re-run.
+    """
+    help = "Computes next_fire_at for unfinished reminders, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Rows to load and update at a time.")
+        parser.add_argument("--recompute", action="store_true",
+                            help="Recompute every unfinished reminder, not only the ones missing next_fire_at.")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        now = datetime.utcnow()
+        queryset = models.Reminder.objects.filter(finished=False)
+        if not options["recompute"]:
+            queryset = queryset.filter(next_fire_at__isnull=True)
+
+        last_pk = 0
+        updated = finished = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by("pk")[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            for reminder in chunk:
+                try:
+                    reminder.next_fire_at = schedule.next_occurrence(reminder, after=now)
+                except ValueError as error:
+                    logging.warning(f"Reminder {reminder.pk} has a schedule that could not be read: {error}")
+                    continue
+                # Nothing left to fire, so it will never show up as due again.
+                reminder.finished = reminder.next_fire_at is None
+                finished += reminder.finished
+
+            with transaction.atomic():
+                models.Reminder.objects.bulk_update(chunk, ["next_fire_at", "finished"])
+            updated += len(chunk)
+            self.stdout.write(f"Processed {updated} reminders, up to id {last_pk}.")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {updated} reminders processed, {finished} marked finished."))
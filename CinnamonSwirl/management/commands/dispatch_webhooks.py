@@ -0,0 +1,38 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from CinnamonSwirl import webhooks
+
+
+class Command(BaseCommand):
+    """
+    | Sends the signals queued in WebhookOutbox to DISCORD_WEBHOOK_URL. Runs until stopped, going straight on to the
+        next batch while there is work and sleeping for --poll-interval seconds when the outbox is empty. A batch that
+        fails is logged and followed by the same sleep.
+    """
+    help = "Sends queued webhook signals to the bot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--poll-interval", type=float, default=1.0)
+        parser.add_argument("--max-attempts", type=int, default=10)
+        parser.add_argument("--once", action="store_true", help="Send one batch and exit.")
+
+    def handle(self, *args, **options):
+        dispatcher = webhooks.WebhookDispatcher(batch_size=options["batch_size"], max_attempts=options["max_attempts"])
+        while True:
+            close_old_connections()  # Long running, so do what the request cycle would do for us
+            if options["once"]:
+                self.stdout.write(f"Settled {dispatcher.drain_once()} webhook messages.")
+                return
+            try:
+                settled = dispatcher.drain_once()
+            except Exception:
+                # Such as the database going away for a moment. Rows stay in the outbox, so the next batch tries again.
+                logging.exception("Sending webhook messages failed.")
+                settled = 0
+            if not settled:
+                time.sleep(options["poll_interval"])
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from CinnamonSwirl import models, transfer
+
+
+class Command(BaseCommand):
+    """
+    | Writes reminders out as NDJSON or CSV, in the same format as the reminders export API. Rows are read in chunks,
+        so exporting every reminder in the database does not need the memory to hold them all.
+    """
+    help = "Exports reminders as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only export this Discord user's reminders.")
+        parser.add_argument("--format", choices=transfer.FORMATS, default="ndjson")
+        parser.add_argument("--output", help="File to write to. Defaults to standard output.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows to load at a time.")
+
+    def handle(self, *args, **options):
+        queryset = models.Reminder.objects.all()
+        if options["user"] is not None:
+            queryset = queryset.filter(recipient=options["user"])
+
+        output = open(options["output"], "w", newline="", encoding="utf-8") if options["output"] else sys.stdout
+        try:
+            for chunk in transfer.export_reminders(queryset, options["format"], chunk_size=options["chunk_size"]):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from CinnamonSwirl import models, transfer
+
+
+class Command(BaseCommand):
+    """
+    | Creates reminders for a user from an NDJSON or CSV file in the export's format. Rows are validated like the
+        reminder form and inserted in chunks, each committed on its own. Rows that fail are listed by line number.
+    """
+    help = "Imports reminders for one user from NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file to import.")
+        parser.add_argument("--user", type=int, required=True, help="The Discord user the reminders are for.")
+        parser.add_argument("--format", choices=transfer.FORMATS,
+                            help="Defaults to csv for .csv files and ndjson otherwise.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Rows to insert per transaction.")
+
+    def handle(self, *args, **options):
+        if not models.DiscordUser.objects.filter(id=options["user"]).exists():
+            raise CommandError(f"There is no user {options['user']}.")
+        import_format = options["format"] or ("csv" if options["path"].endswith(".csv") else "ndjson")
+
+        importer = transfer.ReminderImporter(user_id=options["user"], chunk_size=options["chunk_size"])
+        with open(options["path"], newline="", encoding="utf-8") as rows:
+            result = importer.run(transfer.read_rows(rows, import_format))
+
+        for error in result["errors"]:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {result['created']} reminders created, {result['failed']} failed."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from CinnamonSwirl import profiling
+from App import settings
+
+
+class Command(BaseCommand):
+    """
+    | Prints an X-Profile header that has HomeView, ReminderView and Setup profiled, within PROFILE_RATE_LIMIT, until
+        it expires. Anyone holding it can have requests profiled, so keep it to the one investigation.
+    """
+    help = "Prints a signed X-Profile header for profiling requests."
+
+    def handle(self, *args, **options):
+        if not settings.PROFILE_DIR:
+            self.stderr.write("PROFILE_DIR is unset, so no request will be profiled.")
+        self.stdout.write(f"{profiling.HEADER}: {profiling.profile_token()}")
+        self.stderr.write(f"Valid for {settings.PROFILE_TOKEN_MAX_AGE} seconds.")
@@ -0,0 +1,50 @@
+import os
+import signal
+import socket
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from CinnamonSwirl.scheduler import Scheduler, ShardLeases
+
+from App import settings
+
+
+class Command(BaseCommand):
+    """
+    | Delivers due reminders through DISCORD_WEBHOOK_URL. Runs until stopped, sleeping until the next reminder is due.
+        Safe to run next to bot shards using the dispatch API, since both claim reminders with leases.
+    | Start as many as needed: they share the reminders out between them by recipient, and can join or leave at any
+        time. Stop them with SIGTERM or Ctrl+C so they hand their share back straight away.
+    """
+    help = "Sends reminders to the bot as they come due."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.DISPATCH_BATCH_SIZE)
+        parser.add_argument("--lease-seconds", type=int, default=settings.DISPATCH_LEASE_SECONDS)
+        parser.add_argument("--max-sleep", type=float, default=5.0,
+                            help="Longest time between checks for reminders the scheduler has not seen yet.")
+        parser.add_argument("--horizon", type=int, default=600, help="Seconds ahead to keep in memory.")
+        parser.add_argument("--workers", type=int, default=settings.WEBHOOK_POOL_SIZE,
+                            help="Webhook messages sent at once.")
+        parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}",
+                            help="Unique name of this worker. Defaults to the host name and process id.")
+        parser.add_argument("--run-for", type=float, default=None, help="Stop after this many seconds.")
+        parser.add_argument("--once", action="store_true", help="Deliver what is due now and exit.")
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler(batch_size=options["batch_size"], lease_seconds=options["lease_seconds"],
+                              horizon=timedelta(seconds=options["horizon"]), max_sleep=options["max_sleep"],
+                              workers=options["workers"])
+        if options["once"]:
+            claimed = scheduler.run_once()
+            self.stdout.write(f"Delivered {scheduler.delivered} of {claimed} due reminders.")
+            return
+
+        scheduler.shards = ShardLeases(name=options["name"][:100])
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signal_number, lambda *_: scheduler.stop())
+        stop_at = scheduler.clock.now() + timedelta(seconds=options["run_for"]) if options["run_for"] else None
+        scheduler.run(close_connections=close_old_connections, stop_at=stop_at)
+        self.stdout.write(f"Delivered {scheduler.delivered} reminders.")
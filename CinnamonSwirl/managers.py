@@ -1,5 +1,20 @@
 from django.contrib.auth import models
-from datetime import datetime
+from django.db import connections, transaction
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import Mod
+from django.utils import timezone
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import logging
+from uuid import uuid4
+from zoneinfo import ZoneInfoNotFoundError
+from . import schedule
+from .fragments import reminder_fragments
+
+# Past this many distinct next occurrences in one acknowledge, advanced reminders are written with one bulk_update.
+ACKNOWLEDGE_GROUPS = 20
+
+logger = logging.getLogger(__name__)
 
 
 class DiscordUserOAuth2Manager(models.UserManager):
@@ -25,3 +40,168 @@ class DiscordUserOAuth2Manager(models.UserManager):
             last_login=datetime.utcnow()
         )
         return new_user
+
+    @staticmethod
+    def profile_from_discord(user: dict) -> dict:
+        """
+        | The DiscordUser columns that come from Discord's /users/@me response. These are refreshed on every login.
+        """
+        return {
+            "username": user["username"],
+            "avatar": user["avatar"],
+            "public_flags": user["public_flags"],
+            "flags": user["flags"],
+            "locale": user["locale"],
+            "mfa_enabled": user["mfa_enabled"],
+            "discord_tag": f"{user['username']}#{user['discriminator']}",
+            "last_login": datetime.utcnow(),
+        }
+
+    def login_from_discord(self, user: dict, create: bool = True):
+        """
+        | Records a login from Discord's OAuth2 user object in one statement: the user's profile and last_login are
+            refreshed, and with create the user is inserted if they are new. Returns None when create is False and
+            the user does not exist.
+        | Both statements are atomic in the database, so concurrent logins for the same Discord id cannot insert the
+            user twice. Everything else on the row, such as the setup progress, is left alone.
+        | The returned DiscordUser only has its id loaded. Logging in needs nothing more, and any other field is read
+            from the database on first access.
+        """
+        profile = self.profile_from_discord(user)
+        if not create:
+            if not self.filter(id=user["id"]).update(**profile):
+                return None
+        else:
+            features = connections[self.db].features
+            if features.supports_update_conflicts:
+                # INSERT ... ON CONFLICT DO UPDATE on SQLite, INSERT ... ON DUPLICATE KEY UPDATE on MySQL.
+                self.bulk_create([self.model(id=user["id"], **profile)], update_conflicts=True,
+                                 update_fields=list(profile),
+                                 unique_fields=["id"] if features.supports_update_conflicts_with_target else None)
+            else:
+                with transaction.atomic(using=self.db):
+                    if not self.select_for_update().filter(id=user["id"]).update(**profile):
+                        self.create(id=user["id"], **profile)
+        return self.model.from_db(self.db, ["id"], [user["id"]])
+
+
+class ReminderQuerySet(QuerySet):
+    """
+    | Shortcuts for finding Reminders by their precomputed next_fire_at. These stay on the (finished, next_fire_at)
+        index so polling does not have to expand every rrule in python.
+    """
+    def due(self, until: datetime | None = None):
+        """
+        | Unfinished reminders whose next occurrence is at or before until, defaulting to now. Soonest first.
+        """
+        if until is None:
+            until = datetime.utcnow()
+        return self.filter(finished=False, next_fire_at__lte=until).order_by("next_fire_at")
+
+    def matching_rule(self, **values):
+        """
+        | Reminders whose by* bitmasks include every supplied value. matching_rule(byweekday=0, byhour=9) finds the
+            reminders set for Mondays at 9. The bit tests run in the database against the integer columns.
+        """
+        queryset = self
+        for field, value in values.items():
+            bit = schedule.to_mask([value], field)
+            queryset = queryset.alias(**{f"{field}_bit": F(field).bitand(bit)}).filter(**{f"{field}_bit": bit})
+        return queryset
+
+    def unleased(self, now: datetime):
+        """
+        | Reminders that no bot shard currently holds a lease on.
+        """
+        return self.filter(Q(leased_until__isnull=True) | Q(leased_until__lt=now))
+
+    def in_buckets(self, buckets, bucket_count: int):
+        """
+        | Reminders whose recipient falls in one of the buckets, recipient % bucket_count. See scheduler.ShardLeases
+        """
+        return self.alias(bucket=Mod("recipient", bucket_count)).filter(bucket__in=buckets)
+
+    def lease_due(self, limit: int, lease_seconds: int, now: datetime | None = None, buckets=None,
+                  bucket_count: int = 1, pks=None) -> tuple[str, list]:
+        """
+        | Claims up to limit due reminders for lease_seconds and returns the lease token along with the claimed
+            Reminders. The claim is a conditional UPDATE, so two shards racing for the same rows can never both win
+            them. Rows that are not acknowledged before the lease runs out become claimable again.
+        | Where the database supports it (MySQL 8, PostgreSQL) the candidates are read with SELECT ... FOR UPDATE SKIP
+            LOCKED, so racing shards pass over each other's rows instead of queueing behind them and coming away with
+            nothing.
+        | With buckets, only recipients in those buckets are claimed. With pks, only those reminders are.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        token = uuid4().hex
+        due = self.due(now).unleased(now)
+        if buckets is not None:
+            due = due.in_buckets(buckets, bucket_count)
+        if pks is not None:
+            due = due.filter(pk__in=pks)
+        skip_locked = connections[self.db].features.has_select_for_update_skip_locked
+        with transaction.atomic(using=self.db) if skip_locked else nullcontext():
+            if skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            # Materialized on purpose: MySQL does not allow LIMIT inside an IN subquery.
+            candidates = list(due.values_list("pk", flat=True)[:limit])
+            if not candidates:
+                return token, []
+            self.filter(pk__in=candidates).unleased(now).update(
+                lease_token=token, leased_until=now + timedelta(seconds=lease_seconds))
+        return token, list(self.filter(pk__in=candidates, lease_token=token).order_by("next_fire_at"))
+
+    def acknowledge(self, token: str, delivered: list, failed: list = (), now: datetime | None = None) -> dict:
+        """
+        | Settles a lease. Delivered reminders are advanced to their next occurrence after now, or finished if the
+            schedule is exhausted. Failed reminders are released to be claimed again. Only rows still held by token are
+            touched, and every group is written with a single bulk query.
+        | A delivered reminder whose schedule cannot be read is logged and finished, so it is neither sent again nor
+            holds up the rest of the batch.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        advanced, finished, finished_recipients = {}, [], set()
+        # The rows are read outside the transaction, so that SQLite is not asked to upgrade a read to a write while
+        # other workers write. Every write below is limited to rows still held by token instead, so one whose lease
+        # was taken over in between is left to its new holder.
+        held = self.filter(lease_token=token)
+        for reminder in held.filter(pk__in=delivered):
+            # Skip occurrences that were missed while the bot was away rather than firing them all at once.
+            after = max(reminder.next_fire_at or now, now)
+            try:
+                next_fire_at = schedule.next_occurrence(reminder, after=after, inc=False)
+            except (ValueError, ZoneInfoNotFoundError):
+                logger.exception(f"Reminder {reminder.pk} has a schedule that could not be read and was finished.")
+                next_fire_at = None
+            if next_fire_at is None:
+                finished.append(reminder.pk)
+                finished_recipients.add(reminder.recipient)
+            else:
+                advanced.setdefault(next_fire_at, []).append(reminder.pk)
+
+        changed_at = timezone.now()  # The wall clock, even when now is a time the caller is settling for
+        with transaction.atomic():
+            # Reminders due together usually come round again together, so one UPDATE per next occurrence is far
+            # fewer queries than rows. bulk_update's CASE per row is kept for batches where most of them differ.
+            advanced_count = 0
+            if len(advanced) <= ACKNOWLEDGE_GROUPS:
+                for next_fire_at, pks in advanced.items():
+                    advanced_count += held.filter(pk__in=pks).update(next_fire_at=next_fire_at, leased_until=None,
+                                                                     lease_token=None, version=F("version") + 1,
+                                                                     changed_at=changed_at)
+            else:
+                rows = [self.model(pk=pk, next_fire_at=next_fire_at)
+                        for next_fire_at, pks in advanced.items() for pk in pks]
+                held.bulk_update(rows, ["next_fire_at"])
+                advanced_count = held.filter(pk__in=[row.pk for row in rows]).update(
+                    leased_until=None, lease_token=None, version=F("version") + 1, changed_at=changed_at)
+            finished_count = held.filter(pk__in=finished).update(
+                finished=True, next_fire_at=None, leased_until=None, lease_token=None,
+                version=F("version") + 1, changed_at=changed_at) if finished else 0
+            if finished_count:
+                for recipient in finished_recipients:
+                    reminder_fragments.invalidate(recipient)  # The home page shows whether a reminder is finished
+            released = held.filter(pk__in=failed).update(leased_until=None, lease_token=None) if failed else 0
+        return {"advanced": advanced_count, "finished": finished_count, "released": released}
@@ -0,0 +1,290 @@
+import bisect
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+
+from App import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows. Files of finished processes are then left as they are.
+    fcntl = None
+
+# Upper bounds of the histogram buckets, in seconds. Anything slower goes in +Inf.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST = "cinnamonswirl_http_request_duration_seconds"
+DB_QUERY = "cinnamonswirl_db_query_duration_seconds"
+WEBHOOK_SEND = "cinnamonswirl_webhook_send_duration_seconds"
+OAUTH_EXCHANGE = "cinnamonswirl_oauth_exchange_duration_seconds"
+POOL_WAIT = "cinnamonswirl_db_pool_wait_seconds"
+POOL_CONNECTIONS = "cinnamonswirl_db_pool_connections"
+POOL_OPENED = "cinnamonswirl_db_pool_opened_total"
+POOL_DISCARDED = "cinnamonswirl_db_pool_discarded_total"
+
+# Every metric, as its type and help text. Counters and histograms only ever go up and are kept after a worker exits.
+# Gauges are what each worker has right now, so only running workers' count.
+METRICS = {HTTP_REQUEST: ("histogram", "Time to answer a request, by URL name, method and status class."),
+           DB_QUERY: ("histogram", "Time a database query took, by database alias."),
+           WEBHOOK_SEND: ("histogram", "Time a Discord webhook send took, by outcome: ok, rate_limited or error."),
+           OAUTH_EXCHANGE: ("histogram", "Time a Discord OAuth code exchange took, by outcome: ok or error."),
+           POOL_WAIT: ("histogram", "Time spent waiting for a pooled database connection, by alias and outcome: ok "
+                                    "or timeout."),
+           POOL_CONNECTIONS: ("gauge", "Open pooled database connections, by alias and state: in_use or idle."),
+           POOL_OPENED: ("counter", "Database connections the pools opened, by alias."),
+           POOL_DISCARDED: ("counter", "Pooled database connections closed instead of reused, by alias and reason: "
+                                       "expired, invalid or broken.")}
+
+ARCHIVE = "archive.json"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricStore:
+    """
+    | The metrics of one process. Recording one only adds to a list in memory. Every flush_seconds, at the next
+        one, the whole store is written to the process's own file in directory, and the metrics endpoint adds
+        every process's file up. So gunicorn workers share their figures without talking to each other.
+    | Each histogram series is a list of counts, one per bucket and one for +Inf, followed by the sum of what was
+        observed. A counter series is a list of one total. Gauges are kept apart, as they are not added to.
+    """
+    def __init__(self, directory: str, flush_seconds: float = 5, clock=time.monotonic):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        | Starts over with nothing observed and a file of its own. A forked worker calls this, so it does not write
+            over its parent's file with the parent's figures.
+        """
+        self.series = {}
+        self.gauges = {}
+        self.pid = os.getpid()
+        self.path = os.path.join(self.directory, f"{self.pid}-{uuid.uuid4().hex[:8]}.json")
+        self.last_flush = self.clock()
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+            due = self.clock() - self.last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.series.setdefault(key, [0])
+            series[0] += amount
+            due = self.clock() - self.last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+            due = self.clock() - self.last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows = [[name, list(labels), list(series)] for (name, labels), series in self.series.items()]
+            gauges = [[name, list(labels), [value]] for (name, labels), value in self.gauges.items()]
+            self.last_flush = self.clock()
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({'pid': self.pid, 'series': rows, 'gauges': gauges}, file)
+        os.replace(temporary, self.path)  # Readers never see half a file
+
+    def collect(self) -> dict:
+        """
+        | Every process's series and gauges added up, this one's included as of now.
+        """
+        self.flush()
+        fold_finished(self.directory)
+        totals = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                merge(totals, read(entry.path))
+                merge(totals, read(entry.path, "gauges"))
+        return totals
+
+
+def read(path: str, kind: str = "series") -> dict:
+    try:
+        with open(path) as file:
+            rows = json.load(file).get(kind, [])
+    except (OSError, ValueError):
+        return {}  # Gone since it was listed, or being folded into the archive
+    return {(name, tuple(tuple(label) for label in labels)): series for name, labels, series in rows}
+
+
+def merge(totals: dict, series: dict):
+    for key, values in series.items():
+        total = totals.get(key)
+        totals[key] = list(values) if total is None else [a + b for a, b in zip(total, values)]
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def fold_finished(directory: str):
+    """
+    | Adds the files of processes that have exited into one archive file and deletes them, so the totals keep going up
+        as workers come and go without a file per worker ever lived.
+    """
+    if fcntl is None:
+        return
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        finished = []
+        for entry in os.scandir(directory):
+            pid = entry.name.split("-", 1)[0]
+            if entry.name.endswith(".json") and pid.isdigit() and not alive(int(pid)):
+                finished.append(entry.path)
+        if not finished:
+            return
+        archive = os.path.join(directory, ARCHIVE)
+        totals = read(archive)
+        for path in finished:
+            merge(totals, read(path))
+        temporary = f"{archive}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({'series': [[name, list(labels), series] for (name, labels), series in totals.items()]}, file)
+        os.replace(temporary, archive)
+        for path in finished:
+            os.remove(path)
+
+
+def escape(value) -> str:
+    r"""
+    >>> escape('say "hi"\n')
+    'say \\"hi\\"\\n'
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def exposition(totals: dict) -> str:
+    """
+    | The Prometheus text format of collected series. Buckets are cumulative, as Prometheus expects.
+
+    >>> series = [0] * (len(BUCKETS) + 1) + [0.0]
+    >>> series[2], series[-2], series[-1] = 3, 1, 12.5
+    >>> lines = exposition({(WEBHOOK_SEND, (("outcome", "ok"),)): series}).splitlines()
+    >>> wanted = ('le="0.005"', 'le="+Inf"', "_count")
+    >>> [line for line in lines if any(part in line for part in wanted)]  # doctest: +NORMALIZE_WHITESPACE
+    ['cinnamonswirl_webhook_send_duration_seconds_bucket{outcome="ok",le="0.005"} 3',
+     'cinnamonswirl_webhook_send_duration_seconds_bucket{outcome="ok",le="+Inf"} 4',
+     'cinnamonswirl_webhook_send_duration_seconds_count{outcome="ok"} 4']
+    """
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        rows = sorted((labels, series) for (series_name, labels), series in totals.items() if series_name == name)
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels, series in rows:
+            prefix = "".join(f'{label}="{escape(value)}",' for label, value in labels)
+            if kind != "histogram":
+                lines.append(f"{name}{{{prefix.rstrip(',')}}} {series[0]}" if prefix else f"{name} {series[0]}")
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            braces = f"{{{prefix.rstrip(',')}}}" if prefix else ""
+            lines += [f"{name}_sum{braces} {series[-1]}", f"{name}_count{braces} {cumulative}"]
+    return "\n".join(lines) + "\n"
+
+
+store = MetricStore(settings.METRICS_DIR, flush_seconds=settings.METRICS_FLUSH_SECONDS)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=store.reset)
+
+
+def observe(name: str, seconds: float, **labels):
+    if settings.METRICS_ENABLED:
+        store.observe(name, seconds, **labels)
+
+
+def increment(name: str, amount: float = 1, **labels):
+    if settings.METRICS_ENABLED:
+        store.increment(name, amount, **labels)
+
+
+def set_gauge(name: str, value: float, **labels):
+    if settings.METRICS_ENABLED:
+        store.set(name, value, **labels)
+
+
+@contextmanager
+def timed(name: str, **labels):
+    """
+    | Observes how long the block took, labelled with its outcome: error if it raised, ok otherwise. The block can set
+        outcome on what it is given for anything in between.
+    """
+    result = {'outcome': "error"}
+    start = time.perf_counter()
+    try:
+        yield result
+        if result['outcome'] == "error":
+            result['outcome'] = "ok"
+    finally:
+        observe(name, time.perf_counter() - start, outcome=result['outcome'], **labels)
+
+
+def query_timer(alias: str):
+    """
+    | A connection.execute_wrapper that observes every query made on the alias.
+    """
+    def timer(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            observe(DB_QUERY, time.perf_counter() - start, alias=alias)
+    timer.metrics_alias = alias
+    return timer
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """
+    | connection_created receiver. A connection keeps its execute wrappers when it reconnects, so it only ever gets one
+        timer.
+    """
+    if not any(getattr(wrapper, "metrics_alias", None) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.insert(0, query_timer(connection.alias))
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    | |requires| METRICS_TOKEN as a bearer token. Switched off while it is unset.
+    | |contains| Latency histograms of every worker process together, in the Prometheus text format.
+    """
+    expected = settings.METRICS_TOKEN
+    supplied = request.headers.get('Authorization', '')
+    if not expected or not hmac.compare_digest(supplied.encode(), f"Bearer {expected}".encode()):
+        return HttpResponse(status=401)
+    return HttpResponse(exposition(store.collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,173 @@
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from CinnamonSwirl import metrics
+from App import settings
+
+logger = logging.getLogger(__name__)
+
+# Methods the request histogram is labelled with. Anything else counts as other, so no client can add series at will.
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+# The timing of the request being handled, for the query wrapper and TimedDjangoTemplates to add to.
+_current = contextvars.ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """
+    | Where one request's time went. Times are in seconds. The view's time includes the queries it made, and the
+        template's time includes the queries made while rendering, such as querysets evaluated in a loop.
+    | Only the slowest statements are kept, SLOW_REQUEST_SQL of them, as bare SQL without parameters.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0.0
+        self.view = 0.0
+        self.template = 0.0
+        self.db = 0.0
+        self.template_db = 0.0
+        self.queries = 0
+        self.statements = []  # A min-heap of (seconds, order, sql), so the quickest is the one replaced
+        self.order = itertools.count()
+        self.rendering = 0  # How deep in template renders we are. Only the outermost one is timed.
+        self.view_start = None
+
+    def query(self, execute, sql, params, many, context):
+        """
+        | A connection.execute_wrapper that times every query.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            self.db += seconds
+            self.queries += 1
+            if self.rendering:
+                self.template_db += seconds
+            entry = (seconds, next(self.order), sql)
+            if len(self.statements) < settings.SLOW_REQUEST_SQL:
+                heapq.heappush(self.statements, entry)
+            elif self.statements and seconds > self.statements[0][0]:
+                heapq.heapreplace(self.statements, entry)
+
+    @property
+    def view_only(self) -> float:
+        # Templates rendered by the view are timed on their own. Error pages are rendered outside of any view.
+        return max(self.view - self.template, 0.0)
+
+    def header(self) -> str:
+        """
+        | The Server-Timing header, in milliseconds.
+
+        >>> timing = RequestTiming()
+        >>> timing.total, timing.view, timing.template, timing.db, timing.queries = 0.0125, 0.01, 0.004, 0.002, 3
+        >>> timing.header()
+        'total;dur=12.5, view;dur=6.0, template;dur=4.0, db;dur=2.0;desc="3 queries"'
+        """
+        return (f"total;dur={self.total * 1000:.1f}, view;dur={self.view_only * 1000:.1f}, "
+                f"template;dur={self.template * 1000:.1f}, "
+                f'db;dur={self.db * 1000:.1f};desc="{self.queries} quer{"y" if self.queries == 1 else "ies"}"')
+
+    def as_log(self, request, response) -> dict:
+        match = getattr(request, 'resolver_match', None)
+        return {'event': 'slow_request', 'method': request.method, 'path': request.path,
+                'view': match.view_name if match else None, 'status': response.status_code,
+                'total_ms': round(self.total * 1000, 2), 'view_ms': round(self.view_only * 1000, 2),
+                'template_ms': round(self.template * 1000, 2), 'db_ms': round(self.db * 1000, 2),
+                'view_db_ms': round((self.db - self.template_db) * 1000, 2),
+                'template_db_ms': round(self.template_db * 1000, 2), 'queries': self.queries,
+                'sql': [{'ms': round(seconds * 1000, 2), 'sql': sql}
+                        for seconds, _, sql in sorted(self.statements, reverse=True)]}
+
+
+class RequestTimingMiddleware:
+    """
+    | Times every request, its view and its template rendering, and the time and number of its queries. The figures
+        go out in a Server-Timing header, which browser developer tools show next to the request, unless
+        SERVER_TIMING_HEADER is False. Requests slower than SLOW_REQUEST_MS are logged as one JSON line with their
+        slowest SQL. Every request's total also goes into the request histogram of CinnamonSwirl.metrics.
+    | Unlike debug_toolbar, nothing is formatted or kept per query beyond a running total and the few slowest
+        statements, so it is cheap enough to leave on in production. Switched off entirely with REQUEST_TIMING=False.
+    | It goes first in MIDDLEWARE so the total covers every other middleware too. The body of a streaming response is
+        produced after the middleware returns, so it is not counted.
+    """
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        now = time.perf_counter()
+        timing.total = now - timing.start
+        if timing.view_start is not None:
+            timing.view = now - timing.view_start
+
+        if settings.SERVER_TIMING_HEADER:
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f"{existing}, {timing.header()}" if existing else timing.header()
+        if timing.total * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning(json.dumps(timing.as_log(request, response)))
+        match = getattr(request, 'resolver_match', None)
+        metrics.observe(metrics.HTTP_REQUEST, timing.total, view=match.view_name if match else "unmatched",
+                        method=request.method if request.method in METHODS else "other",
+                        status=f"{response.status_code // 100}xx")
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = _current.get()
+        if timing is not None:
+            timing.view_start = time.perf_counter()
+
+
+class TimedTemplate:
+    """
+    | A template from TimedDjangoTemplates. Rendering it adds to the template time of the request being handled.
+    """
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None or timing.rendering:
+            return self.template.render(context, request)
+        timing.rendering += 1
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timing.template += time.perf_counter() - start
+            timing.rendering -= 1
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    | The Django template engine, with renders timed for RequestTimingMiddleware. Everything that renders a template
+        goes through an engine, so this catches render(), the reminders table and crispy forms alike.
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,63 @@
+# Generated by Django 4.1.2 on 2026-10-17 14:15
+
+import CinnamonSwirl.managers
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscordUser',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=50)),
+                ('avatar', models.CharField(max_length=100, null=True)),
+                ('public_flags', models.IntegerField()),
+                ('flags', models.IntegerField()),
+                ('locale', models.CharField(max_length=50)),
+                ('mfa_enabled', models.BooleanField()),
+                ('discord_tag', models.CharField(max_length=50)),
+                ('last_login', models.DateTimeField()),
+                ('guild_preference', models.BooleanField(default=False)),
+                ('message_preference', models.BooleanField(default=False)),
+                ('setup_flags', models.IntegerField(default=0)),
+                ('in_setup', models.BooleanField(default=True)),
+                ('channel', models.BigIntegerField(null=True)),
+            ],
+            managers=[
+                ('objects', CinnamonSwirl.managers.DiscordUserOAuth2Manager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('freq', models.CharField(default='MINUTELY', max_length=10)),
+                ('message', models.CharField(default='Reminder', max_length=1024)),
+                ('recipient', models.BigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('interval', models.IntegerField(default=1)),
+                ('dtstart', models.DateTimeField(default=django.utils.timezone.now)),
+                ('wkst', models.IntegerField(null=True)),
+                ('count', models.IntegerField(null=True)),
+                ('until', models.DateTimeField(null=True)),
+                ('bysetpos', models.CharField(max_length=100, null=True)),
+                ('bymonth', models.CharField(max_length=100, null=True)),
+                ('bymonthday', models.CharField(max_length=100, null=True)),
+                ('byyearday', models.CharField(max_length=100, null=True)),
+                ('byweekno', models.CharField(max_length=100, null=True)),
+                ('byweekday', models.CharField(max_length=100, null=True)),
+                ('byhour', models.CharField(max_length=100, null=True)),
+                ('byminute', models.CharField(max_length=100, null=True)),
+                ('bysecond', models.CharField(max_length=100, null=True)),
+                ('timezone', models.CharField(default='US/Central', max_length=100)),
+            ],
+        ),
+    ]
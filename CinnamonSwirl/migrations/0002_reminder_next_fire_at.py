@@ -0,0 +1,26 @@
+# Generated by Django 4.1.2 on 2026-10-17 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='next_fire_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['finished', 'next_fire_at'], name='reminder_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['recipient', 'finished'], name='reminder_recipient_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.2 on 2026-10-17 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0002_reminder_next_fire_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='lease_token',
+            field=models.CharField(max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='reminder',
+            name='leased_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,102 @@
+import logging
+
+from django.db import migrations, models
+
+# Kept here instead of importing CinnamonSwirl.schedule so this migration keeps working however that module changes.
+MASK_FIELDS = ("bymonth", "bymonthday", "byweekday", "byhour", "byminute", "bysecond")
+LIST_FIELDS = ("bysetpos", "byyearday", "byweekno")
+NEGATIVE_BITS = {"bymonthday": 31}
+RANGES = {"bymonth": range(1, 13), "bymonthday": range(1, 32), "byweekday": range(0, 7), "byhour": range(0, 24),
+          "byminute": range(0, 60), "bysecond": range(0, 60)}
+# Hours were saved as the local hour minus the UTC offset, without wrapping, so they may sit up to a day either side.
+LEGACY_HOURS = range(-24, 48)
+CHUNK_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def read_str_as_list(value):
+    if not value:
+        return []
+    return [int(item) for item in value.strip("[]").split(',') if item.strip()]
+
+
+def to_mask(values, field):
+    negative_bits = NEGATIVE_BITS.get(field, 0)
+    mask = 0
+    for value in values:
+        if field == "byhour":
+            if value not in LEGACY_HOURS:
+                raise ValueError(f"byhour {value} is not an hour")
+            value %= 24
+        if abs(value) not in RANGES[field] or (value < 0 and not negative_bits):
+            raise ValueError(f"{field} {value} is out of range")
+        mask |= 1 << (value if value >= 0 else negative_bits - value)
+    return mask
+
+
+def from_mask(mask, field):
+    negative_bits = NEGATIVE_BITS.get(field, 0)
+    return [negative_bits - bit if negative_bits and bit > negative_bits else bit
+            for bit in range(mask.bit_length()) if mask >> bit & 1]
+
+
+def convert(apps, schema_editor, forwards):
+    Reminder = apps.get_model("CinnamonSwirl", "Reminder")
+    masks = [f"{field}_mask" for field in MASK_FIELDS]
+    written = (masks + ["finished"] if forwards else list(MASK_FIELDS)) + list(LIST_FIELDS)
+    last_pk = 0
+    while True:
+        chunk = list(Reminder.objects.filter(pk__gt=last_pk).order_by("pk")
+                     .only("pk", "finished", *masks, *MASK_FIELDS, *LIST_FIELDS)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        for reminder in chunk:
+            for field in MASK_FIELDS:
+                if forwards:
+                    try:
+                        mask = to_mask(read_str_as_list(getattr(reminder, field)), field)
+                    except ValueError as error:
+                        # Dropping the values would widen the schedule, so the reminder is stopped instead.
+                        logger.warning(f"Reminder {reminder.pk} has an unreadable {field} and was finished: {error}")
+                        mask, reminder.finished = 0, True
+                    setattr(reminder, f"{field}_mask", mask)
+                else:
+                    values = from_mask(getattr(reminder, f"{field}_mask"), field)
+                    setattr(reminder, field, str(values) if values else None)
+            for field in LIST_FIELDS:
+                values = read_str_as_list(getattr(reminder, field))
+                if forwards:
+                    setattr(reminder, field, ",".join(str(value) for value in values) or None)
+                else:
+                    setattr(reminder, field, str(values) if values else None)
+        Reminder.objects.bulk_update(chunk, written)
+
+
+def forwards(apps, schema_editor):
+    convert(apps, schema_editor, forwards=True)
+
+
+def backwards(apps, schema_editor):
+    convert(apps, schema_editor, forwards=False)
+
+
+class Migration(migrations.Migration):
+    """
+    | Moves the by* fields from lists written out as str, such as "[1, 2, 3]", to bitmasks, or to "1,-1" for the fields
+        whose ranges do not fit in one.
+    """
+
+    dependencies = [
+        ('CinnamonSwirl', '0003_reminder_lease'),
+    ]
+
+    operations = [
+        *[migrations.AddField(model_name='reminder', name=f'{field}_mask', field=models.BigIntegerField(default=0))
+          for field in MASK_FIELDS],
+        migrations.RunPython(forwards, backwards),
+        *[migrations.RemoveField(model_name='reminder', name=field) for field in MASK_FIELDS],
+        *[migrations.RenameField(model_name='reminder', old_name=f'{field}_mask', new_name=field)
+          for field in MASK_FIELDS],
+    ]
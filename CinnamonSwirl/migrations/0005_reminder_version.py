@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-17 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0004_reminder_rule_masks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.2 on 2026-10-17 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0005_reminder_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['recipient', 'dtstart'], name='reminder_recipient_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['recipient', 'timezone'], name='reminder_recipient_tz_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.2 on 2026-10-17 14:23
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0006_reminder_paging_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.CharField(max_length=2000)),
+                ('created_at', models.DateTimeField(default=datetime.datetime.utcnow)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=datetime.datetime.utcnow)),
+                ('last_error', models.CharField(max_length=500, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.2 on 2026-10-17 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0007_webhookoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerShard',
+            fields=[
+                ('bucket', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('owner', models.CharField(max_length=100, null=True)),
+                ('leased_until', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SchedulerWorker',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('heartbeat_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from django.db import migrations
+from django.db.models import F
+
+CHUNK_SIZE = 1000
+
+
+def whole_hours(name, now):
+    # The offset the hours were stored with: today's, cut to whole hours, as the form and views used to read it.
+    return int(now.astimezone(ZoneInfo(name)).strftime('%z')[:3])
+
+
+def shift(mask, hours):
+    # Hours used to be stored without wrapping, so evening hours west of UTC sit on bits 24 and up.
+    shifted = 0
+    for bit in range(mask.bit_length()):
+        if mask >> bit & 1:
+            shifted |= 1 << ((bit + hours) % 24)
+    return shifted
+
+
+def convert(apps, schema_editor, forwards):
+    Reminder = apps.get_model("CinnamonSwirl", "Reminder")
+    now = datetime.now(timezone.utc)
+    offsets = {}
+    last_pk = 0
+    while True:
+        chunk = list(Reminder.objects.filter(pk__gt=last_pk, byhour__gt=0).order_by("pk")
+                     .only("pk", "byhour", "timezone")[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        for reminder in chunk:
+            if reminder.timezone not in offsets:
+                offsets[reminder.timezone] = whole_hours(reminder.timezone, now)
+            offset = offsets[reminder.timezone]
+            reminder.byhour = shift(reminder.byhour, offset if forwards else -offset)
+        Reminder.objects.bulk_update(chunk, ["byhour"])
+    # Cached rules and feeds are checked against version, so none of them outlives the change.
+    Reminder.objects.filter(byhour__gt=0).update(version=F("version") + 1)
+
+
+def forwards(apps, schema_editor):
+    convert(apps, schema_editor, forwards=True)
+
+
+def backwards(apps, schema_editor):
+    convert(apps, schema_editor, forwards=False)
+
+
+class Migration(migrations.Migration):
+    """
+    | Moves byhour from UTC hours to hours in the reminder's own timezone, with the offset the form showed them with.
+    """
+
+    dependencies = [
+        ('CinnamonSwirl', '0008_scheduler_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
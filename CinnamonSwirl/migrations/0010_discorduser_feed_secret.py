@@ -0,0 +1,49 @@
+# Generated by Django 4.1.2 on 2026-10-17 16:17
+
+import secrets
+
+import CinnamonSwirl.models
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+
+def fill_secrets(apps, schema_editor):
+    # A default given to AddField is worked out once and shared by every existing row, so each gets its own here.
+    DiscordUser = apps.get_model("CinnamonSwirl", "DiscordUser")
+    last_pk = None
+    while True:
+        queryset = DiscordUser.objects.order_by("pk").only("pk")
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        chunk = list(queryset[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        for user in chunk:
+            user.feed_secret = secrets.token_urlsafe(16)
+        DiscordUser.objects.bulk_update(chunk, ["feed_secret"])
+
+
+class Migration(migrations.Migration):
+    """
+    | Gives every user a secret of their own for their calendar feed URL, so the URL can be revoked.
+    """
+
+    dependencies = [
+        ('CinnamonSwirl', '0009_reminder_local_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discorduser',
+            name='feed_secret',
+            field=models.CharField(max_length=32, null=True),
+        ),
+        migrations.RunPython(fill_secrets, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='discorduser',
+            name='feed_secret',
+            field=models.CharField(default=CinnamonSwirl.models.new_feed_secret, max_length=32),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.2 on 2026-10-17 17:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0010_discorduser_feed_secret'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminder',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='reminder',
+            index=models.Index(fields=['changed_at'], name='reminder_changed_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.2 on 2026-10-17 17:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CinnamonSwirl', '0011_reminder_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discorduser',
+            name='feed_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
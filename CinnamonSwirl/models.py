@@ -1,8 +1,13 @@
 from django.db import models
 from django.urls import reverse
-from .managers import DiscordUserOAuth2Manager
+from .managers import DiscordUserOAuth2Manager, ReminderQuerySet
 from django.utils.timezone import now
-import re
+from datetime import datetime
+import secrets
+
+
+def new_feed_secret() -> str:
+    return secrets.token_urlsafe(16)
 
 
 class DiscordUser(models.Model):
@@ -19,6 +24,9 @@ class DiscordUser(models.Model):
     | mfa_endabled
     | discord_tag
     | last_login
+    | feed_secret: part of the calendar feed URL. Replacing it revokes every URL handed out before
+    | feed_changed_at: when the feed last changed in a way its reminders' changed_at cannot show, such as a reminder
+        being deleted or the feed secret being replaced
     | objects: django internal use, does not need to be defined on instantiation
     """
     id = models.BigIntegerField(primary_key=True)  # Most important one. We use this to see which Reminders they own.
@@ -36,6 +44,8 @@ class DiscordUser(models.Model):
     setup_flags = models.IntegerField(default=0)  # 0: New, 1: Joined Server, 2: Message preference, 3: Tested OK
     in_setup = models.BooleanField(default=True)
     channel = models.BigIntegerField(null=True)
+    feed_secret = models.CharField(max_length=32, default=new_feed_secret)  # See ics.feed_token
+    feed_changed_at = models.DateTimeField(default=now)  # See ics.feed
     objects = DiscordUserOAuth2Manager()
 
     @staticmethod
@@ -62,16 +72,21 @@ class Reminder(models.Model):
     | wkst
     | count
     | until
-    | bysetpos
-    | bymonth
-    | bymonthday
-    | byyearday
-    | byweekno
-    | byweekday
-    | byhour
-    | byminute
-    | bysecond
+    | bysetpos: str such as "1,-1"
+    | bymonth: bitmask
+    | bymonthday: bitmask
+    | byyearday: str such as "1,-1"
+    | byweekno: str such as "1,-1"
+    | byweekday: bitmask
+    | byhour: bitmask of hours in the reminder's timezone, not UTC. See schedule.local_zone
+    | byminute: bitmask
+    | bysecond: bitmask
     | timezone
+    | next_fire_at: The next occurrence in UTC, kept up to date on every write. None once the schedule is exhausted.
+    | leased_until: While set and in the future, a bot shard has claimed this reminder for delivery.
+    | lease_token: Identifies the claim that holds the lease.
+    | version: Goes up by one on every change to the reminder. Used to tell when cached copies are stale.
+    | changed_at: When the reminder was created or last changed, in UTC. Lets the scheduler read only what changed.
     | objects: django internal use, does not need to be defined on instantiation
     """
     # YEARLY, MONTHLY, WEEKLY, DAILY, HOURLY, MINUTELY, SECONDLY
@@ -84,17 +99,49 @@ class Reminder(models.Model):
     wkst = models.IntegerField(null=True)
     count = models.IntegerField(null=True)
     until = models.DateTimeField(null=True)
+    # Ranges too wide for a bitmask are stored as a comma separated list such as "1,-1". See schedule.LIST_FIELDS
     bysetpos = models.CharField(max_length=100, null=True)
-    bymonth = models.CharField(max_length=100, null=True)
-    bymonthday = models.CharField(max_length=100, null=True)
     byyearday = models.CharField(max_length=100, null=True)
     byweekno = models.CharField(max_length=100, null=True)
-    byweekday = models.CharField(max_length=100, null=True)
-    byhour = models.CharField(max_length=100, null=True)
-    byminute = models.CharField(max_length=100, null=True)
-    bysecond = models.CharField(max_length=100, null=True)
+    # One bit per allowed value, 0 when unset. Monday and 9 o'clock are bits 0 and 9. See schedule.to_mask
+    bymonth = models.BigIntegerField(default=0)
+    bymonthday = models.BigIntegerField(default=0)
+    byweekday = models.BigIntegerField(default=0)
+    byhour = models.BigIntegerField(default=0)
+    byminute = models.BigIntegerField(default=0)
+    bysecond = models.BigIntegerField(default=0)
     timezone = models.CharField(max_length=100, default="US/Central")  # In what timezone should all datetimes be read?
-    objects = models.Manager()  # Internal django use. Used to get, save, update, etc Reminders.
+    next_fire_at = models.DateTimeField(null=True)  # Precomputed from the fields above, see schedule.next_occurrence
+    leased_until = models.DateTimeField(null=True)  # See ReminderQuerySet.lease_due
+    lease_token = models.CharField(max_length=32, null=True)
+    version = models.PositiveIntegerField(default=0)  # See save, parse_reminder and ReminderQuerySet.acknowledge
+    changed_at = models.DateTimeField(default=now)  # Set along with version
+    objects = ReminderQuerySet.as_manager()  # Internal django use. Used to get, save, update, etc Reminders.
+
+    class Meta:
+        indexes = [
+            # Polling for due reminders is a range scan on this one.
+            models.Index(fields=["finished", "next_fire_at"], name="reminder_due_idx"),
+            # Listing a user's reminders.
+            models.Index(fields=["recipient", "finished"], name="reminder_recipient_idx"),
+            # Paging through a user's reminders sorted by the table's columns. See pagination.KeysetPaginator
+            models.Index(fields=["recipient", "dtstart"], name="reminder_recipient_start_idx"),
+            models.Index(fields=["recipient", "timezone"], name="reminder_recipient_tz_idx"),
+            # What changed since the scheduler last looked. See scheduler.Scheduler.refresh
+            models.Index(fields=["changed_at"], name="reminder_changed_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        | Every save is a new version of the reminder. Bulk .update() calls have to bump version and set changed_at
+            themselves.
+        """
+        if not self._state.adding:
+            self.version += 1
+            self.changed_at = now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'changed_at'}
+        super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         """
@@ -102,3 +149,52 @@ class Reminder(models.Model):
         :return: URL
         """
         return reverse("reminder") + f"?id={self.pk}"
+
+
+class WebhookOutbox(models.Model):
+    """
+    Signals for the bot waiting to be sent through DISCORD_WEBHOOK_URL. Rows are written in the same transaction as
+    the change that caused them and sent later by the dispatch_webhooks command, so a slow webhook never holds up a
+    request. Rows are deleted once sent.
+
+    | message: The signal, such as test:<discord user id>
+    | created_at
+    | attempts: How many sends have failed so far
+    | next_attempt_at: When the dispatcher may try again
+    | last_error
+    """
+    message = models.CharField(max_length=2000)
+    created_at = models.DateTimeField(default=datetime.utcnow)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=datetime.utcnow, db_index=True)
+    last_error = models.CharField(max_length=500, null=True)
+    objects = models.Manager()
+
+
+class SchedulerShard(models.Model):
+    """
+    Which run_scheduler worker delivers the reminders of one bucket of recipients, recipient % SCHEDULER_BUCKETS.
+    Workers take and renew these leases themselves, see scheduler.ShardLeases. A bucket whose lease ran out is free
+    for any worker to take.
+
+    | bucket
+    | owner: The worker's name, None while nobody holds it
+    | leased_until
+    """
+    bucket = models.PositiveSmallIntegerField(primary_key=True)
+    owner = models.CharField(max_length=100, null=True)
+    leased_until = models.DateTimeField(null=True)
+    objects = models.Manager()
+
+
+class SchedulerWorker(models.Model):
+    """
+    A run_scheduler worker that is, or recently was, running. Workers that have not checked in for
+    SCHEDULER_SHARD_TTL seconds no longer count when the buckets are shared out.
+
+    | name
+    | heartbeat_at
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    heartbeat_at = models.DateTimeField()
+    objects = models.Manager()
@@ -0,0 +1,91 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    | One page of rows from KeysetPaginator, plus the cursors for the pages either side of it. A cursor is None when
+        there is nothing in that direction.
+    """
+    def __init__(self, rows: list, next_cursor: str | None, previous_cursor: str | None):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+
+class KeysetPaginator:
+    """
+    | Pages through a queryset by remembering the last row seen instead of counting rows to skip. Rows are ordered by
+        one field with the primary key as a tie-breaker, so every page is a range scan on an index that starts with
+        that field, no matter how deep into the results it is. Cursors are opaque strings to pass back in.
+
+    :param order_by: A field or annotation name, prefixed with '-' for descending.
+    """
+    def __init__(self, queryset, order_by: str, page_size: int):
+        self.queryset = queryset
+        self.order_by = order_by
+        self.descending = order_by.startswith('-')
+        self.field = order_by.lstrip('-')
+        self.page_size = page_size
+
+    def page(self, cursor: str | None = None) -> KeysetPage:
+        position = self.decode(cursor)
+        backwards = position is not None and position[0]
+        # Walking back a page is walking forwards over the reversed ordering.
+        reverse = self.descending != backwards
+        direction = '-' if reverse else ''
+
+        queryset = self.queryset
+        if position is not None:
+            _, value, pk = position
+            comparison = 'lt' if reverse else 'gt'
+            if self.field == 'pk':
+                queryset = queryset.filter(**{f'pk__{comparison}': pk})
+            else:
+                queryset = queryset.filter(Q(**{f'{self.field}__{comparison}': value}) |
+                                           Q(**{self.field: value, f'pk__{comparison}': pk}))
+
+        rows = list(queryset.order_by(f'{direction}{self.field}', f'{direction}pk')[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows, None, None)
+
+        # Coming back from a later page means there is always a next page. Going forwards from a cursor means there
+        # is always a previous one.
+        next_cursor = self.encode(False, rows[-1]) if more or backwards else None
+        previous_cursor = self.encode(True, rows[0]) if (more and backwards) or (position and not backwards) else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def encode(self, backwards: bool, row) -> str:
+        value = getattr(row, self.field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        payload = json.dumps([self.order_by, backwards, value, row.pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode(self, cursor: str | None) -> tuple | None:
+        """
+        | Returns (backwards, value, pk), or None to start from the first page. Cursors that do not parse, or that were
+            made for a different ordering, also start from the first page.
+        """
+        if not cursor:
+            return None
+        try:
+            order_by, backwards, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if order_by != self.order_by:
+                return None
+            try:
+                value = self.queryset.model._meta.get_field(self.field).to_python(value)
+            except FieldDoesNotExist:
+                pass  # An annotation, which is compared as is
+            return bool(backwards), value, int(pk)
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            return None
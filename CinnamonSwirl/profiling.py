@@ -0,0 +1,167 @@
+import collections
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.core import signing
+from django.core.cache import caches
+from django.db import connections
+
+from App import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Profile"
+SIGNING_SALT = "CinnamonSwirl.profiling"
+
+
+class Sampler(threading.Thread):
+    """
+    | Looks at what one thread is running every interval seconds and counts each stack it sees. Nothing in the sampled
+        thread is traced, so the request runs at close to its normal speed, unlike under cProfile or debug_toolbar.
+    | Stacks are kept collapsed, outermost frame first and frames joined by ;, which is what flamegraph.pl and
+        speedscope read.
+    """
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+                self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def collapse(frame) -> str:
+    """
+    | A frame and its callers as one line of a collapsed stack.
+
+    >>> collapse(sys._getframe()).split(";")[-1]
+    'CinnamonSwirl.profiling.<module>'
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def profile_token() -> str:
+    """
+    | A value for the X-Profile header that has any profiled view profiled, for PROFILE_TOKEN_MAX_AGE seconds.
+    """
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(uuid.uuid4().hex)
+
+
+def requested(request) -> bool:
+    """
+    | Whether request asks to be profiled: with a signed X-Profile header, or with a profile query parameter from one
+        of PROFILE_STAFF_IDS.
+    """
+    token = request.headers.get(HEADER)
+    if token:
+        try:
+            signing.TimestampSigner(salt=SIGNING_SALT).unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return False
+        return True
+    user = getattr(request, 'user', None)
+    return 'profile' in request.GET and user is not None and user.is_authenticated and \
+        user.id in settings.PROFILE_STAFF_IDS
+
+
+def allowed() -> bool:
+    """
+    | Takes one of the PROFILE_RATE_LIMIT profiles allowed per minute, if any are left. Counted in the default cache,
+        so with a cache local to each worker, each worker has a limit of its own.
+    """
+    if settings.PROFILE_RATE_LIMIT <= 0:
+        return False
+    cache = caches['default']
+    key = f"profiling:minute:{int(time.time() // 60)}"
+    cache.add(key, 0, timeout=120)
+    try:
+        return cache.incr(key) <= settings.PROFILE_RATE_LIMIT
+    except ValueError:  # Evicted in between
+        return False
+
+
+class Profile:
+    """
+    | One profiled request: the sampler on the thread handling it and the time of every query it makes.
+    """
+    def __init__(self):
+        self.sampler = Sampler(threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000)
+        self.queries = []
+
+    def query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({'ms': round((time.perf_counter() - start) * 1000, 3),
+                                 'alias': context['connection'].alias, 'sql': sql})
+
+    def write(self, request, response, seconds: float) -> str:
+        """
+        | Writes the collapsed stacks to <name>.folded and the request and its queries to <name>.json in PROFILE_DIR.
+            Returns the path both start with.
+        """
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else "unmatched"
+        name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{view}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(settings.PROFILE_DIR, name)
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        with open(f"{path}.folded", "w") as file:
+            file.writelines(f"{stack} {count}\n" for stack, count in self.sampler.stacks.most_common())
+        with open(f"{path}.json", "w") as file:
+            json.dump({'method': request.method, 'path': request.get_full_path(), 'view': view,
+                       'status': response.status_code, 'total_ms': round(seconds * 1000, 3),
+                       'samples': self.sampler.samples, 'interval_ms': settings.PROFILE_INTERVAL_MS,
+                       'db_ms': round(sum(query['ms'] for query in self.queries), 3), 'queries': self.queries},
+                      file, indent=2)
+        return path
+
+
+def profiled(view):
+    """
+    | Lets a view be profiled on request. See requested and allowed. Requests that do not ask are only checked for
+        the header and query parameter.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.PROFILE_DIR or not requested(request) or not allowed():
+            return view(request, *args, **kwargs)
+        profile = Profile()
+        start = time.perf_counter()
+        profile.sampler.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.query))
+                response = view(request, *args, **kwargs)
+        finally:
+            profile.sampler.stop()
+        path = profile.write(request, response, time.perf_counter() - start)
+        logger.info(f"Profiled {request.method} {request.path} to {path}")
+        response['X-Profile-Id'] = os.path.basename(path)
+        return response
+    return wrapper
@@ -0,0 +1,408 @@
+import heapq
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, Iterator
+from dateutil import rrule
+from CinnamonSwirl import zones
+from CinnamonSwirl.caching import LRUCache
+
+from App import settings
+
+# Reminder.freq is stored as the name of the dateutil.rrule frequency constant.
+FREQUENCIES = {"YEARLY": rrule.YEARLY, "MONTHLY": rrule.MONTHLY, "WEEKLY": rrule.WEEKLY, "DAILY": rrule.DAILY,
+               "HOURLY": rrule.HOURLY, "MINUTELY": rrule.MINUTELY, "SECONDLY": rrule.SECONDLY}
+
+# Frequencies where every occurrence is a fixed distance from the last, as long as no by* field is set.
+FIXED_STEPS = {"WEEKLY": timedelta(weeks=1), "DAILY": timedelta(days=1), "HOURLY": timedelta(hours=1),
+               "MINUTELY": timedelta(minutes=1), "SECONDLY": timedelta(seconds=1)}
+
+# Frequencies that move by calendar months. These are only simple while every period has dtstart's day in it.
+MONTH_STEPS = {"YEARLY": 12, "MONTHLY": 1}
+
+# Frequencies of a day or longer. People mean these in wall clock time: a daily reminder at 9 is still at 9 after the
+# clocks change, so they are expanded in the reminder's timezone.
+CALENDAR_FREQUENCIES = ("YEARLY", "MONTHLY", "WEEKLY", "DAILY")
+
+# by* fields whose values fit in a 63 bit integer are stored as a bitmask, one bit per allowed value.
+# Negative values (counted from the end of the month) are kept above the positive ones, at NEGATIVE_BITS + abs(value).
+MASK_FIELDS = ("bymonth", "bymonthday", "byweekday", "byhour", "byminute", "bysecond")
+NEGATIVE_BITS = {"bymonthday": 31}
+# The values rrule accepts for each of the MASK_FIELDS. Fields in NEGATIVE_BITS take the same range below 0 as well.
+MASK_RANGES = {"bymonth": range(1, 13), "bymonthday": range(1, 32), "byweekday": range(0, 7), "byhour": range(0, 24),
+               "byminute": range(0, 60), "bysecond": range(0, 60)}
+
+# by* fields with ranges too wide for a bitmask are stored as a canonical comma separated list, such as "1,-1".
+LIST_FIELDS = ("bysetpos", "byyearday", "byweekno")
+
+BY_FIELDS = LIST_FIELDS + MASK_FIELDS
+
+# How far back of after a rule kept in wall clock time is walked from. No DST change moves clocks by more.
+LOCAL_LOOKBEHIND = timedelta(hours=3)
+
+
+def to_mask(values, field: str = "byweekday") -> int:
+    """
+    | Packs a list of rule values into the bitmask stored on the Reminder. Strings, as they come from a POST, are
+        accepted.
+    :raises ValueError: If a value is outside the field's range in MASK_RANGES
+
+    >>> to_mask([0, 2, 4])
+    21
+    >>> to_mask(["-1", "1"], "bymonthday")
+    4294967298
+    >>> to_mask([24], "byhour")
+    Traceback (most recent call last):
+    ...
+    ValueError: byhour only accepts values from 0 to 23, not 24
+    """
+    mask = 0
+    negative_bits = NEGATIVE_BITS.get(field, 0)
+    allowed = MASK_RANGES[field]
+    for value in values or ():
+        value = int(value)
+        if value < 0 and not negative_bits:
+            raise ValueError(f"{field} does not accept negative values")
+        if abs(value) not in allowed:
+            raise ValueError(f"{field} only accepts values from {allowed.start} to {allowed.stop - 1}, not {value}")
+        mask |= 1 << (value if value >= 0 else negative_bits - value)
+    return mask
+
+
+def from_mask(mask: int | None, field: str = "byweekday") -> list | None:
+    """
+    | Unpacks a stored bitmask back into a sorted list of rule values. Returns None for an empty mask so rrule falls
+        back to its own defaults.
+
+    >>> from_mask(21)
+    [0, 2, 4]
+    >>> from_mask(0) is None
+    True
+    """
+    if not mask:
+        return None
+    negative_bits = NEGATIVE_BITS.get(field, 0)
+    values = []
+    bit = 0
+    mask = int(mask)
+    while mask:
+        if mask & 1:
+            values.append(negative_bits - bit if negative_bits and bit > negative_bits else bit)
+        mask >>= 1
+        bit += 1
+    return sorted(values)
+
+
+def read_list(value) -> list | None:
+    """
+    | Reads one of the LIST_FIELDS, stored as "1,-1", back into a list of ints. The older "[1, -1]" format is read
+        too. Returns None for empty values so rrule falls back to its own defaults.
+
+    >>> read_list("1,-1")
+    [1, -1]
+    >>> read_list("[]") is None
+    True
+    """
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        items = [int(item) for item in value]
+    else:
+        items = [int(item) for item in str(value).strip("[]").split(',') if item.strip()]
+    return items or None
+
+
+def write_list(values) -> str | None:
+    """
+    | The canonical stored form of one of the LIST_FIELDS.
+
+    >>> write_list([1, -1])
+    '1,-1'
+    """
+    if not values:
+        return None
+    return ",".join(str(int(value)) for value in values)
+
+
+def read_by_field(reminder, field: str) -> list | None:
+    """
+    | Any by* field of a Reminder as a list of ints, or None when it is not set.
+    """
+    if field in MASK_FIELDS:
+        return from_mask(getattr(reminder, field), field)
+    return read_list(getattr(reminder, field))
+
+
+def local_zone(reminder) -> str | None:
+    """
+    | The timezone a Reminder's rule is expanded in, or None for UTC. Rules of a day or longer, and rules with hours,
+        which are stored in the reminder's own timezone, are expanded in wall clock time there, so they stay at 9
+        o'clock on both sides of a DST change. Rules that step by hours, minutes or seconds are expanded in UTC, since
+        they are about time passing, not the time on the clock.
+    """
+    if not reminder.timezone or reminder.timezone == "UTC":
+        return None
+    if reminder.freq not in CALENDAR_FREQUENCIES and not int(reminder.byhour or 0):
+        return None
+    return reminder.timezone
+
+
+def rule_start(reminder) -> datetime:
+    """
+    | The dtstart of a Reminder's rule, in the time the rule is expanded in. See local_zone.
+    """
+    zone = local_zone(reminder)
+    return reminder.dtstart if zone is None else zones.to_local(zone, reminder.dtstart)
+
+
+def rule_until(reminder) -> datetime | None:
+    """
+    | The until of a Reminder's rule, in the time the rule is expanded in, like rule_start.
+    """
+    zone = local_zone(reminder)
+    until = reminder.until or None
+    return until if zone is None or until is None else zones.to_local(zone, until)
+
+
+def rule_key(reminder) -> tuple:
+    """
+    | Everything that goes into a Reminder's rrule, normalized into something hashable. Two rows with the same key
+        expand to the same occurrences. dtstart and until are in the time the rule is expanded in, which comes last.
+    """
+    # Count and until cannot coexist in dateutil.rrule. Until wins, same as parse_reminder.
+    count = None if reminder.until or not reminder.count else int(reminder.count)
+    return ((reminder.freq, rule_start(reminder), int(reminder.interval or 1),
+             None if reminder.wkst is None else int(reminder.wkst), count, rule_until(reminder))
+            + tuple(int(getattr(reminder, field) or 0) for field in MASK_FIELDS)
+            + tuple(write_list(read_list(getattr(reminder, field))) for field in LIST_FIELDS)
+            + (local_zone(reminder),))
+
+
+@lru_cache(maxsize=4096)
+def compile_rule(key: tuple) -> rrule.rrule:
+    """
+    | Builds the dateutil.rrule for a rule_key. Cached, so reminders sharing a schedule share one compiled rule and
+        nothing is parsed twice. rrule objects are never changed after they are built, so sharing them is safe.
+    :raises ValueError: If the frequency or any rule value is not understood
+    """
+    freq_name, dtstart, interval, wkst, count, until = key[:6]
+    masks = key[6:6 + len(MASK_FIELDS)]
+    lists = key[6 + len(MASK_FIELDS):6 + len(MASK_FIELDS) + len(LIST_FIELDS)]
+    try:
+        freq = FREQUENCIES[freq_name]
+    except KeyError:
+        raise ValueError(f"Unknown frequency: {freq_name}")
+
+    kwargs = {"dtstart": dtstart, "interval": interval, "count": count, "until": until}
+    if wkst is not None:
+        kwargs["wkst"] = wkst
+    for field, mask in zip(MASK_FIELDS, masks):
+        kwargs[field] = from_mask(mask, field)
+    for field, value in zip(LIST_FIELDS, lists):
+        kwargs[field] = read_list(value)
+
+    return rrule.rrule(freq, **kwargs)
+
+
+def build_rule(reminder) -> rrule.rrule:
+    """
+    | Turns the stored columns of a Reminder into a ready to use dateutil.rrule, in the time of local_zone. Works on
+        unsaved instances too, so values coming straight from a POST (strings) are coerced here.
+    :raises ValueError: If the frequency or any rule value is not understood
+    """
+    return compile_rule(rule_key(reminder))
+
+
+# Compiled rules of saved reminders, by primary key and checked against Reminder.version.
+rule_cache = LRUCache(maxsize=settings.RULE_CACHE_SIZE)
+
+
+def rule_for(reminder) -> rrule.rrule:
+    """
+    | The compiled rule of a Reminder, shared by everything that expands it. Saved reminders are looked up by primary
+        key, and an entry only counts while its version matches the row's, so a stale rule is never handed out even
+        if an invalidation was missed. Unsaved reminders are compiled directly.
+    :raises ValueError: If the frequency or any rule value is not understood
+    """
+    if reminder.pk is None:
+        return build_rule(reminder)
+    rule = rule_cache.get(reminder.pk, version=reminder.version)
+    if rule is None:
+        rule = build_rule(reminder)
+        rule_cache.set(reminder.pk, rule, version=reminder.version)
+    return rule
+
+
+def is_simple(reminder) -> bool:
+    """
+    | True when the reminder is a plain freq + interval schedule that next_occurrence can answer with arithmetic.
+        That means no by* fields, and for MONTHLY and YEARLY a start day that exists in every period, since rrule
+        skips months without the 31st and years without February 29th.
+    """
+    if reminder.freq not in FIXED_STEPS and reminder.freq not in MONTH_STEPS:
+        return False
+    if any(read_by_field(reminder, field) is not None for field in BY_FIELDS):
+        return False
+    start = rule_start(reminder)  # The day in the time the rule is expanded in, which is not always UTC's
+    if reminder.freq == "MONTHLY":
+        return start.day <= 28
+    if reminder.freq == "YEARLY":
+        return (start.month, start.day) != (2, 29)
+    return True
+
+
+def add_months(value: datetime, months: int) -> datetime | None:
+    """
+    | Moves value by a number of months, keeping the day. Only safe for days every month has. None past year 9999,
+        which is also where rrule stops.
+
+    >>> add_months(datetime(2022, 11, 15, 9, 30), 3)
+    datetime.datetime(2023, 2, 15, 9, 30)
+    """
+    year, month = divmod(value.month - 1 + months, 12)
+    year += value.year
+    if year > datetime.max.year:
+        return None
+    return value.replace(year=year, month=month + 1)
+
+
+def simple_next_occurrence(reminder, after: datetime, inc: bool = True) -> datetime | None:
+    """
+    | Same answer as build_rule(reminder).after(after, inc), computed in constant time from dtstart. The reminder must
+        pass is_simple. Like the rule, after and the answer are in the time the rule is expanded in. See local_zone.
+    """
+    start = rule_start(reminder).replace(microsecond=0)  # rrule drops microseconds too
+    until = rule_until(reminder)
+    interval = int(reminder.interval or 1)
+
+    if reminder.freq in FIXED_STEPS:
+        step = FIXED_STEPS[reminder.freq] * interval
+        if after < start:
+            index = 0
+        else:
+            periods, remainder = divmod(after - start, step)
+            index = periods + 1 if remainder or not inc else periods
+        try:
+            occurrence = start + step * index
+        except OverflowError:
+            return None
+    else:
+        step = MONTH_STEPS[reminder.freq] * interval
+        months = (after.year - start.year) * 12 + after.month - start.month
+        index = max(months // step, 0)
+        occurrence = add_months(start, step * index)
+        if occurrence is not None and (occurrence < after or (occurrence == after and not inc)):
+            index += 1
+            occurrence = add_months(start, step * index)
+        if occurrence is None:
+            return None
+
+    # Until wins over count, same as build_rule.
+    if until:
+        if occurrence > until:
+            return None
+    elif reminder.count and index >= int(reminder.count):
+        return None
+    return occurrence
+
+
+def rebase(rule: rrule.rrule, reminder, after: datetime) -> rrule.rrule:
+    """
+    | rrule walks every period from dtstart to find anything, so a MINUTELY rule started a year ago steps through half
+        a million minutes first. This moves dtstart forward by whole intervals, to the last period that starts at or
+        before after. The periods, and every occurrence from after on, stay the same.
+    | Only fixed step frequencies can be moved this way, and only without a count, which is counted from the original
+        dtstart. after is in the time the rule is expanded in, like the rule itself.
+    """
+    step = FIXED_STEPS.get(reminder.freq)
+    if step is None or (reminder.count and not reminder.until):
+        return rule
+    start = rule_start(reminder).replace(microsecond=0)
+    if after <= start:
+        return rule
+    step *= int(reminder.interval or 1)
+    periods = (after - start) // step
+    if not periods:
+        return rule
+    return rule.replace(dtstart=start + step * periods)
+
+
+def expand(reminder, after: datetime, inc: bool = True) -> Iterator[datetime]:
+    """
+    | The occurrences of the reminder from after on, in order. Both are in the time the rule is expanded in.
+    """
+    if is_simple(reminder):
+        occurrence = simple_next_occurrence(reminder, after, inc=inc)
+        while occurrence is not None:
+            yield occurrence
+            occurrence = simple_next_occurrence(reminder, occurrence, inc=False)
+        return
+    yield from rebase(rule_for(reminder), reminder, after).xafter(after, inc=inc)
+
+
+def in_order(occurrences: Iterable[datetime]) -> Iterator[datetime]:
+    """
+    | Puts the occurrences of a schedule expanded in local time back in order. Next to a DST change, wall clock times
+        in the skipped hour come out after later ones, and can land on the same UTC time as another. None of them comes
+        out more than LOCAL_LOOKBEHIND early, so each is held back until the schedule has passed it by that
+        much. Repeats are dropped.
+
+    >>> list(in_order([datetime(2022, 3, 13, 8), datetime(2022, 3, 13, 8, 30), datetime(2022, 3, 13, 8),
+    ...                datetime(2022, 3, 13, 8, 30), datetime(2022, 3, 14, 6)]))  # doctest: +NORMALIZE_WHITESPACE
+    [datetime.datetime(2022, 3, 13, 8, 0), datetime.datetime(2022, 3, 13, 8, 30), datetime.datetime(2022, 3, 14, 6, 0)]
+    """
+    pending, last = [], None
+    for at in occurrences:
+        while pending and pending[0] <= at - LOCAL_LOOKBEHIND:
+            ready = heapq.heappop(pending)
+            if ready != last:
+                last = ready
+                yield ready
+        heapq.heappush(pending, at)
+    while pending:
+        ready = heapq.heappop(pending)
+        if ready != last:
+            last = ready
+            yield ready
+
+
+def iter_occurrences(reminder, after: datetime | None = None, inc: bool = True) -> Iterator[datetime]:
+    """
+    | Lazily yields the occurrences of the reminder from the supplied UTC time on, in order, defaulting to now. Nothing
+        is worked out before it is asked for, so taking the first few of an endless schedule is cheap. Schedules
+        expanded in local time are read LOCAL_LOOKBEHIND ahead, to put them in order. See in_order.
+    """
+    if after is None:
+        after = datetime.utcnow()
+    if local_zone(reminder) is None:
+        yield from expand(reminder, after, inc=inc)
+        return
+    yield from in_order(_local_occurrences(reminder, after, inc))
+
+
+def _local_occurrences(reminder, after: datetime, inc: bool) -> Iterator[datetime]:
+    zone = local_zone(reminder)
+    # Wall clock times next to a DST change can come out up to a few hours before the ones around them suggest, so
+    # the walk starts early and anything before after is skipped.
+    local_after = zones.to_local(zone, after) - LOCAL_LOOKBEHIND
+    for local in expand(reminder, local_after):
+        try:
+            occurrence = zones.to_utc(zone, local)
+        except OverflowError:
+            return  # Past the end of datetime, which is where rrule stops too
+        if occurrence > after or (inc and occurrence == after):
+            yield occurrence
+
+
+def next_occurrence(reminder, after: datetime | None = None, inc: bool = True) -> datetime | None:
+    """
+    | The first occurrence of the reminder at or after the supplied UTC time, defaulting to now. None if the schedule
+        has run out because of count or until. Plain interval schedules are answered with arithmetic, everything else
+        is expanded with dateutil.rrule.
+    """
+    if after is None:
+        after = datetime.utcnow()
+    if local_zone(reminder) is not None:
+        return next(iter_occurrences(reminder, after, inc=inc), None)
+    if is_simple(reminder):
+        return simple_next_occurrence(reminder, after, inc=inc)
+    return rebase(rule_for(reminder), reminder, after).after(after, inc=inc)
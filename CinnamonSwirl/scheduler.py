@@ -0,0 +1,343 @@
+import heapq
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from django.db.models import Max, Q
+
+from CinnamonSwirl import models, utils, webhooks
+
+from App import settings
+
+
+class Clock:
+    """
+    | The wall clock, in naive UTC like everything stored.
+    """
+    def now(self) -> datetime:
+        return datetime.utcnow()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class FakeClock(Clock):
+    """
+    | A clock that only moves when it is slept on or told to, so a Scheduler can be driven step by step.
+
+    >>> clock = FakeClock(datetime(2022, 12, 1, 9))
+    >>> clock.sleep(90)
+    >>> clock.now()
+    datetime.datetime(2022, 12, 1, 9, 1, 30)
+    """
+    def __init__(self, start: datetime):
+        self.current = start
+        self.slept = []
+
+    def now(self) -> datetime:
+        return self.current
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.advance(seconds)
+
+    def advance(self, seconds: float):
+        self.current += timedelta(seconds=seconds)
+
+
+class ShardLeases:
+    """
+    | Shares reminders out between run_scheduler workers. Recipients are split into buckets by recipient % buckets, and
+        each worker holds leases on an even share of the buckets in SchedulerShard. A worker only loads and claims the
+        reminders of its own buckets.
+    | Workers check in on every heartbeat. A worker that joins makes every share smaller, so the others hand back
+        their extra buckets on their next heartbeat and it picks them up. A worker that leaves hands its buckets back,
+        and one that dies simply stops renewing them until their leases run out. Whoever owns a bucket, reminders
+        themselves are still claimed with row leases, so a bucket changing hands never gets a reminder sent twice.
+    """
+    def __init__(self, name: str, buckets: int = settings.SCHEDULER_BUCKETS, ttl: int = settings.SCHEDULER_SHARD_TTL):
+        self.name = name
+        self.buckets = buckets
+        self.ttl = timedelta(seconds=ttl)
+        self.last_heartbeat = None
+        self.owned = []
+
+    @staticmethod
+    def fair_share(buckets: int, workers: int) -> int:
+        """
+        >>> ShardLeases.fair_share(64, 3)
+        22
+        """
+        return -(-buckets // max(workers, 1))
+
+    def due(self, now: datetime) -> bool:
+        # Renewing three times per ttl leaves room for a slow wake up before a lease can run out.
+        return self.last_heartbeat is None or now - self.last_heartbeat >= self.ttl / 3
+
+    def heartbeat(self, now: datetime) -> list:
+        """
+        | Checks in, renews this worker's leases, and gives back or takes buckets to get to its share. Returns the
+            buckets it owns now.
+        """
+        if self.last_heartbeat is None:
+            models.SchedulerShard.objects.bulk_create([models.SchedulerShard(bucket=bucket)
+                                                       for bucket in range(self.buckets)], ignore_conflicts=True)
+        if not models.SchedulerWorker.objects.filter(name=self.name).update(heartbeat_at=now):
+            models.SchedulerWorker.objects.create(name=self.name, heartbeat_at=now)
+        models.SchedulerWorker.objects.filter(heartbeat_at__lt=now - self.ttl * 10).delete()
+        workers = models.SchedulerWorker.objects.filter(heartbeat_at__gt=now - self.ttl).count()
+        share = self.fair_share(self.buckets, workers)
+
+        mine = models.SchedulerShard.objects.filter(owner=self.name, bucket__lt=self.buckets)
+        mine.update(leased_until=now + self.ttl)
+        owned = list(mine.order_by("bucket").values_list("bucket", flat=True))
+        if len(owned) > share:
+            mine.filter(bucket__in=owned[share:]).update(owner=None, leased_until=None)
+        elif len(owned) < share:
+            free = models.SchedulerShard.objects.filter(Q(owner__isnull=True) | Q(leased_until__lt=now),
+                                                        bucket__lt=self.buckets)
+            wanted = list(free.order_by("bucket").values_list("bucket", flat=True)[:share - len(owned)])
+            if wanted:
+                # Conditional, so two workers reaching for the same free bucket cannot both get it.
+                free.filter(bucket__in=wanted).update(owner=self.name, leased_until=now + self.ttl)
+        self.owned = list(mine.order_by("bucket").values_list("bucket", flat=True))
+        self.last_heartbeat = now
+        return self.owned
+
+    def release(self):
+        """
+        | Leaves: hands every bucket back straight away so the other workers do not have to wait for the leases to run
+            out.
+        """
+        models.SchedulerShard.objects.filter(owner=self.name).update(owner=None, leased_until=None)
+        models.SchedulerWorker.objects.filter(name=self.name).delete()
+        self.owned = []
+
+
+class Scheduler:
+    """
+    | Fires reminders itself instead of waiting for the bot to poll the dispatch API. Keeps a min-heap of the upcoming
+        next_fire_at of every reminder due within horizon and sleeps until the soonest one, for at most max_sleep
+        seconds at a time.
+    | Due reminders are claimed with the same leases as the dispatch API, so it can run next to bot shards without
+        anything being sent twice. They are sent through the pooled webhook session, several at once, then settled with
+        one acknowledge per batch, which moves them on to their next occurrence or finishes them in bulk.
+    | Only the reminders the heap says are due are claimed, by primary key, so a wake up with nothing due costs no
+        more than the refresh. Refreshing only reads the slice of the horizon that came into view and the reminders
+        whose changed_at moved on since the last refresh, so a reminder that is created, edited or finished is late by
+        max_sleep at most. A full reload every resync_seconds catches anything that slipped past, such as a change
+        committed after a later one had already been read.
+    | Due reminders that could not be claimed, because a bot shard holds them or they were edited, and ones whose send
+        failed, go back on the heap to be looked at again after max_sleep, or once a rate limit wears off.
+    | With shards, several schedulers split the reminders between them. See ShardLeases.
+    """
+    def __init__(self, send=None, clock: Clock | None = None, batch_size: int = 100,
+                 lease_seconds: int = 60, horizon: timedelta = timedelta(minutes=10), max_sleep: float = 5,
+                 resync_seconds: float = 300, workers: int = settings.WEBHOOK_POOL_SIZE,
+                 shards: ShardLeases | None = None):
+        self.send = send or webhooks.send_webhook_message
+        self.clock = clock or Clock()
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.horizon = horizon
+        self.max_sleep = max_sleep
+        self.resync_seconds = resync_seconds
+        self.workers = workers
+        self.shards = shards
+        self.stopping = False
+        self.heap = []  # (next_fire_at, pk)
+        self.scheduled = {}  # pk: next_fire_at, to tell stale heap entries apart
+        self.loaded_until = None
+        self.changed_since = None
+        self.last_resync = None
+        self.paused_until = None
+        self.delivered = 0
+
+    def schedule(self, pk: int, fire_at: datetime | None):
+        """
+        | Puts a reminder on the heap, replacing where it was before. Entries it had are left in place and skipped
+            when they come up.
+        """
+        if fire_at is None:
+            self.scheduled.pop(pk, None)
+            return
+        if self.scheduled.get(pk) != fire_at:
+            self.scheduled[pk] = fire_at
+            heapq.heappush(self.heap, (fire_at, pk))
+
+    def load(self, queryset):
+        for pk, fire_at in queryset.values_list("pk", "next_fire_at"):
+            self.schedule(pk, fire_at)
+
+    def claimable(self):
+        """
+        | The reminders this scheduler may deliver: all of them, or only those in its buckets when sharded.
+        """
+        reminders = models.Reminder.objects.all()
+        if self.shards is not None:
+            reminders = reminders.in_buckets(self.shards.owned, self.shards.buckets)
+        return reminders
+
+    def refresh(self):
+        now = self.clock.now()
+        if self.shards is not None and self.shards.due(now):
+            owned = self.shards.owned
+            if self.shards.heartbeat(now) != owned:
+                self.last_resync = None  # Different buckets, so start the heap over
+        until = now + self.horizon
+        active = self.claimable().filter(finished=False, next_fire_at__isnull=False)
+        if self.last_resync is None or (now - self.last_resync).total_seconds() >= self.resync_seconds:
+            self.heap, self.scheduled = [], {}
+            self.changed_since = models.Reminder.objects.aggregate(last=Max("changed_at"))["last"]
+            self.load(active.filter(next_fire_at__lte=until))
+            self.last_resync = now
+        else:
+            changed = self.claimable()
+            if self.changed_since is not None:
+                changed = changed.filter(changed_at__gt=self.changed_since)
+            for pk, fire_at, finished, changed_at in changed.values_list("pk", "next_fire_at", "finished",
+                                                                         "changed_at"):
+                # Edited, finished or moved past the horizon: what the heap had for it no longer counts.
+                self.schedule(pk, None if finished or fire_at is None or fire_at > until else fire_at)
+                self.changed_since = max(self.changed_since or changed_at, changed_at)
+            if until > self.loaded_until:
+                self.load(active.filter(next_fire_at__gt=self.loaded_until, next_fire_at__lte=until))
+        self.loaded_until = until
+
+    def next_wake(self) -> datetime | None:
+        """
+        | The soonest next_fire_at on the heap. Stale entries on top are dropped on the way.
+        """
+        while self.heap:
+            fire_at, pk = self.heap[0]
+            if self.scheduled.get(pk) == fire_at:
+                return fire_at
+            heapq.heappop(self.heap)
+        return None
+
+    def take_due(self, now: datetime) -> list:
+        """
+        | Takes every reminder due by now off the heap, soonest first.
+        """
+        due = []
+        while (fire_at := self.next_wake()) is not None and fire_at <= now:
+            _, pk = heapq.heappop(self.heap)
+            del self.scheduled[pk]
+            due.append(pk)
+        return due
+
+    def send_one(self, reminder) -> tuple[models.Reminder, Exception | None]:
+        try:
+            self.send(utils.reminder_signal(reminder))
+            return reminder, None
+        except requests.RequestException as error:
+            return reminder, error
+        except Exception as error:  # Anything else is a bug, but it must not lose the rest of the batch
+            logging.exception(f"Reminder {reminder.pk} could not be sent.")
+            return reminder, error
+
+    def deliver_batch(self, pks: list, executor: ThreadPoolExecutor | None = None) -> int:
+        """
+        | Claims, sends and settles the due reminders in pks. Returns how many were claimed.
+        """
+        now = self.clock.now()
+        buckets, bucket_count = (self.shards.owned, self.shards.buckets) if self.shards else (None, 1)
+        token, reminders = models.Reminder.objects.lease_due(limit=len(pks), lease_seconds=self.lease_seconds,
+                                                             now=now, buckets=buckets, bucket_count=bucket_count,
+                                                             pks=pks)
+        results = executor.map(self.send_one, reminders) if executor else map(self.send_one, reminders)
+        delivered, failed = [], []
+        for reminder, error in results:
+            if error is None:
+                delivered.append(reminder.pk)
+                continue
+            failed.append(reminder.pk)
+            logging.warning(f"Reminder {reminder.pk} failed: {error}")
+            if isinstance(error, webhooks.WebhookRateLimited):
+                self.paused_until = max(self.paused_until or now, now + timedelta(seconds=error.retry_after))
+
+        if reminders:
+            models.Reminder.objects.acknowledge(token, delivered=delivered, failed=failed, now=now)
+        self.delivered += len(delivered)
+        retry_at = self.paused_until or now + timedelta(seconds=self.max_sleep)
+        for pk in failed:
+            self.schedule(pk, retry_at)
+        # Settled reminders coming up again within the horizon go back on the heap, and so do the ones that were not
+        # claimed, at their next_fire_at as it is now. Ones that are still due are held by someone else for now.
+        unclaimed = set(pks).difference(reminder.pk for reminder in reminders)
+        if delivered or unclaimed:
+            for pk, fire_at in self.claimable().filter(pk__in=delivered + list(unclaimed), finished=False,
+                                                       next_fire_at__lte=self.loaded_until) \
+                    .values_list("pk", "next_fire_at"):
+                self.schedule(pk, fire_at if fire_at > now else retry_at)
+        return len(reminders)
+
+    def run_once(self, executor: ThreadPoolExecutor | None = None) -> int:
+        """
+        | Refreshes the heap and delivers everything on it that is due now, batch after batch. Returns how many were
+            claimed.
+        """
+        self.refresh()
+        now = self.clock.now()
+        if self.paused_until is not None and now < self.paused_until:
+            return 0
+        self.paused_until = None
+        due = self.take_due(now)
+        claimed = 0
+        for start in range(0, len(due), self.batch_size):
+            if self.paused_until is not None:
+                for pk in due[start:]:
+                    self.schedule(pk, self.paused_until)
+                break
+            claimed += self.deliver_batch(due[start:start + self.batch_size], executor)
+        return claimed
+
+    def sleep(self):
+        """
+        | Sleeps until the next reminder on the heap is due, the rate limit wears off, or max_sleep passes.
+        """
+        now = self.clock.now()
+        wake = self.next_wake()
+        if self.paused_until is not None:
+            wake = self.paused_until
+        seconds = self.max_sleep if wake is None else (wake - now).total_seconds()
+        self.clock.sleep(min(max(seconds, 0), self.max_sleep))
+
+    def stop(self):
+        """
+        | Asks run to return once the batch in hand is settled. Safe to call from a signal handler.
+        """
+        self.stopping = True
+
+    def run(self, iterations: int | None = None, close_connections=None, stop_at: datetime | None = None):
+        """
+        | Delivers reminders until stopped, for a number of wake ups, or until stop_at. close_connections is called
+            before each wake up. A wake up that fails is logged and followed by max_sleep before the next one. A
+            sharded scheduler hands its buckets back on the way out.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            count = 0
+            while not self.stopping and (iterations is None or count < iterations) and \
+                    (stop_at is None or self.clock.now() < stop_at):
+                if close_connections:
+                    close_connections()  # Long running, so do what the request cycle would do for us
+                try:
+                    self.run_once(executor)
+                except Exception:
+                    # Such as the database going away for a moment. Leases taken run out, so nothing is lost, and
+                    # the next wake up tries again.
+                    logging.exception("Delivering reminders failed.")
+                    if not self.stopping:
+                        self.clock.sleep(self.max_sleep)
+                else:
+                    if not self.stopping:
+                        self.sleep()
+                count += 1
+        finally:
+            if executor:
+                executor.shutdown()
+            if self.shards is not None:
+                self.shards.release()
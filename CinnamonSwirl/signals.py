@@ -0,0 +1,47 @@
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from .auth import user_cache
+from .fragments import reminder_fragments
+from .models import DiscordUser, Reminder
+
+
+@receiver([post_save, post_delete], sender=DiscordUser, dispatch_uid="invalidate_cached_user")
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    | Setup.next, Setup.save_preference, reset and forget all change or remove the user. Dropping the cached copy
+        here covers them, and anything added later that saves or deletes a DiscordUser.
+    """
+    user_cache.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Reminder, dispatch_uid="invalidate_reminder_table")
+def invalidate_reminder_table(sender, instance, **kwargs):
+    """
+    | Any saved or deleted reminder changes its recipient's table on the home page. Bulk update() calls do not come
+        through here and invalidate reminder_fragments themselves.
+    """
+    reminder_fragments.invalidate(instance.recipient)
+
+
+@receiver(post_delete, sender=Reminder, dispatch_uid="touch_reminder_feed")
+def touch_reminder_feed(sender, instance, **kwargs):
+    """
+    | A deleted reminder leaves no changed_at behind, so its recipient's feed is marked as changed instead. See
+        ics.feed
+    """
+    DiscordUser.objects.filter(id=instance.recipient).update(feed_changed_at=now())
+
+
+# django.contrib.auth saves last_login after every login with an extra UPDATE. DiscordUsers already have it set by
+# DiscordUserOAuth2Manager.login_from_discord, so only other user models are passed on to django's receiver.
+user_logged_in.disconnect(dispatch_uid="update_last_login")
+
+
+@receiver(user_logged_in, dispatch_uid="update_last_login")
+def update_last_login_unless_discord(sender, user, **kwargs):
+    if not isinstance(user, DiscordUser):
+        update_last_login(sender, user, **kwargs)
@@ -1,6 +1,19 @@
 import django_tables2 as tables
-import zoneinfo
-from CinnamonSwirl import models
+from django.db.models.functions import Left
+from django_tables2.data import TableListData
+from CinnamonSwirl import models, zones
+
+# The table shows this many characters of a message. Loading the whole 1024 for every row is wasted.
+MESSAGE_PREVIEW_LENGTH = 100
+
+
+class PresortedData(TableListData):
+    """
+    | Rows that the database already put in order, for example one page from pagination.KeysetPaginator.
+        django_tables2 would otherwise sort them again in python, which can disagree with the database's collation.
+    """
+    def order_by(self, aliases):
+        pass
 
 
 class RemindersTable(tables.Table):
@@ -14,7 +27,7 @@ class RemindersTable(tables.Table):
     # to select multiple rows. It would be a UI/UX nightmare to use.
     # TODO: Re-visit for front-end
     edit = tables.Column(accessor="pk", linkify=True, verbose_name="Edit")
-    message = tables.Column(accessor='message', verbose_name="Message")
+    message = tables.Column(accessor='message_preview', verbose_name="Message")
     time = tables.Column(accessor='dtstart', verbose_name="Start Time")
     timezone = tables.Column(accessor='timezone', verbose_name="Timezone")
     completed = tables.Column(accessor='finished', verbose_name="Completed")
@@ -25,21 +38,44 @@ class RemindersTable(tables.Table):
         fields = ("edit", "message", "time", "timezone", "completed")
         orderable = True
 
+    @classmethod
+    def queryset(cls, queryset):
+        """
+        | Trims a Reminder queryset down to the columns this table renders, with the message cut to a preview.
+        """
+        return queryset.only("id", "dtstart", "timezone", "finished").annotate(
+            message_preview=Left("message", MESSAGE_PREVIEW_LENGTH + 1))
+
+    @classmethod
+    def order_field(cls, alias: str | None) -> str:
+        """
+        | Turns a sort alias from the table's column headers, such as "-time", into the field to order the queryset by,
+            such as "-dtstart". Anything unknown falls back to the primary key.
+
+        >>> RemindersTable.order_field("-time")
+        '-dtstart'
+        """
+        alias = alias or "edit"
+        name = alias.lstrip("-")
+        if name not in cls.base_columns:
+            return "pk"
+        return f"{alias[:len(alias) - len(name)]}{cls.base_columns[name].accessor}"
+
+    @staticmethod
+    def render_message(value):
+        if len(value) > MESSAGE_PREVIEW_LENGTH:
+            return f"{value[:MESSAGE_PREVIEW_LENGTH]}…"
+        return value
+
     @staticmethod
     def render_time(record, value):
         """
         All times are stored as UTC in the database. This will convert UTC to the Reminder's timezone.
         """
-        utc = zoneinfo.ZoneInfo("UTC")
-        time_in_utc = value.replace(tzinfo=utc)
-        local = zoneinfo.ZoneInfo(record.timezone)
-        time_in_local = time_in_utc.astimezone(local)
-        return time_in_local.strftime("%m/%d/%Y %I:%M %p")
+        return zones.to_local(record.timezone, value).strftime("%m/%d/%Y %I:%M %p")
 
     @staticmethod
     def render_completed(record, value):
         if value:
             return "Yes"
         return "No"
-
-
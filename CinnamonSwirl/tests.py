@@ -1,9 +1,31 @@
+import collections
 import doctest
+import functools
+import io
 import os
+import signal
+import sqlite3
+import subprocess
 import sys
+import itertools
+import json
+import random
+import tempfile
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import django
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from dateutil import rrule, tz as dateutil_tz
 from selenium import webdriver
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
 from django.urls import reverse
 from django.http import HttpRequest
 
@@ -13,11 +35,17 @@ os.environ['DJANGO_SETTINGS_MODULE'] = 'App.settings'
 
 django.setup()
 
-from CinnamonSwirl import apps, auth, filters, forms, managers, models, tables, views
+# Imported after django.setup(), which the app's modules need to load.
+from CinnamonSwirl import (  # noqa: E402
+    agenda, api, apps, auth, caching, filters, forms, fragments, ics, managers, metrics, middleware, models, profiling,
+    schedule, scheduler, signals, tables, transfer, utils, views, warmup, webhooks, zones)
+from CinnamonSwirl.db import pool  # noqa: E402
+from App import settings  # noqa: E402
 
 
 def load_tests(loader, tests, ignore):
-    modules = (apps, auth, filters, forms, managers, models, tables, views)
+    modules = (agenda, api, apps, auth, caching, filters, forms, fragments, ics, managers, metrics, middleware, models,
+               profiling, schedule, scheduler, tables, transfer, utils, views, webhooks, zones)
     for module in modules:
         tests.addTests(doctest.DocTestSuite(module))
     return tests
@@ -55,6 +83,13 @@ class MockRequest(HttpRequest):
         self.user = MockUser()
 
 
+def make_user(user_id=1, **kwargs):
+    values = {'username': 'Test', 'public_flags': 0, 'flags': 0, 'locale': 'en-US', 'mfa_enabled': False,
+              'discord_tag': 'Test#0001', 'last_login': datetime.utcnow(), 'in_setup': False, 'setup_flags': 3}
+    values.update(kwargs)
+    return models.DiscordUser.objects.create(id=user_id, **values)
+
+
 class Tests(TestCase):
 
     def test_homepage(self):
@@ -74,3 +109,1832 @@ class Tests(TestCase):
         driver = webdriver.Chrome('./chromedriver')
         driver.get("http://127.0.0.1:80")
         print(driver.title)
+
+
+class NextFireAtTests(TestCase):
+
+    def test_parse_reminder_sets_next_fire_at(self):
+        views.parse_reminder(MockRequest())
+        reminder = models.Reminder.objects.get(recipient=0)
+        self.assertIsNotNone(reminder.next_fire_at)
+        self.assertGreaterEqual(reminder.next_fire_at, datetime.utcnow() - timedelta(minutes=1))
+        self.assertFalse(reminder.finished)
+
+    def test_exhausted_schedule_is_finished(self):
+        request = MockRequest()
+        request.POST.values.update({'count': '1'})
+        views.parse_reminder(request)
+        reminder = models.Reminder.objects.get(recipient=0)
+        self.assertIsNone(reminder.next_fire_at)
+        self.assertTrue(reminder.finished)
+
+    def test_due(self):
+        now = datetime.utcnow()
+        due = models.Reminder.objects.create(freq="DAILY", next_fire_at=now - timedelta(seconds=5))
+        models.Reminder.objects.create(freq="DAILY", next_fire_at=now + timedelta(hours=1))
+        models.Reminder.objects.create(freq="DAILY", next_fire_at=now - timedelta(seconds=5), finished=True)
+        self.assertEqual(list(models.Reminder.objects.due(now)), [due])
+
+    def test_backfill_next_fire_at(self):
+        start = datetime.utcnow() - timedelta(days=3, minutes=1)
+        pending = models.Reminder.objects.create(freq="DAILY", dtstart=start)
+        exhausted = models.Reminder.objects.create(freq="DAILY", dtstart=start, count=2)
+        call_command("backfill_next_fire_at", chunk_size=1, stdout=open(os.devnull, "w"))
+
+        pending.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(pending.next_fire_at, start.replace(microsecond=0) + timedelta(days=4))
+        self.assertTrue(exhausted.finished)
+        self.assertIsNone(exhausted.next_fire_at)
+
+
+@mock.patch.object(settings, "DISPATCH_API_TOKEN", "bot-secret")
+class DispatchTests(TestCase):
+
+    def setUp(self):
+        self.now = datetime.utcnow().replace(microsecond=0)
+        self.reminders = [models.Reminder.objects.create(freq="DAILY", dtstart=self.now - timedelta(days=1),
+                                                         next_fire_at=self.now - timedelta(seconds=i))
+                          for i in range(5)]
+
+    def post(self, name, body, token="bot-secret"):
+        return self.client.post(reverse(name), data=json.dumps(body), content_type="application/json", secure=True,
+                                HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_requires_token(self):
+        self.assertEqual(self.post("dispatch_claim", {}, token="wrong").status_code, 401)
+
+    def test_bad_claim_is_rejected(self):
+        for body in ({"limit": None}, {"limit": "many"}, {"lease_seconds": [1]}, {"lease_seconds": 0},
+                     {"lease_seconds": 10 ** 12}, {"lease_seconds": settings.DISPATCH_MAX_LEASE_SECONDS + 1}):
+            self.assertEqual(self.post("dispatch_claim", body).status_code, 400)
+
+    def test_claims_do_not_overlap(self):
+        first = self.post("dispatch_claim", {"limit": 3}).json()
+        second = self.post("dispatch_claim", {"limit": 3}).json()
+        first_ids = {reminder["id"] for reminder in first["reminders"]}
+        second_ids = {reminder["id"] for reminder in second["reminders"]}
+        self.assertEqual(len(first_ids), 3)
+        self.assertEqual(len(second_ids), 2)
+        self.assertFalse(first_ids & second_ids)
+        self.assertEqual(self.post("dispatch_claim", {}).json()["reminders"], [])
+
+    def test_acknowledge(self):
+        last = models.Reminder.objects.get(pk=self.reminders[0].pk)  # Claimed last, it is the least overdue
+        last.count = 1
+        last.save()
+        claim = self.post("dispatch_claim", {"limit": 10}).json()
+        ids = [reminder["id"] for reminder in claim["reminders"]]
+
+        # Select the leased rows, one bulk update, one finishing update and the savepoint around both updates
+        with self.assertNumQueries(5):
+            result = models.Reminder.objects.acknowledge(claim["lease"], delivered=ids[:4] + [last.pk])
+        self.assertEqual(result, {"advanced": 4, "finished": 1, "released": 0})
+
+        for reminder in models.Reminder.objects.filter(pk__in=ids[:4]):
+            self.assertEqual(reminder.next_fire_at, self.now + timedelta(days=1))
+            self.assertIsNone(reminder.lease_token)
+        self.assertTrue(models.Reminder.objects.get(pk=last.pk).finished)
+
+    def test_unreadable_schedule_does_not_hold_up_the_batch(self):
+        claim = self.post("dispatch_claim", {"limit": 10}).json()
+        ids = [reminder["id"] for reminder in claim["reminders"]]
+        models.Reminder.objects.filter(pk=ids[0]).update(freq="FORTNIGHTLY")
+        with self.assertLogs("CinnamonSwirl.managers", "ERROR"):
+            result = models.Reminder.objects.acknowledge(claim["lease"], delivered=ids)
+        self.assertEqual(result, {"advanced": 4, "finished": 1, "released": 0})
+        self.assertTrue(models.Reminder.objects.get(pk=ids[0]).finished)
+        self.assertFalse(models.Reminder.objects.filter(lease_token__isnull=False).exists())
+        self.assertEqual(self.post("dispatch_claim", {"limit": 10}).json()["reminders"], [])
+
+    def test_failed_are_released(self):
+        claim = self.post("dispatch_claim", {"limit": 1}).json()
+        failed = claim["reminders"][0]["id"]
+        response = self.post("dispatch_ack", {"lease": claim["lease"], "failed": [failed]})
+        self.assertEqual(response.json()["released"], 1)
+        reclaimed = self.post("dispatch_claim", {"limit": 10}).json()
+        self.assertIn(failed, [reminder["id"] for reminder in reclaimed["reminders"]])
+
+    def test_lease_taken_over_while_settling_is_kept(self):
+        claim = self.post("dispatch_claim", {"limit": 1}).json()
+        pk = claim["reminders"][0]["id"]
+        due = models.Reminder.objects.get(pk=pk).next_fire_at
+        next_occurrence = schedule.next_occurrence
+
+        def reclaimed(reminder, **kwargs):
+            # Another worker takes the lease over after the row was read but before it is written
+            models.Reminder.objects.filter(pk=pk).update(lease_token="other")
+            return next_occurrence(reminder, **kwargs)
+
+        with mock.patch.object(schedule, "next_occurrence", side_effect=reclaimed):
+            result = models.Reminder.objects.acknowledge(claim["lease"], delivered=[pk])
+        self.assertEqual(result["advanced"], 0)
+        reminder = models.Reminder.objects.get(pk=pk)
+        self.assertEqual(reminder.lease_token, "other")
+        self.assertEqual(reminder.next_fire_at, due)
+
+    def test_stale_lease_is_ignored(self):
+        claim = self.post("dispatch_claim", {"limit": 1}).json()
+        response = self.post("dispatch_ack", {"lease": "not-the-lease", "delivered": [claim["reminders"][0]["id"]]})
+        self.assertEqual(response.json()["advanced"], 0)
+
+
+class ScheduleEquivalenceTests(SimpleTestCase):
+    """
+    | The arithmetic fast path in schedule must agree with dateutil.rrule on every simple schedule.
+    """
+    # How far from dtstart to look, per frequency, so rrule itself stays quick enough to compare against.
+    spans = {"YEARLY": timedelta(days=366 * 40), "MONTHLY": timedelta(days=366 * 10), "WEEKLY": timedelta(days=800),
+             "DAILY": timedelta(days=400), "HOURLY": timedelta(days=30), "MINUTELY": timedelta(days=2),
+             "SECONDLY": timedelta(hours=2)}
+
+    def random_reminder(self, rng, freq):
+        start = datetime(2020, 1, 1) + timedelta(seconds=rng.randrange(3 * 365 * 86400),
+                                                 microseconds=rng.randrange(1000000))
+        if freq == "MONTHLY":
+            start = start.replace(day=rng.randint(2, 28))  # Still 1-28 in US/Central
+        reminder = models.Reminder(freq=freq, dtstart=start, interval=rng.choice([1, 1, 2, 3, 7, 15, 60, 100]),
+                                   timezone=rng.choice(["UTC", "US/Central"]))
+        ending = rng.random()
+        if ending < 0.3:
+            reminder.count = rng.randint(1, 50)
+        elif ending < 0.6:
+            reminder.until = start + self.spans[freq] * rng.random()
+        return reminder
+
+    def test_simple_schedules_match_rrule(self):
+        rng = random.Random(20221201)
+        for case in range(1000):
+            freq = rng.choice(list(self.spans))
+            reminder = self.random_reminder(rng, freq)
+            self.assertTrue(schedule.is_simple(reminder))
+            rule = schedule.build_rule(reminder)
+            candidates = [reminder.dtstart + self.spans[freq] * (rng.random() * 1.2 - 0.1)]
+            candidates.append(rule.after(candidates[0]) or candidates[0])  # Land exactly on an occurrence
+            for after in candidates:
+                for inc in (True, False):
+                    with self.subTest(case=case, freq=freq, after=after, inc=inc):
+                        self.assertEqual(schedule.simple_next_occurrence(reminder, after, inc=inc),
+                                         rule.after(after, inc=inc))
+
+    def test_month_ends_are_not_simple(self):
+        utc = functools.partial(models.Reminder, timezone="UTC")
+        self.assertFalse(schedule.is_simple(utc(freq="MONTHLY", dtstart=datetime(2022, 1, 31))))
+        self.assertFalse(schedule.is_simple(utc(freq="YEARLY", dtstart=datetime(2024, 2, 29))))
+        self.assertTrue(schedule.is_simple(utc(freq="YEARLY", dtstart=datetime(2022, 1, 31))))
+        # 00:30 UTC on March 1st 2024 is still February 29th in US/Central, which most years do not have
+        self.assertFalse(schedule.is_simple(models.Reminder(freq="YEARLY", dtstart=datetime(2024, 3, 1, 0, 30),
+                                                            timezone="US/Central")))
+
+    def test_by_fields_fall_back_to_rrule(self):
+        reminder = models.Reminder(freq="DAILY", dtstart=datetime(2022, 12, 1, 9), byweekday=schedule.to_mask([0, 2]))
+        self.assertFalse(schedule.is_simple(reminder))
+        self.assertEqual(schedule.next_occurrence(reminder, after=datetime(2022, 12, 1, 10)),
+                         datetime(2022, 12, 5, 9))
+
+
+class RebaseTests(SimpleTestCase):
+    """
+    | Moving dtstart forward must not change any occurrence from the point it was moved for.
+    """
+    def test_rebased_rules_match_rrule(self):
+        rng = random.Random(20221215)
+        # The field to set per frequency, and how far past dtstart to look so plain rrule stays quick enough.
+        by_fields = {"WEEKLY": ("byweekday", range(7), timedelta(days=400)),
+                     "DAILY": ("byhour", range(24), timedelta(days=60)),
+                     "HOURLY": ("byminute", range(60), timedelta(days=10)),
+                     "MINUTELY": ("bysecond", range(60), timedelta(hours=12)),
+                     "SECONDLY": ("byminute", range(60), timedelta(hours=2))}
+        for case in range(200):
+            freq = rng.choice(list(by_fields))
+            field, values, span = by_fields[freq]
+            start = datetime(2022, 1, 1) + timedelta(seconds=rng.randrange(365 * 86400))
+            reminder = models.Reminder(freq=freq, dtstart=start, timezone="UTC",
+                                       interval=rng.choice([1, 2, 3]) if freq in ("WEEKLY", "DAILY") else 1,
+                                       **{field: schedule.to_mask(rng.sample(values, rng.randint(1, 3)), field)})
+            if rng.random() < 0.3:
+                reminder.until = start + timedelta(days=rng.randint(1, 30))
+            after = start + span * rng.random()
+            with self.subTest(case=case, freq=freq, after=after):
+                expected = list(itertools.islice(schedule.build_rule(reminder).xafter(after, inc=True), 5))
+                self.assertEqual(list(itertools.islice(schedule.iter_occurrences(reminder, after), 5)), expected)
+                self.assertEqual(schedule.next_occurrence(reminder, after), expected[0] if expected else None)
+
+    def test_counted_rules_are_not_rebased(self):
+        reminder = models.Reminder(freq="DAILY", dtstart=datetime(2022, 1, 1, 9), count=3, timezone="UTC",
+                                   byhour=schedule.to_mask([9], "byhour"))
+        rule = schedule.build_rule(reminder)
+        self.assertIs(schedule.rebase(rule, reminder, datetime(2022, 6, 1)), rule)
+        self.assertEqual(list(schedule.iter_occurrences(reminder, datetime(2022, 1, 2))),
+                         [datetime(2022, 1, 2, 9), datetime(2022, 1, 3, 9)])
+
+
+class ZoneTests(SimpleTestCase):
+    """
+    | The transition tables have to agree with zoneinfo everywhere, including the hours around every change.
+    """
+    def test_matches_zoneinfo(self):
+        rng = random.Random(20221106)
+        for name in ("US/Central", "Europe/Berlin", "Australia/Lord_Howe", "Asia/Kolkata"):
+            zone = ZoneInfo(name)
+            moments = [datetime(1971, 1, 1) + timedelta(minutes=rng.randrange(130 * 365 * 1440)) for _ in range(2000)]
+            moments += [instant + timedelta(minutes=minutes) for instant in zones.transitions(name).instants[1:100]
+                        for minutes in range(-150, 151, 30)]
+            for moment in moments:
+                with self.subTest(zone=name, moment=moment):
+                    self.assertEqual(zones.to_local(name, moment),
+                                     moment.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None))
+                    self.assertEqual(zones.to_utc(name, moment),
+                                     moment.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None))
+
+    def test_outside_the_table(self):
+        self.assertEqual(zones.to_utc("US/Central", datetime(2200, 7, 1, 9)), datetime(2200, 7, 1, 14))
+        self.assertEqual(zones.to_local("US/Central", datetime(1960, 1, 1, 15)), datetime(1960, 1, 1, 9))
+
+
+class LocalHourTests(TestCase):
+    """
+    | Hours are kept in the reminder's timezone, so they stay put in local time when the clocks change.
+    """
+    def test_hours_follow_dst(self):
+        reminder = models.Reminder(freq="DAILY", dtstart=datetime(2022, 11, 4, 14), timezone="US/Central",
+                                   byhour=schedule.to_mask([9], "byhour"))
+        self.assertEqual(list(itertools.islice(schedule.iter_occurrences(reminder, datetime(2022, 11, 4)), 4)),
+                         [datetime(2022, 11, 4, 14), datetime(2022, 11, 5, 14), datetime(2022, 11, 6, 15),
+                          datetime(2022, 11, 7, 15)])
+        self.assertEqual(schedule.next_occurrence(reminder, datetime(2022, 11, 6, 14)), datetime(2022, 11, 6, 15))
+
+    def test_days_and_longer_follow_dst(self):
+        for freq, second in (("DAILY", datetime(2023, 3, 11, 15)), ("WEEKLY", datetime(2023, 3, 17, 14)),
+                             ("MONTHLY", datetime(2023, 4, 10, 14)), ("YEARLY", datetime(2024, 3, 10, 14))):
+            reminder = models.Reminder(freq=freq, dtstart=datetime(2023, 3, 10, 15), timezone="US/Central")
+            with self.subTest(freq=freq):
+                self.assertEqual(schedule.next_occurrence(reminder, datetime(2023, 3, 10, 16)), second)
+                self.assertEqual(list(itertools.islice(schedule.iter_occurrences(reminder, datetime(2023, 3, 10)), 2)),
+                                 [datetime(2023, 3, 10, 15), second])
+        daily = models.Reminder(freq="DAILY", dtstart=datetime(2023, 3, 10, 15), timezone="US/Central")
+        self.assertEqual(schedule.next_occurrence(daily, datetime(2023, 3, 12, 16)), datetime(2023, 3, 13, 14))
+        hourly = models.Reminder(freq="HOURLY", interval=24, dtstart=datetime(2023, 3, 10, 15), timezone="US/Central")
+        self.assertEqual(schedule.next_occurrence(hourly, datetime(2023, 3, 12, 16)), datetime(2023, 3, 13, 15))
+
+    def test_skipped_and_repeated_hours(self):
+        spring = models.Reminder(freq="DAILY", dtstart=datetime(2022, 3, 12, 8), timezone="US/Central",
+                                 byhour=schedule.to_mask([2], "byhour"))
+        self.assertEqual(list(itertools.islice(schedule.iter_occurrences(spring, datetime(2022, 3, 12)), 3)),
+                         [datetime(2022, 3, 12, 8), datetime(2022, 3, 13, 8), datetime(2022, 3, 14, 7)])
+        autumn = models.Reminder(freq="DAILY", dtstart=datetime(2022, 11, 5, 6), timezone="US/Central",
+                                 byhour=schedule.to_mask([1], "byhour"))
+        self.assertEqual(list(itertools.islice(schedule.iter_occurrences(autumn, datetime(2022, 11, 5)), 3)),
+                         [datetime(2022, 11, 5, 6), datetime(2022, 11, 6, 6), datetime(2022, 11, 7, 7)])
+
+    def test_next_occurrence_is_the_earliest_across_dst(self):
+        reminder = models.Reminder(freq="MINUTELY", interval=50, dtstart=datetime(2022, 3, 13, 6, 30),
+                                   timezone="US/Central", byhour=schedule.to_mask([2, 3], "byhour"))
+        self.assertEqual(schedule.next_occurrence(reminder, datetime(2022, 3, 13, 7)), datetime(2022, 3, 13, 8))
+        occurrences = list(itertools.islice(schedule.iter_occurrences(reminder, datetime(2022, 3, 13, 7)), 6))
+        self.assertEqual(occurrences, sorted(set(occurrences)))
+
+    def test_matches_zoneinfo_expansion(self):
+        rng = random.Random(20230312)
+        for case in range(100):
+            name = rng.choice(("US/Eastern", "US/Pacific", "Europe/Berlin"))
+            start = datetime(2022, 1, 1) + timedelta(seconds=rng.randrange(365 * 86400))
+            reminder = models.Reminder(freq=rng.choice(["DAILY", "WEEKLY"]), dtstart=start, timezone=name,
+                                       interval=rng.choice([1, 2]),
+                                       byhour=schedule.to_mask(rng.sample(range(24), rng.randint(1, 3)), "byhour"))
+            after = start + timedelta(days=rng.randint(0, 300), seconds=rng.randrange(86400))
+            local = rrule.rrule(schedule.FREQUENCIES[reminder.freq], interval=reminder.interval,
+                                dtstart=start.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(name)),
+                                byhour=schedule.from_mask(reminder.byhour, "byhour"))
+            walked = itertools.islice(local.xafter(after.replace(tzinfo=timezone.utc) - timedelta(hours=3)), 10)
+            expected = [occurrence for occurrence in (item.astimezone(timezone.utc).replace(tzinfo=None)
+                                                      for item in walked) if occurrence >= after][:5]
+            with self.subTest(case=case, zone=name, after=after):
+                self.assertEqual(list(itertools.islice(schedule.iter_occurrences(reminder, after), 5)), expected)
+
+    def test_form_and_api_keep_local_hours(self):
+        request = MockRequest()
+        request.POST.values.update({'schedule_units': 'DAILY', 'schedule_hours': ['9', '21']})
+        views.parse_reminder(request)
+        reminder = models.Reminder.objects.get(recipient=0)
+        self.assertEqual(schedule.from_mask(reminder.byhour, "byhour"), [9, 21])
+        self.assertEqual(api.reminder_json(reminder)['schedule_hours'], [9, 21])
+        form_request = RequestFactory().get(reverse('reminder'))
+        form_request.user, form_request.session = make_user(user_id=0), {'timezone': "US/Eastern"}
+        form = forms.ReminderForm(form_request, reminder=reminder)
+        self.assertEqual(form.fields['schedule_hours'].initial, [9, 21])
+
+
+class MigrationTests(TransactionTestCase):
+    """
+    | Runs the data migrations against rows written the way the releases before them wrote them.
+    """
+    def migrate(self, target: str):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("CinnamonSwirl", target)])
+        return executor.loader.project_state([("CinnamonSwirl", target)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_rule_masks_wrap_legacy_hours(self):
+        Reminder = self.migrate("0003_reminder_lease").get_model("CinnamonSwirl", "Reminder")
+        west = Reminder.objects.create(freq="DAILY", byhour="[24, 28]", byweekday="[0, 4]")
+        east = Reminder.objects.create(freq="DAILY", byhour="[-3]", bymonthday="[-1, 1]")
+        broken = Reminder.objects.create(freq="MINUTELY", byhour="[9]", bymonth="[13]")
+        with self.assertLogs("CinnamonSwirl.migrations.0004_reminder_rule_masks", "WARNING"):
+            Reminder = self.migrate("0004_reminder_rule_masks").get_model("CinnamonSwirl", "Reminder")
+        west, east, broken = (Reminder.objects.get(pk=reminder.pk) for reminder in (west, east, broken))
+        self.assertEqual(schedule.from_mask(west.byhour, "byhour"), [0, 4])
+        self.assertEqual(schedule.from_mask(west.byweekday, "byweekday"), [0, 4])
+        self.assertEqual(schedule.from_mask(east.byhour, "byhour"), [21])
+        self.assertEqual(schedule.from_mask(east.bymonthday, "bymonthday"), [-1, 1])
+        self.assertFalse(west.finished or east.finished)
+        self.assertTrue(broken.finished)
+
+    def test_local_hours_keep_unwrapped_hours(self):
+        # Releases before 0004 wrapped neither way, so 18:00 and 22:00 in UTC-6 were saved as 24 and 28.
+        Reminder = self.migrate("0008_scheduler_shards").get_model("CinnamonSwirl", "Reminder")
+        evening = Reminder.objects.create(freq="MINUTELY", timezone="America/Regina", byhour=1 << 24 | 1 << 28)
+        morning = Reminder.objects.create(freq="HOURLY", timezone="America/Regina", byhour=1 << 15)
+        Reminder = self.migrate("0009_reminder_local_hours").get_model("CinnamonSwirl", "Reminder")
+        self.assertEqual(schedule.from_mask(Reminder.objects.get(pk=evening.pk).byhour, "byhour"), [18, 22])
+        self.assertEqual(schedule.from_mask(Reminder.objects.get(pk=morning.pk).byhour, "byhour"), [9])
+
+
+class RuleStorageTests(TestCase):
+
+    def test_parse_reminder_stores_masks(self):
+        request = MockRequest()
+        request.POST.values.update({'schedule_units': 'DAILY', 'schedule_days': ['0', '4']})
+        views.parse_reminder(request)
+        reminder = models.Reminder.objects.get(recipient=0)
+        self.assertEqual(schedule.from_mask(reminder.byweekday, "byweekday"), [0, 4])
+        self.assertEqual(reminder.byhour, 0)
+
+    def test_matching_rule(self):
+        monday_nine = models.Reminder.objects.create(byweekday=schedule.to_mask([0, 3]),
+                                                     byhour=schedule.to_mask([9, 17], "byhour"))
+        models.Reminder.objects.create(byweekday=schedule.to_mask([0]), byhour=schedule.to_mask([10], "byhour"))
+        models.Reminder.objects.create(byweekday=schedule.to_mask([1]), byhour=schedule.to_mask([9], "byhour"))
+        self.assertEqual(list(models.Reminder.objects.matching_rule(byweekday=0, byhour=9)), [monday_nine])
+
+    def test_compiled_rules_are_shared(self):
+        hours = schedule.to_mask([9, 21], "byhour")
+        first = models.Reminder(freq="DAILY", dtstart=datetime(2022, 12, 1, 9), byhour=hours)
+        second = models.Reminder(freq="DAILY", dtstart=datetime(2022, 12, 1, 9), byhour=hours,
+                                 message="Different message, same schedule")
+        self.assertIs(schedule.build_rule(first), schedule.build_rule(second))
+        self.assertEqual(schedule.build_rule(first).after(datetime(2022, 12, 1, 10)), datetime(2022, 12, 1, 21))
+
+
+class RuleCacheTests(TestCase):
+
+    def setUp(self):
+        schedule.rule_cache.clear()
+        self.reminder = models.Reminder.objects.create(freq="DAILY", dtstart=datetime(2022, 12, 1, 9), recipient=0,
+                                                       byweekday=schedule.to_mask([0]))
+
+    def test_hits_until_the_version_changes(self):
+        hits, misses = schedule.rule_cache.stats.hits, schedule.rule_cache.stats.misses
+        first = schedule.rule_for(self.reminder)
+        self.assertIs(schedule.rule_for(self.reminder), first)
+        self.assertEqual((schedule.rule_cache.stats.hits - hits, schedule.rule_cache.stats.misses - misses), (1, 1))
+
+        self.reminder.byweekday = schedule.to_mask([1])
+        self.reminder.save()
+        self.assertEqual(self.reminder.version, 1)
+        self.assertEqual(list(schedule.rule_for(self.reminder)._byweekday), [1])
+
+    def test_parse_reminder_invalidates(self):
+        schedule.rule_for(self.reminder)
+        request = MockRequest()
+        request.POST.values.update({'reminder_id': str(self.reminder.pk)})
+        views.parse_reminder(request)
+        self.assertEqual(len(schedule.rule_cache), 0)
+        self.assertEqual(models.Reminder.objects.get(pk=self.reminder.pk).version, 1)
+
+    def test_bounded(self):
+        cache = caching.LRUCache(maxsize=2)
+        for key in range(3):
+            cache.set(key, key)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(0))
+
+    def test_ttl(self):
+        now = [0.0]
+        cache = caching.LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        cache.set("key", "value")
+        now[0] = 9.0
+        self.assertEqual(cache.get("key"), "value")
+        now[0] = 11.0
+        self.assertIsNone(cache.get("key"))
+
+
+@mock.patch.object(settings, "REMINDERS_PAGE_SIZE", 4)
+class HomePaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_login(self.user)
+        start = datetime(2022, 12, 1, 9)
+        # Pairs of reminders share a start time, so ties have to be broken by primary key.
+        self.reminders = [models.Reminder.objects.create(recipient=self.user.id, message=f"Reminder {i}",
+                                                         dtstart=start + timedelta(days=i // 2)) for i in range(10)]
+        models.Reminder.objects.create(recipient=2, message="Somebody else's")
+
+    @staticmethod
+    def listed(response) -> list:
+        return [int(pk) for pk in re.findall(r'reminder\?id=(\d+)', response.context['table_html'])]
+
+    def walk(self, **params):
+        pages, response = [], self.client.get('/', params, secure=True)
+        while True:
+            pages.append(self.listed(response))
+            if not response.context['next_page']:
+                return pages, response
+            response = self.client.get(f"/{response.context['next_page']}", secure=True)
+
+    def test_pages_forwards_and_back(self):
+        pages, response = self.walk()
+        self.assertEqual(pages, [[r.pk for r in self.reminders[i:i + 4]] for i in (0, 4, 8)])
+
+        back = []
+        while response.context['previous_page']:
+            response = self.client.get(f"/{response.context['previous_page']}", secure=True)
+            back.append(self.listed(response))
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_sorted_descending(self):
+        pages, _ = self.walk(sort='-time')
+        expected = [r.pk for r in sorted(self.reminders, key=lambda r: (r.dtstart, r.pk), reverse=True)]
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_long_messages_are_trimmed(self):
+        self.reminders[0].message = "x" * 1000
+        self.reminders[0].save()
+        response = self.client.get('/', secure=True)
+        self.assertContains(response, f"{'x' * 100}…")
+        self.assertNotContains(response, "x" * 101)
+
+    def test_bad_cursor_starts_over(self):
+        response = self.client.get('/', {'cursor': 'not-a-cursor'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.listed(response)), 4)
+
+
+class StubWebhook(BaseHTTPRequestHandler):
+    """
+    | Stands in for a Discord webhook. Records what was posted and answers with the next queued status code, 204 once
+        the queue is empty. A 429 asks for a 30 second wait.
+    """
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real thing
+    received = []
+    statuses = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        status = self.statuses.pop(0) if self.statuses else 204
+        if status == 204:
+            self.received.append(body['content'])
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '30')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookOutboxTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubWebhook)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/api/webhooks/1/token"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubWebhook.received = []
+        StubWebhook.statuses = []
+        patcher = mock.patch.object(settings, "DISCORD_WEBHOOK_URL", self.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_setup_queues_instead_of_sending(self):
+        user = make_user(in_setup=True, setup_flags=2)
+        self.client.force_login(user)
+        self.client.get(reverse('setup'), secure=True)
+        self.client.get(reverse('setup'), secure=True)
+        self.assertEqual(StubWebhook.received, [])
+        self.assertEqual(models.WebhookOutbox.objects.filter(message=f"test:{user.id}").count(), 2)
+
+    def test_duplicates_are_coalesced(self):
+        for message in ("test:1", "channel:1", "test:1", "test:2", "test:1"):
+            utils.queue_webhook_message(message)
+        settled = webhooks.WebhookDispatcher().drain_once(now=datetime.utcnow() + timedelta(seconds=1))
+        self.assertEqual(settled, 5)
+        self.assertEqual(StubWebhook.received, ["test:1", "channel:1", "test:2"])
+        self.assertFalse(models.WebhookOutbox.objects.exists())
+
+    def test_failures_back_off_and_retry(self):
+        utils.queue_webhook_message("test:1")
+        StubWebhook.statuses = [500, 500]
+        dispatcher = webhooks.WebhookDispatcher(base_delay=5)
+        now = datetime.utcnow() + timedelta(seconds=1)
+
+        self.assertEqual(dispatcher.drain_once(now=now), 0)
+        row = models.WebhookOutbox.objects.get()
+        self.assertEqual((row.attempts, row.next_attempt_at), (1, now + timedelta(seconds=5)))
+        self.assertEqual(dispatcher.drain_once(now=now + timedelta(seconds=4)), 0)  # Still backing off
+
+        dispatcher.drain_once(now=now + timedelta(seconds=5))
+        self.assertEqual(models.WebhookOutbox.objects.get().next_attempt_at, now + timedelta(seconds=15))
+        dispatcher.drain_once(now=now + timedelta(seconds=15))
+        self.assertEqual(StubWebhook.received, ["test:1"])
+        self.assertFalse(models.WebhookOutbox.objects.exists())
+
+    def test_rate_limits_are_respected(self):
+        utils.queue_webhook_message("test:1")
+        StubWebhook.statuses = [429]
+        now = datetime.utcnow() + timedelta(seconds=1)
+        webhooks.WebhookDispatcher(base_delay=1).drain_once(now=now)
+        self.assertEqual(models.WebhookOutbox.objects.get().next_attempt_at, now + timedelta(seconds=30))
+
+    def test_malformed_retry_after_is_not_fatal(self):
+        utils.queue_webhook_message("test:1")
+        session = mock.Mock()
+        session.post.return_value = mock.Mock(status_code=429, headers={'Retry-After': "in a while"})
+        now = datetime.utcnow() + timedelta(seconds=1)
+        with mock.patch.object(webhooks, "webhook_session", return_value=session):
+            webhooks.WebhookDispatcher(base_delay=5).drain_once(now=now)
+        self.assertEqual(models.WebhookOutbox.objects.get().next_attempt_at, now + timedelta(seconds=5))
+
+    def test_gives_up_eventually(self):
+        utils.queue_webhook_message("test:1")
+        StubWebhook.statuses = [500]
+        webhooks.WebhookDispatcher(max_attempts=1).drain_once(now=datetime.utcnow() + timedelta(seconds=1))
+        self.assertFalse(models.WebhookOutbox.objects.exists())
+
+    def test_a_failed_batch_does_not_stop_the_command(self):
+        batches = [OperationalError("database is locked"), 1, 0, KeyboardInterrupt()]
+        with mock.patch.object(webhooks.WebhookDispatcher, "drain_once", side_effect=batches) as drain_once, \
+                mock.patch("time.sleep") as sleep, self.assertLogs(level="ERROR"), self.assertRaises(KeyboardInterrupt):
+            call_command("dispatch_webhooks", poll_interval=2)
+        self.assertEqual(drain_once.call_count, 4)
+        self.assertEqual(sleep.call_args_list, [mock.call(2), mock.call(2)])
+
+    def test_session_is_reused(self):
+        self.assertIs(webhooks.webhook_session(), webhooks.webhook_session())
+
+
+class UserCacheTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        # As if the default cache were memcached or redis, shared by every worker
+        patchers = [mock.patch.object(auth.user_cache, "alias", 'default'),
+                    mock.patch.object(auth, "is_shared", return_value=True)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = make_user(in_setup=True, setup_flags=0)
+        self.backend = auth.DiscordAuthenticationBackend()
+
+    def test_second_lookup_is_cached(self):
+        hits = auth.user_cache.stats.hits
+        with self.assertNumQueries(1):
+            first = self.backend.get_user(self.user.id)
+            second = self.backend.get_user(self.user.id)
+        self.assertEqual(auth.user_cache.stats.hits - hits, 1)
+        self.assertEqual(second.discord_tag, self.user.discord_tag)
+        self.assertIsNot(first, second)  # Every request gets its own instance to change
+
+    def test_saves_invalidate(self):
+        self.backend.get_user(self.user.id)
+        self.client.force_login(self.user)
+        self.client.post(reverse('setup'), {'guild_join_confirmation': True}, secure=True)  # Setup.next
+        self.assertEqual(self.backend.get_user(self.user.id).setup_flags, 1)
+        self.client.get(reverse('reset'), secure=True)
+        self.assertEqual(self.backend.get_user(self.user.id).setup_flags, 0)
+
+    def test_forget_invalidates(self):
+        self.backend.get_user(self.user.id)
+        self.client.force_login(self.user)
+        self.client.get(reverse('forget'), secure=True)
+        self.assertIsNone(self.backend.get_user(self.user.id))
+
+    def test_cached_in_the_process_without_a_shared_alias(self):
+        cache = auth.UserCache(alias=None, ttl=30)
+        cache.set(self.user)
+        self.assertEqual(cache.get(self.user.id).username, self.user.username)
+        cache.invalidate(str(self.user.id))  # As the session hands it over
+        self.assertIsNone(cache.get(self.user.id))
+        self.assertEqual(cache.stats.as_dict(), {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+        with mock.patch.object(auth, "is_shared", caching.is_shared):
+            self.assertFalse(auth.UserCache(alias='default').shared)
+
+    def test_shared_alias_carries_invalidations_to_every_worker(self):
+        first, second = auth.UserCache(alias='default'), auth.UserCache(alias='default')
+        first.set(self.user, first.generation(self.user.id))
+        self.assertIsNotNone(first.get(self.user.id, first.generation(self.user.id)))
+        second.invalidate(self.user.id)
+        self.assertIsNone(first.get(self.user.id, first.generation(self.user.id)))
+
+    def test_user_loaded_during_a_change_is_not_served(self):
+        generation = auth.user_cache.generation(self.user.id)
+        auth.user_cache.invalidate(self.user.id)  # Another worker saves the user while this one reads the old row
+        auth.user_cache.set(self.user, generation)
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.user.id)
+
+    def test_setup_saves_only_what_it_changes(self):
+        self.client.force_login(self.user)
+        # Changed through another worker since this request loaded the user
+        models.DiscordUser.objects.filter(pk=self.user.pk).update(message_preference=True, username="Renamed")
+        with mock.patch.object(auth.user_cache, "get", return_value=self.user):
+            self.client.post(reverse('setup'), {'guild_join_confirmation': True}, secure=True)
+        user = models.DiscordUser.objects.get(pk=self.user.pk)
+        self.assertEqual((user.setup_flags, user.message_preference, user.username), (1, True, "Renamed"))
+
+
+def discord_profile(user_id=1, **kwargs):
+    profile = {'id': user_id, 'username': 'Test', 'discriminator': '0001', 'avatar': None, 'public_flags': 0,
+               'flags': 0, 'locale': 'en-US', 'mfa_enabled': False}
+    profile.update(kwargs)
+    return profile
+
+
+class LoginTests(TestCase):
+
+    def setUp(self):
+        self.backend = auth.DiscordAuthenticationBackend()
+
+    @mock.patch.object(settings, "REGISTRATIONS_ENABLED", True)
+    def test_registers_in_one_query(self):
+        with self.assertNumQueries(1):
+            user = self.backend.authenticate(None, user=discord_profile())
+        self.assertEqual(user.pk, 1)
+        self.assertEqual(models.DiscordUser.objects.get(pk=1).discord_tag, "Test#0001")
+
+    @mock.patch.object(settings, "REGISTRATIONS_ENABLED", True)
+    def test_refreshes_profile_in_one_query(self):
+        make_user(last_login=datetime(2022, 1, 1))
+        with self.assertNumQueries(1):
+            self.backend.authenticate(None, user=discord_profile(username="Renamed", avatar="abc"))
+        user = models.DiscordUser.objects.get(pk=1)
+        self.assertEqual((user.username, user.avatar, user.discord_tag), ("Renamed", "abc", "Renamed#0001"))
+        self.assertGreater(user.last_login, datetime(2022, 1, 1))
+        self.assertEqual(user.setup_flags, 3)  # Setup progress is not touched
+
+    @mock.patch.object(settings, "REGISTRATIONS_ENABLED", False)
+    def test_closed_registrations(self):
+        self.assertIsNone(self.backend.authenticate(None, user=discord_profile()))
+        self.assertFalse(models.DiscordUser.objects.exists())
+        make_user()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.authenticate(None, user=discord_profile(username="Renamed")).pk, 1)
+        self.assertEqual(models.DiscordUser.objects.get(pk=1).username, "Renamed")
+
+    @mock.patch.object(settings, "REGISTRATIONS_ENABLED", True)
+    def test_without_upsert_support(self):
+        with mock.patch.object(connection.features, "supports_update_conflicts", False):
+            self.backend.authenticate(None, user=discord_profile())
+            self.backend.authenticate(None, user=discord_profile(username="Renamed"))
+        self.assertEqual(models.DiscordUser.objects.get(pk=1).username, "Renamed")
+
+    @mock.patch.object(settings, "REGISTRATIONS_ENABLED", True)
+    def test_login_redirect(self):
+        make_user(in_setup=True, setup_flags=0)
+        auth.user_cache.get(1)
+        with mock.patch.object(views, "exchange_code", return_value=discord_profile(username="Renamed")):
+            response = self.client.get(reverse('discord_login_redirect'), {'code': 'abc'}, secure=True)
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), 1)
+        self.assertEqual(self.backend.get_user(1).username, "Renamed")
+
+
+class ReminderFormCacheTests(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get(reverse('reminder'))
+        self.request.user, self.request.session = make_user(), {'timezone': "US/Eastern"}
+
+    def test_static_parts_are_shared(self):
+        first, second = forms.ReminderForm(request=self.request), forms.ReminderForm(request=self.request)
+        self.assertIs(first.helper, second.helper)
+        self.assertEqual(len(first.helper.inputs), 1)
+        self.assertEqual(first.fields['count'].choices[0], (None, "Forever"))
+        first.fields['count'].choices.pop(0)  # Changing one form's choices leaves the others alone
+        self.assertEqual(second.fields['count'].choices[0], (None, "Forever"))
+
+    def test_timezone_labels_follow_the_minute(self):
+        first = forms.timezone_choices(datetime(2022, 12, 1, 15, 0, 1))
+        self.assertEqual(first[0], ("US/Eastern", "US/Eastern (10:00)"))
+        self.assertIs(forms.timezone_choices(datetime(2022, 12, 1, 15, 0, 59)), first)
+        self.assertEqual(forms.timezone_choices(datetime(2022, 12, 1, 15, 1))[0], ("US/Eastern", "US/Eastern (10:01)"))
+
+
+class ReminderTableCacheTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        patcher = mock.patch.object(fragments, "is_shared", return_value=True)  # As if it were memcached or redis
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = make_user()
+        self.client.force_login(self.user)
+        self.reminder = models.Reminder.objects.create(recipient=self.user.id, message="First",
+                                                       dtstart=datetime(2022, 12, 1, 9))
+
+    def home(self):
+        return self.client.get('/', secure=True).context['table_html']
+
+    def test_second_visit_is_cached(self):
+        stats = fragments.reminder_fragments.stats
+        hits, misses = stats.hits, stats.misses
+        first = self.home()
+        self.assertEqual(self.home(), first)
+        self.client.get('/', {'sort': '-time'}, secure=True)  # A different sort is a different fragment
+        self.assertEqual((stats.hits - hits, stats.misses - misses), (1, 2))
+
+    def test_saves_and_deletes_invalidate(self):
+        self.home()
+        second = models.Reminder.objects.create(recipient=self.user.id, message="Second")
+        self.assertIn("Second", self.home())
+        second.delete()
+        self.assertNotIn("Second", self.home())
+        models.Reminder.objects.create(recipient=2, message="Somebody else's")
+        hits = fragments.reminder_fragments.stats.hits
+        self.home()
+        self.assertEqual(fragments.reminder_fragments.stats.hits, hits + 1)
+
+    def test_bulk_updates_invalidate(self):
+        self.home()
+        request = MockRequest()
+        request.user = self.user
+        request.POST.values.update({'reminder_id': str(self.reminder.pk), 'recipient': self.user.id,
+                                    'message': "Edited"})
+        views.parse_reminder(request)
+        self.assertIn("Edited", self.home())
+
+        self.reminder.refresh_from_db()
+        self.reminder.count = 1
+        self.reminder.save()
+        token, _ = models.Reminder.objects.lease_due(limit=10, lease_seconds=60, now=datetime(2030, 1, 1))
+        self.home()
+        models.Reminder.objects.acknowledge(token, delivered=[self.reminder.pk], now=datetime(2030, 1, 1))
+        self.assertIn(">Yes</td>", self.home())
+
+    def test_lost_generation_never_repeats(self):
+        cache = fragments.FragmentCache(prefix="test")
+        before = cache.generation(1)
+        cache.invalidate(1)
+        caches['default'].delete(cache.generation_key(1))
+        self.assertGreater(cache.generation(1), before + 1)
+
+    def test_kept_briefly_in_a_cache_local_to_each_worker(self):
+        with mock.patch.object(fragments, "is_shared", caching.is_shared):
+            self.assertEqual(fragments.reminder_fragments.timeout, settings.TABLE_CACHE_LOCAL_TTL)
+            first = self.home()
+            models.Reminder.objects.filter(pk=self.reminder.pk).update(message="Changed elsewhere")
+            self.assertEqual(self.home(), first)  # Until the local ttl runs out, like a worker that did not change it
+            fragments.reminder_fragments.invalidate(self.user.id)
+            self.assertNotEqual(self.home(), first)
+        self.assertEqual(fragments.reminder_fragments.timeout, settings.TABLE_CACHE_TTL)
+
+    @mock.patch.object(settings, "DISPATCH_API_TOKEN", "secret")
+    def test_stats_endpoint(self):
+        response = self.client.get(reverse('cache_stats'), HTTP_AUTHORIZATION="Bearer secret", secure=True)
+        self.assertEqual(set(response.json()), {'reminder_fragments', 'users', 'rules'})
+        self.assertEqual(self.client.get(reverse('cache_stats'), secure=True).status_code, 401)
+
+
+class ReminderApiTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = make_user()
+        self.client.force_login(self.user)
+        self.fields = {'message': "Stand up", 'timezone': "US/Eastern", 'startDate': "2022-12-01", 'startTime': "09:00",
+                       'schedule_interval': 1, 'schedule_units': "WEEKLY", 'count': None, 'schedule_days': [0, 2],
+                       'schedule_hours': [9], 'schedule_end_date': None, 'schedule_end_time': None}
+
+    def send(self, method, path, body=None, **headers):
+        return getattr(self.client, method)(path, json.dumps(body), content_type='application/json', secure=True,
+                                            **headers)
+
+    def test_create_read_round_trip(self):
+        response = self.send('post', reverse('api_reminders'), self.fields)
+        self.assertEqual(response.status_code, 201)
+        created = response.json()
+        self.assertEqual({key: created[key] for key in self.fields}, self.fields)
+        self.assertEqual(models.Reminder.objects.get(pk=created['id']).recipient, self.user.id)
+
+        detail = self.client.get(response['Location'], secure=True)
+        self.assertEqual(detail.json(), created)
+        self.assertEqual(detail['ETag'], f'"{created["id"]}-0"')
+
+    def test_validation_matches_the_form(self):
+        self.assertEqual(self.send('post', reverse('api_reminders'), {'message': "Missing the rest"}).status_code, 400)
+        self.fields['startDate'] = "not a date"
+        self.assertEqual(self.send('post', reverse('api_reminders'), self.fields).status_code, 400)
+        self.assertEqual(self.send('post', reverse('api_reminders'), ["not", "an", "object"]).status_code, 400)
+
+    def test_list_is_scoped_and_conditional(self):
+        mine = models.Reminder.objects.create(recipient=self.user.id, message="Mine")
+        models.Reminder.objects.create(recipient=2, message="Somebody else's")
+        response = self.client.get(reverse('api_reminders'), secure=True)
+        self.assertEqual([row['id'] for row in response.json()['reminders']], [mine.pk])
+
+        with self.assertNumQueries(2):  # The session, then the ids and versions. The user is cached since the first
+            unchanged = self.client.get(reverse('api_reminders'), HTTP_IF_NONE_MATCH=response['ETag'], secure=True)
+        self.assertEqual(unchanged.status_code, 304)
+
+        mine.message = "Changed"
+        mine.save()
+        changed = self.client.get(reverse('api_reminders'), HTTP_IF_NONE_MATCH=response['ETag'], secure=True)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_pages(self):
+        ids = [models.Reminder.objects.create(recipient=self.user.id).pk for _ in range(5)]
+        first = self.client.get(reverse('api_reminders'), {'limit': 3}, secure=True).json()
+        second = self.client.get(reverse('api_reminders'), {'limit': 3, 'cursor': first['next']}, secure=True).json()
+        self.assertEqual([row['id'] for row in first['reminders'] + second['reminders']], ids)
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(reverse('api_reminders'), {'limit': 0}, secure=True).status_code, 400)
+
+    def test_update_needs_the_current_version(self):
+        created = self.send('post', reverse('api_reminders'), self.fields)
+        path, etag = created['Location'], created['ETag']
+        self.fields['message'] = "Sit down"
+        updated = self.send('put', path, self.fields, HTTP_IF_MATCH=etag)
+        self.assertEqual((updated.status_code, updated.json()['message']), (200, "Sit down"))
+        self.assertEqual(self.send('put', path, self.fields, HTTP_IF_MATCH=etag).status_code, 412)
+        self.assertEqual(self.client.delete(path, HTTP_IF_MATCH=etag, secure=True).status_code, 412)
+        self.assertEqual(self.client.delete(path, HTTP_IF_MATCH=updated['ETag'], secure=True).status_code, 204)
+        self.assertEqual(self.client.get(path, secure=True).status_code, 404)
+
+    def test_other_users_reminders_are_not_found(self):
+        theirs = models.Reminder.objects.create(recipient=2, message="Somebody else's")
+        path = reverse('api_reminder', args=[theirs.pk])
+        self.assertEqual(self.client.get(path, secure=True).status_code, 404)
+        self.assertEqual(self.send('put', path, self.fields).status_code, 404)
+        self.assertEqual(self.client.delete(path, secure=True).status_code, 404)
+        self.assertEqual(models.Reminder.objects.get(pk=theirs.pk).message, "Somebody else's")
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_reminders'), secure=True).status_code, 401)
+
+    def test_out_of_range_schedules_are_rejected(self):
+        for field, values in (('schedule_days', [7]), ('schedule_days', [-1]), ('schedule_hours', [24]),
+                              ('schedule_hours', ["-3"])):
+            with self.subTest(field=field, values=values):
+                response = self.send('post', reverse('api_reminders'), dict(self.fields, **{field: values}))
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.Reminder.objects.exists())
+
+    def test_unknown_timezones_are_rejected(self):
+        for name in ("Mars/Olympus", "localtime", "../etc/passwd", ["UTC"]):
+            self.fields['timezone'] = name
+            self.assertEqual(self.send('post', reverse('api_reminders'), self.fields).status_code, 400)
+        self.assertFalse(models.Reminder.objects.exists())
+
+    @mock.patch.object(settings, "DISPATCH_API_TOKEN", "bot-secret")
+    def test_bot_acts_for_the_named_recipient(self):
+        self.client.logout()
+        path = f"{reverse('api_reminders')}?recipient=5"
+        created = self.send('post', path, self.fields, HTTP_AUTHORIZATION="Bearer bot-secret")
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(models.Reminder.objects.get(pk=created.json()['id']).recipient, 5)
+        models.Reminder.objects.create(recipient=self.user.id, message="Not theirs")
+
+        listed = self.client.get(path, secure=True, HTTP_AUTHORIZATION="Bearer bot-secret").json()
+        self.assertEqual([row['id'] for row in listed['reminders']], [created.json()['id']])
+        detail = f"{created['Location']}?recipient={self.user.id}"
+        self.assertEqual(self.client.get(detail, secure=True, HTTP_AUTHORIZATION="Bearer bot-secret").status_code,
+                         404)
+
+        self.assertEqual(self.client.get(path, secure=True, HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        self.assertEqual(self.client.get(reverse('api_reminders'), secure=True,
+                                         HTTP_AUTHORIZATION="Bearer bot-secret").status_code, 400)
+
+    def test_sessions_still_need_the_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse('api_reminders'), json.dumps(self.fields), content_type='application/json',
+                               secure=True)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(client.get(reverse('api_reminders'), secure=True).status_code, 200)
+
+    def test_smaller_than_the_html_table(self):
+        for i in range(25):
+            models.Reminder.objects.create(recipient=self.user.id, message=f"Reminder {i}")
+        html = self.client.get('/', secure=True).content
+        api = self.client.get(reverse('api_reminders'), secure=True).content
+        self.assertLess(len(api), len(html))
+
+
+class TransferTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = make_user()
+        self.other = make_user(user_id=2)
+        self.client.force_login(self.user)
+        self.rows = [{'message': f'Reminder {i}, with "quotes"\nand a second line', 'timezone': "US/Central",
+                      'startDate': "2022-12-01", 'startTime': f"{9 + i:02}:30", 'schedule_interval': i + 1,
+                      'schedule_units': "DAILY", 'count': 3, 'schedule_days': [0, 4] if i % 2 else [],
+                      'schedule_hours': [], 'schedule_end_date': None, 'schedule_end_time': None} for i in range(5)]
+
+    def import_rows(self, user_id, rows, chunk_size=2):
+        lines = [json.dumps(row) for row in rows]
+        importer = transfer.ReminderImporter(user_id=user_id, chunk_size=chunk_size)
+        return importer.run(transfer.read_rows(lines, "ndjson"))
+
+    def exported(self, user_id, export_format, chunk_size=2000):
+        queryset = models.Reminder.objects.filter(recipient=user_id)
+        return "".join(transfer.export_reminders(queryset, export_format, chunk_size=chunk_size))
+
+    def comparable(self, rows):
+        return [{key: row[key] for key in self.rows[0]} for row in rows]
+
+    def test_import_then_export(self):
+        self.assertEqual(self.import_rows(self.user.id, self.rows), {'created': 5, 'failed': 0, 'errors': []})
+        lines = self.exported(self.user.id, "ndjson").splitlines()
+        self.assertEqual(self.comparable(json.loads(line) for line in lines), self.rows)
+
+    def test_csv_round_trip(self):
+        self.import_rows(self.user.id, self.rows)
+        exported = self.exported(self.user.id, "csv")
+        result = transfer.ReminderImporter(user_id=self.other.id).run(
+            transfer.read_rows(exported.splitlines(keepends=True), "csv"))
+        self.assertEqual(result['created'], 5)
+        lines = self.exported(self.other.id, "ndjson").splitlines()
+        self.assertEqual(self.comparable(json.loads(line) for line in lines), self.rows)
+
+    def test_export_reads_in_chunks(self):
+        self.import_rows(self.user.id, self.rows)
+        with self.assertNumQueries(4):  # Three chunks of two, then the empty one that ends it
+            self.exported(self.user.id, "ndjson", chunk_size=2)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        rows = [json.dumps(self.rows[0]), "not json", json.dumps({**self.rows[1], 'timezone': "Mars/Olympus"}),
+                json.dumps({'message': "Missing the rest"}), "", json.dumps(self.rows[2])]
+        result = transfer.ReminderImporter(user_id=self.user.id).run(transfer.read_rows(rows, "ndjson"))
+        self.assertEqual((result['created'], result['failed']), (2, 3))
+        self.assertEqual([error['line'] for error in result['errors']], [2, 3, 4])
+        self.assertEqual(models.Reminder.objects.filter(recipient=self.user.id).count(), 2)
+
+    def test_rows_cannot_pick_their_owner(self):
+        self.import_rows(self.user.id, [{**self.rows[0], 'recipient': self.other.id, 'id': 99}])
+        self.assertEqual(models.Reminder.objects.get().recipient, self.user.id)
+
+    def test_api(self):
+        body = "".join(f"{json.dumps(row)}\n" for row in self.rows)
+        response = self.client.post(reverse('api_reminders_import'), body, content_type="application/x-ndjson",
+                                    secure=True)
+        self.assertEqual(response.json()['created'], 5)
+        self.assertIn("Reminder 0", self.client.get('/', secure=True).context['table_html'])
+
+        response = self.client.get(reverse('api_reminders_export'), {'format': 'csv'}, secure=True)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], "text/csv")
+        response = self.client.post(reverse('api_reminders_import'), b"".join(response.streaming_content),
+                                    content_type="text/csv", secure=True)
+        self.assertEqual(response.json()['created'], 5)
+        self.assertEqual(self.client.get(reverse('api_reminders_export'), {'format': 'xml'}, secure=True).status_code,
+                         400)
+
+    def test_commands(self):
+        self.import_rows(self.user.id, self.rows)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "reminders.csv")
+            call_command("export_reminders", user=self.user.id, format="csv", output=path)
+            with open(os.devnull, "w") as devnull:
+                call_command("import_reminders", path, user=self.other.id, stdout=devnull)
+        self.assertEqual(models.Reminder.objects.filter(recipient=self.other.id).count(), 5)
+
+
+class CalendarFeedTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        patcher = mock.patch.object(fragments, "is_shared", return_value=True)  # As if it were memcached or redis
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ics.event_cache.clear()
+        schedule.rule_cache.clear()
+        self.user = make_user()
+        self.url = reverse('calendar_feed', args=[ics.feed_token(self.user)])
+        self.weekly = models.Reminder.objects.create(recipient=self.user.id, message="Stretch, then; rest",
+                                                     freq="WEEKLY", interval=2, dtstart=datetime(2022, 12, 1, 15),
+                                                     byweekday=schedule.to_mask([0, 3]), count=6)
+        self.daily = models.Reminder.objects.create(recipient=self.user.id, message="Water the plants", freq="DAILY",
+                                                    dtstart=datetime(2022, 12, 1, 9), until=datetime(2022, 12, 9, 9),
+                                                    byhour=schedule.to_mask([9, 21], "byhour"))
+
+    def fetch(self, **headers):
+        response = self.client.get(self.url, secure=True, **headers)
+        if response.status_code == 200:
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+            response.text = content.decode()
+        return response
+
+    def test_events_match_schedule(self):
+        text = self.fetch().text
+        self.assertTrue(all(len(line.encode()) <= 75 for line in text.split("\r\n")))
+        unfolded = text.replace("\r\n ", "")
+        self.assertIn("SUMMARY:Stretch\\, then\\; rest\r\n", unfolded)
+        for reminder in (self.weekly, self.daily):
+            event = unfolded.split(f"UID:reminder-{reminder.pk}@cinnamonswirl\r\n")[1].split("END:VEVENT")[0]
+            start = re.search(r"(DTSTART\S+)", event).group(1)
+            rule = re.search(r"RRULE:(\S+)", event).group(1)
+            parsed = rrule.rrulestr(f"{start}\nRRULE:{rule}")
+            self.assertEqual([occurrence.astimezone(timezone.utc).replace(tzinfo=None) for occurrence in parsed],
+                             list(schedule.iter_occurrences(reminder, reminder.dtstart)))
+        self.assertIn("DTSTART;TZID=US/Central:20221201T030000\r\n", unfolded)
+
+    def test_every_tzid_has_a_vtimezone(self):
+        models.Reminder.objects.create(recipient=self.user.id, freq="MONTHLY", timezone="Europe/Berlin",
+                                       dtstart=datetime(2022, 12, 1, 9))
+        models.Reminder.objects.create(recipient=self.user.id, freq="HOURLY", timezone="Asia/Kolkata",
+                                       dtstart=datetime(2022, 12, 1, 9))  # Written in UTC, so no VTIMEZONE
+        unfolded = self.fetch().text.replace("\r\n ", "")
+        self.assertEqual(set(re.findall(r"TZID=([^:;]+)", unfolded)), {"US/Central", "Europe/Berlin"})
+        self.assertEqual(re.findall(r"\r\nTZID:(\S+)", unfolded), ["Europe/Berlin", "US/Central"])
+        self.assertLess(unfolded.index("END:VTIMEZONE"), unfolded.index("BEGIN:VEVENT"))
+        rng = random.Random(20230312)
+        for name in ("US/Central", "Europe/Berlin"):
+            parsed = dateutil_tz.tzical(io.StringIO(ics.render_timezone(name))).get(name)
+            for _ in range(500):
+                moment = datetime(1971, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=rng.randrange(129 * 365 * 1440))
+                with self.subTest(zone=name, moment=moment):
+                    self.assertEqual(moment.astimezone(parsed).utcoffset(),
+                                     moment.astimezone(ZoneInfo(name)).utcoffset())
+
+    def test_served_from_cache_until_a_reminder_changes(self):
+        first = self.fetch()
+        self.assertTrue(first.streaming)
+        with self.assertNumQueries(0):
+            second = self.fetch()
+        self.assertEqual((second.text, second['ETag']), (first.text, first['ETag']))
+
+        self.daily.message = "Water the cactus"
+        self.daily.save()
+        with mock.patch.object(ics, "render_event", wraps=ics.render_event) as render_event:
+            third = self.fetch()
+        self.assertEqual(render_event.call_count, 1)  # Only the changed reminder is rendered again
+        self.assertIn("Water the cactus", third.text)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+
+    def test_conditional_requests(self):
+        etag = self.fetch()['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        caches['default'].clear()  # As if another worker answered
+        self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.weekly.delete()
+        self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_last_modified_follows_the_rows(self):
+        models.Reminder.objects.filter(recipient=self.user.id).update(changed_at=datetime(2022, 12, 1))
+        models.Reminder.objects.filter(pk=self.daily.pk).update(changed_at=datetime(2022, 12, 2))
+        models.DiscordUser.objects.filter(id=self.user.id).update(feed_changed_at=datetime(2022, 11, 1))
+        first = self.fetch()['Last-Modified']
+        self.assertEqual(first, "Fri, 02 Dec 2022 00:00:00 GMT")
+        caches['default'].clear()  # As if the cache were restarted, with nothing changed
+        rebuilt = self.fetch(HTTP_IF_MODIFIED_SINCE=first)
+        self.assertEqual((rebuilt.status_code, rebuilt['Last-Modified']), (304, first))
+
+        changed_at = datetime(2030, 1, 1)  # Later than anything already stored, without waiting for the clock
+        with mock.patch.object(signals, "now", return_value=changed_at):
+            self.weekly.delete()
+        deleted = self.fetch(HTTP_IF_MODIFIED_SINCE=first)
+        self.assertEqual((deleted.status_code, deleted['Last-Modified']), (200, "Tue, 01 Jan 2030 00:00:00 GMT"))
+
+    def test_tokens(self):
+        self.assertEqual(self.client.get(self.url.replace(str(self.user.id), "2"), secure=True).status_code, 404)
+        self.assertEqual(self.client.get('/calendar/1:forged.ics', secure=True).status_code, 404)
+        models.DiscordUser.objects.filter(id=self.user.id).delete()
+        self.assertEqual(self.client.get(self.url, secure=True).status_code, 404)
+        make_user()  # Deleting their data and signing up again
+        self.assertEqual(self.client.get(self.url, secure=True).status_code, 404)
+
+    def test_rotating_revokes_the_old_link(self):
+        self.assertEqual(self.fetch().status_code, 200)  # Now cached
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.get(reverse('rotate_feed'), secure=True), reverse('home'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.fetch().status_code, 404)
+        self.user.refresh_from_db()
+        new_url = reverse('calendar_feed', args=[ics.feed_token(self.user)])
+        self.assertEqual(self.client.get(new_url, secure=True).status_code, 200)
+        self.assertTrue(self.client.get('/', secure=True).context['calendar_url'].endswith(new_url))
+        self.assertEqual(self.fetch().status_code, 404)  # Not even once the new link's feed is cached
+
+    def test_every_user_has_their_own_secret(self):
+        self.assertNotEqual(self.user.feed_secret, make_user(user_id=2).feed_secret)
+
+    def test_home_links_feed(self):
+        self.client.force_login(self.user)
+        self.assertTrue(self.client.get('/', secure=True).context['calendar_url'].endswith(self.url))
+
+
+class AgendaTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_login(self.user)
+        self.now = datetime(2022, 12, 5, 12)
+        self.daily = models.Reminder.objects.create(recipient=self.user.id, message="Daily", freq="DAILY",
+                                                    timezone="US/Central", dtstart=datetime(2022, 12, 1, 15),
+                                                    next_fire_at=datetime(2022, 12, 1, 15))
+        self.hours = models.Reminder.objects.create(recipient=self.user.id, message="Twice a day", freq="DAILY",
+                                                    timezone="Europe/Berlin", dtstart=datetime(2022, 12, 1, 8),
+                                                    byhour=schedule.to_mask([9, 21], "byhour"),
+                                                    next_fire_at=datetime(2022, 12, 1, 8))
+        models.Reminder.objects.create(recipient=self.user.id, message="Done", freq="DAILY",
+                                       dtstart=datetime(2022, 12, 1), count=1, finished=True)
+        models.Reminder.objects.create(recipient=2, message="Somebody else's", freq="DAILY",
+                                       dtstart=datetime(2022, 12, 1), next_fire_at=datetime(2022, 12, 1))
+
+    def test_merges_in_order(self):
+        occurrences = agenda.upcoming(self.user.id, self.now, limit=5)
+        self.assertEqual([(occurrence.at, occurrence.reminder.message) for occurrence in occurrences],
+                         [(datetime(2022, 12, 5, 15), "Daily"), (datetime(2022, 12, 5, 20), "Twice a day"),
+                          (datetime(2022, 12, 6, 8), "Twice a day"), (datetime(2022, 12, 6, 15), "Daily"),
+                          (datetime(2022, 12, 6, 20), "Twice a day")])
+        self.assertEqual(occurrences[0].local.isoformat(), "2022-12-05T09:00:00-06:00")
+
+    def test_window(self):
+        occurrences = agenda.upcoming(self.user.id, self.now, end=datetime(2022, 12, 6, 9), limit=100)
+        self.assertEqual(len(occurrences), 3)
+
+    def test_in_order_across_dst(self):
+        # Every half hour from 1 to 3 o'clock local time. The night the clocks go forward, 2:00 and 2:30 do not exist
+        # and come out of the local expansion after 3:00 and 3:30, on the same UTC times.
+        half_hourly = models.Reminder(pk=1, freq="MINUTELY", interval=30, timezone="US/Central",
+                                      dtstart=datetime(2022, 3, 12, 7), next_fire_at=datetime(2022, 3, 12, 7),
+                                      byhour=schedule.to_mask([1, 2, 3], "byhour"))
+        occurrences = agenda.merge_occurrences([half_hourly], datetime(2022, 3, 13), end=datetime(2022, 3, 13, 12),
+                                               limit=10)
+        self.assertEqual([occurrence.at for occurrence in occurrences],
+                         [datetime(2022, 3, 13, 7), datetime(2022, 3, 13, 7, 30), datetime(2022, 3, 13, 8),
+                          datetime(2022, 3, 13, 8, 30)])
+
+    def test_frequent_reminders_are_expanded_lazily(self):
+        minutely = models.Reminder(pk=1, freq="MINUTELY", dtstart=datetime(2000, 1, 1), next_fire_at=self.now)
+        with mock.patch.object(schedule, "simple_next_occurrence", wraps=schedule.simple_next_occurrence) as step:
+            occurrences = agenda.merge_occurrences([minutely], self.now, limit=20)
+        self.assertEqual(occurrences[-1].at, datetime(2022, 12, 5, 12, 19))
+        self.assertEqual(step.call_count, 20)
+
+    def test_api(self):
+        response = self.client.get(reverse('api_agenda'), {'start': "2022-12-05T06:00:00-06:00", 'limit': 2},
+                                   secure=True)
+        self.assertEqual(response.json()['occurrences'][1],
+                         {'id': self.hours.pk, 'message': "Twice a day", 'timezone': "Europe/Berlin",
+                          'at': "2022-12-05T21:00:00+01:00", 'at_utc': "2022-12-05T20:00:00Z"})
+        self.assertEqual(self.client.get(reverse('api_agenda'), {'limit': 0}, secure=True).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_agenda'), {'start': "soon"}, secure=True).status_code, 400)
+
+    def test_page(self):
+        response = self.client.get(reverse('agenda'), {'start': "2022-12-05T12:00:00"}, secure=True)
+        self.assertContains(response, "12/05/2022 09:00 AM")
+        self.assertNotContains(response, "Somebody else's")
+
+
+class SchedulerTests(TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.clock = scheduler.FakeClock(datetime(2022, 12, 1, 8, 59))
+        self.daily = models.Reminder.objects.create(recipient=1, message="Daily", freq="DAILY", count=2,
+                                                    dtstart=datetime(2022, 12, 1, 9),
+                                                    next_fire_at=datetime(2022, 12, 1, 9))
+        self.hourly = models.Reminder.objects.create(recipient=2, message="Hourly", freq="HOURLY",
+                                                     dtstart=datetime(2022, 12, 1, 9, 30),
+                                                     until=datetime(2022, 12, 1, 10, 30),
+                                                     next_fire_at=datetime(2022, 12, 1, 9, 30))
+
+        self.daily_signal = f"reminder:1:{self.daily.pk}:Daily"
+        self.hourly_signal = f"reminder:2:{self.hourly.pk}:Hourly"
+
+    def send(self, message):
+        self.sent.append((self.clock.now(), message))
+
+    def make_scheduler(self, **kwargs):
+        values = {'send': self.send, 'clock': self.clock, 'workers': 1, 'max_sleep': 3600,
+                  'horizon': timedelta(hours=2)}
+        values.update(kwargs)
+        return scheduler.Scheduler(**values)
+
+    def test_sleeps_until_each_occurrence(self):
+        self.make_scheduler().run(iterations=5)
+        self.assertEqual(self.sent, [(datetime(2022, 12, 1, 9), self.daily_signal),
+                                     (datetime(2022, 12, 1, 9, 30), self.hourly_signal),
+                                     (datetime(2022, 12, 1, 10, 30), self.hourly_signal)])
+        self.assertEqual(self.clock.slept[:4], [60, 1800, 3600, 3600])
+        self.hourly.refresh_from_db()
+        self.assertTrue(self.hourly.finished)
+        self.daily.refresh_from_db()
+        self.assertEqual((self.daily.finished, self.daily.next_fire_at), (False, datetime(2022, 12, 2, 9)))
+
+    def test_exhausted_reminders_finish(self):
+        self.clock.current = datetime(2022, 12, 2, 9)
+        self.make_scheduler().run_once()
+        self.assertEqual(models.Reminder.objects.filter(finished=True).count(), 2)
+
+    def test_picks_up_new_reminders(self):
+        runner = self.make_scheduler()
+        runner.run_once()
+        runner.sleep()
+        late = models.Reminder.objects.create(recipient=3, message="Late", freq="DAILY", count=1,
+                                              dtstart=datetime(2022, 12, 1, 9, 10),
+                                              next_fire_at=datetime(2022, 12, 1, 9, 10))
+        runner.run(iterations=2)
+        self.assertEqual([message for _, message in self.sent][:2],
+                         [self.daily_signal, f"reminder:3:{late.pk}:Late"])
+        self.assertEqual(self.sent[1][0], datetime(2022, 12, 1, 9, 10))
+
+    def test_rate_limits_pause_delivery(self):
+        def limited(message):
+            self.send(message)
+            if len(self.sent) == 1:
+                raise webhooks.WebhookRateLimited(retry_after=30)
+        runner = self.make_scheduler(send=limited)
+        runner.run(iterations=3)
+        self.assertEqual(self.clock.slept[:2], [60, 30])
+        self.assertEqual(self.sent[1], (datetime(2022, 12, 1, 9, 0, 30), self.daily_signal))
+
+    def test_a_broken_send_does_not_lose_the_batch(self):
+        def broken(message):
+            if message == self.daily_signal:
+                raise KeyError("recipient")
+            self.send(message)
+        self.clock.current = datetime(2022, 12, 1, 9, 30)
+        with self.assertLogs(level="ERROR"):
+            self.make_scheduler(send=broken).run_once()
+        self.assertEqual([message for _, message in self.sent], [self.hourly_signal])
+        self.daily.refresh_from_db()
+        self.assertIsNone(self.daily.lease_token)  # Released to be tried again
+
+    def test_a_failed_wake_up_does_not_stop_the_run(self):
+        runner = self.make_scheduler(max_sleep=60)
+        with mock.patch.object(runner, "run_once", side_effect=[OperationalError("database is locked"), None]), \
+                self.assertLogs(level="ERROR"):
+            runner.run(iterations=2)
+        self.assertEqual(self.clock.slept[0], 60)
+        runner.run(iterations=1)
+        self.assertEqual([message for _, message in self.sent], [self.daily_signal])
+
+    def test_leased_reminders_are_left_alone(self):
+        self.clock.current = datetime(2022, 12, 1, 9)
+        models.Reminder.objects.lease_due(limit=10, lease_seconds=60, now=self.clock.now())
+        runner = self.make_scheduler(max_sleep=5)
+        self.assertEqual(runner.run_once(), 0)
+        runner.sleep()
+        self.assertEqual(self.clock.slept, [5])
+        self.assertEqual(self.sent, [])
+
+    def test_claims_only_what_the_heap_has_due(self):
+        runner = self.make_scheduler()
+        with mock.patch.object(managers.ReminderQuerySet, "lease_due", autospec=True,
+                               side_effect=managers.ReminderQuerySet.lease_due) as lease_due:
+            runner.run_once()
+            self.assertFalse(lease_due.called)  # Nothing is due at 8:59, so the database is not asked
+            runner.sleep()
+            runner.run_once()
+        self.assertEqual(lease_due.call_args.kwargs['pks'], [self.daily.pk])
+        self.assertEqual([message for _, message in self.sent], [self.daily_signal])
+
+    def test_picks_up_reminders_edited_to_fire_sooner(self):
+        runner = self.make_scheduler(resync_seconds=86400)
+        runner.run_once()
+        self.hourly.next_fire_at = datetime(2022, 12, 1, 9, 10)
+        self.hourly.save()
+        self.daily.finished = True
+        self.daily.save()
+        runner.run(iterations=2)
+        self.assertEqual(self.sent, [(datetime(2022, 12, 1, 9, 10), self.hourly_signal)])
+
+    def test_reminders_edited_to_fire_later_wait_for_it(self):
+        runner = self.make_scheduler()
+        runner.run_once()
+        models.Reminder.objects.filter(pk=self.daily.pk).update(next_fire_at=datetime(2022, 12, 1, 9, 20))
+        runner.run(iterations=4)
+        self.assertEqual(self.sent, [(datetime(2022, 12, 1, 9, 20), self.daily_signal),
+                                     (datetime(2022, 12, 1, 9, 30), self.hourly_signal)])
+
+    def test_command(self):
+        with mock.patch.object(webhooks, "send_webhook_message") as send, \
+                mock.patch.object(scheduler.Clock, "now", return_value=datetime(2022, 12, 1, 9)):
+            with open(os.devnull, "w") as devnull:
+                call_command("run_scheduler", once=True, stdout=devnull)
+        send.assert_called_once_with(self.daily_signal)
+
+
+class ShardLeaseTests(TestCase):
+
+    def setUp(self):
+        self.now = datetime(2022, 12, 1, 9)
+
+    def test_buckets_are_shared_out(self):
+        first = scheduler.ShardLeases("first", buckets=8, ttl=30)
+        second = scheduler.ShardLeases("second", buckets=8, ttl=30)
+        self.assertEqual(first.heartbeat(self.now), list(range(8)))
+        self.assertEqual(second.heartbeat(self.now), [])  # Nothing free until first gives some back
+        self.now += timedelta(seconds=10)
+        self.assertEqual(first.heartbeat(self.now), [0, 1, 2, 3])
+        self.assertEqual(second.heartbeat(self.now), [4, 5, 6, 7])
+
+        first.release()
+        self.now += timedelta(seconds=10)
+        self.assertEqual(second.heartbeat(self.now), list(range(8)))
+
+    def test_dead_workers_lose_their_buckets(self):
+        first = scheduler.ShardLeases("first", buckets=4, ttl=30)
+        second = scheduler.ShardLeases("second", buckets=4, ttl=30)
+        first.heartbeat(self.now)
+        second.heartbeat(self.now)
+        self.now += timedelta(seconds=31)  # first has stopped checking in
+        self.assertEqual(second.heartbeat(self.now), [0, 1, 2, 3])
+
+    def test_sharded_schedulers_split_reminders(self):
+        clock = scheduler.FakeClock(self.now)
+        for recipient in range(20):
+            models.Reminder.objects.create(recipient=recipient, message="Hi", freq="DAILY", count=1,
+                                           dtstart=self.now, next_fire_at=self.now)
+        sent = {}
+        runners = [scheduler.Scheduler(send=lambda message, name=name: sent.setdefault(name, []).append(message),
+                                       clock=clock, workers=1, shards=scheduler.ShardLeases(name, buckets=4, ttl=30))
+                   for name in ("first", "second")]
+        for runner in runners:
+            runner.refresh()
+        clock.advance(10)
+        for runner in runners:
+            runner.run_once()
+        self.assertEqual(sorted(len(messages) for messages in sent.values()), [10, 10])
+        recipients = {name: {int(message.split(":")[1]) % 4 for message in messages} for name, messages in sent.items()}
+        self.assertEqual(recipients, {"first": {0, 1}, "second": {2, 3}})
+
+
+class RecordingWebhook(StubWebhook):
+    received = []
+    statuses = []
+
+
+class ShardedSchedulerProcessTests(SimpleTestCase):
+    """
+    | Several run_scheduler processes against one SQLite file, joining and leaving while reminders come due. Every
+        reminder must be delivered exactly once.
+    """
+    reminders = 300
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RecordingWebhook)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def manage(self, env, *args, **kwargs) -> subprocess.Popen:
+        return subprocess.Popen([sys.executable, "manage.py", *args], env=env, cwd=settings.BASE_DIR,
+                                stdout=subprocess.DEVNULL, **kwargs)
+
+    def test_each_reminder_is_delivered_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "scheduler.sqlite3")
+            env = {key: value for key, value in os.environ.items() if key != "MYSQL_HOST"}
+            env.update({"DJANGO_SQLITE_PATH": path, "SCHEDULER_SHARD_TTL": "3",
+                        "DISCORD_WEBHOOK_URL": f"http://127.0.0.1:{self.server.server_port}/api/webhooks/1/token"})
+            self.assertEqual(self.manage(env, "migrate", "-v", "0").wait(), 0)
+            seed = ("from datetime import datetime, timedelta\n"
+                    "from CinnamonSwirl.models import Reminder\n"
+                    "now = datetime.utcnow() + timedelta(seconds=1)\n"
+                    "Reminder.objects.bulk_create(Reminder(recipient=i * 7919, message='Hi', freq='DAILY', count=1, "
+                    "dtstart=now, next_fire_at=now + timedelta(milliseconds=10 * i)) "
+                    f"for i in range({self.reminders}))")
+            self.assertEqual(self.manage(env, "shell", "-c", seed).wait(), 0)
+
+            options = ("run_scheduler", "--max-sleep", "0.2", "--batch-size", "20", "--run-for", "6")
+            workers = [self.manage(env, *options, "--name", name, stderr=subprocess.DEVNULL)
+                       for name in ("first", "second")]
+            time.sleep(2)
+            workers.append(self.manage(env, *options, "--name", "third", stderr=subprocess.DEVNULL))  # Joins halfway
+            time.sleep(1)
+            workers[0].send_signal(signal.SIGTERM)  # Leaves halfway
+            for worker in workers:
+                self.assertEqual(worker.wait(timeout=30), 0)
+
+            delivered = collections.Counter(RecordingWebhook.received)
+            self.assertEqual(len(delivered), self.reminders)
+            self.assertEqual(set(delivered.values()), {1})
+            with sqlite3.connect(path) as database:
+                self.assertEqual(database.execute(
+                    'SELECT COUNT(*) FROM "CinnamonSwirl_reminder" WHERE NOT finished').fetchone()[0], 0)
+
+
+class RequestTimingTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = make_user()
+        self.client.force_login(self.user)
+        models.Reminder.objects.create(recipient=self.user.id, message="Timed", freq="DAILY",
+                                       dtstart=datetime(2022, 12, 1, 15), next_fire_at=datetime(2022, 12, 1, 15))
+
+    @staticmethod
+    def timings(response) -> dict:
+        entries = {}
+        for entry in response['Server-Timing'].split(", "):
+            name, *params = entry.split(";")
+            entries[name] = dict(param.split("=", 1) for param in params)
+        return entries
+
+    def test_server_timing(self):
+        timings = self.timings(self.client.get(reverse('home'), secure=True))
+        self.assertEqual(set(timings), {'total', 'view', 'template', 'db'})
+        self.assertGreater(float(timings['template']['dur']), 0)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['template']['dur']))
+        queries = int(timings['db']['desc'].strip('"').split()[0])
+        self.assertGreater(queries, 0)
+
+    @mock.patch.object(settings, "SERVER_TIMING_HEADER", False)
+    def test_header_can_be_left_out(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home'), secure=True))
+
+    @mock.patch.object(settings, "SLOW_REQUEST_MS", 0)
+    @mock.patch.object(settings, "SLOW_REQUEST_SQL", 2)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs('CinnamonSwirl.middleware', level='WARNING') as logs:
+            self.client.get(reverse('home'), secure=True)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['event'], line['view'], line['status']), ('slow_request', 'home', 200))
+        self.assertEqual(len(line['sql']), 2)
+        self.assertGreaterEqual(line['sql'][0]['ms'], line['sql'][1]['ms'])
+        self.assertGreater(line['queries'], 2)
+
+    def test_fast_requests_are_not_logged(self):
+        with mock.patch.object(middleware.logger, "warning") as warning:
+            self.client.get(reverse('home'), secure=True)
+        warning.assert_not_called()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = metrics.MetricStore(self.directory.name, flush_seconds=3600)
+        patcher = mock.patch.object(metrics, "store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def count(self, name: str, **labels) -> int:
+        series = self.store.collect().get((name, tuple(sorted(labels.items()))))
+        return sum(series[:-1]) if series else 0
+
+    def test_workers_are_added_up(self):
+        other = metrics.MetricStore(self.directory.name)
+        other.observe(metrics.WEBHOOK_SEND, 0.003, outcome="ok")
+        other.observe(metrics.WEBHOOK_SEND, 20, outcome="ok")
+        other.flush()
+        self.store.observe(metrics.WEBHOOK_SEND, 0.2, outcome="ok")
+        series = self.store.collect()[(metrics.WEBHOOK_SEND, (("outcome", "ok"),))]
+        self.assertEqual(sum(series[:-1]), 3)
+        self.assertEqual((series[metrics.BUCKETS.index(0.005)], series[metrics.BUCKETS.index(0.25)], series[-2]),
+                         (1, 1, 1))
+        self.assertAlmostEqual(series[-1], 20.203)
+
+    def test_finished_workers_are_archived(self):
+        finished = metrics.MetricStore(self.directory.name)
+        finished.observe(metrics.DB_QUERY, 0.01, alias="default")
+        finished.flush()
+        with mock.patch.object(metrics, "alive", side_effect=lambda pid: pid != finished.pid):
+            self.assertEqual(self.count(metrics.DB_QUERY, alias="default"), 1)
+        self.assertFalse(os.path.exists(finished.path))
+        self.assertEqual(self.count(metrics.DB_QUERY, alias="default"), 1)
+
+    def test_requests_and_queries_are_observed(self):
+        self.client.force_login(make_user())
+        self.client.get(reverse('home'), secure=True)
+        self.client.get("/no/such/page", secure=True)
+        self.assertEqual(self.count(metrics.HTTP_REQUEST, view="home", method="GET", status="2xx"), 1)
+        self.assertEqual(self.count(metrics.HTTP_REQUEST, view="unmatched", method="GET", status="4xx"), 1)
+        self.assertGreater(self.count(metrics.DB_QUERY, alias="default"), 0)
+
+    def test_webhook_outcomes(self):
+        session = mock.Mock()
+        session.post.return_value = mock.Mock(status_code=429, headers={'Retry-After': "2"})
+        with mock.patch.object(webhooks, "webhook_session", return_value=session), \
+                self.assertRaises(webhooks.WebhookRateLimited):
+            webhooks.send_webhook_message("test:1")
+        session.post.return_value = mock.Mock(status_code=204)
+        with mock.patch.object(webhooks, "webhook_session", return_value=session):
+            webhooks.send_webhook_message("test:1")
+        self.assertEqual(self.count(metrics.WEBHOOK_SEND, outcome="rate_limited"), 1)
+        self.assertEqual(self.count(metrics.WEBHOOK_SEND, outcome="ok"), 1)
+
+    def test_oauth_failures(self):
+        with mock.patch("requests.post", side_effect=ConnectionError), self.assertRaises(ConnectionError):
+            views.exchange_code("code")
+        self.assertEqual(self.count(metrics.OAUTH_EXCHANGE, outcome="error"), 1)
+
+    @mock.patch.object(settings, "METRICS_TOKEN", "scrape")
+    def test_endpoint(self):
+        self.store.observe(metrics.OAUTH_EXCHANGE, 0.3, outcome="ok")
+        self.assertEqual(self.client.get(reverse('metrics'), secure=True).status_code, 401)
+        response = self.client.get(reverse('metrics'), secure=True, HTTP_AUTHORIZATION="Bearer scrape")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn("# TYPE cinnamonswirl_oauth_exchange_duration_seconds histogram", body)
+        self.assertIn('cinnamonswirl_oauth_exchange_duration_seconds_bucket{outcome="ok",le="0.25"} 0', body)
+        self.assertIn('cinnamonswirl_oauth_exchange_duration_seconds_bucket{outcome="ok",le="0.5"} 1', body)
+        self.assertIn('cinnamonswirl_oauth_exchange_duration_seconds_count{outcome="ok"} 1', body)
+
+    def test_endpoint_is_off_without_a_token(self):
+        response = self.client.get(reverse('metrics'), secure=True, HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 401)
+
+    def test_counters_and_gauges(self):
+        other = metrics.MetricStore(self.directory.name)
+        other.path = os.path.join(self.directory.name, "4194305-other.json")  # Above any real pid, so finished
+        other.increment(metrics.POOL_OPENED, alias="default")
+        other.set(metrics.POOL_CONNECTIONS, 4, alias="default", state="idle")
+        other.flush()
+        self.store.increment(metrics.POOL_OPENED, 2, alias="default")
+        self.store.set(metrics.POOL_CONNECTIONS, 1, alias="default", state="idle")
+        with mock.patch.object(metrics, "alive", return_value=True):
+            body = metrics.exposition(self.store.collect())
+        self.assertIn("# TYPE cinnamonswirl_db_pool_opened_total counter", body)
+        self.assertIn('cinnamonswirl_db_pool_opened_total{alias="default"} 3', body)
+        self.assertIn('cinnamonswirl_db_pool_connections{alias="default",state="idle"} 5', body)
+        body = metrics.exposition(self.store.collect())
+        # A finished worker's connections are closed, but what it opened still counts
+        self.assertIn('cinnamonswirl_db_pool_opened_total{alias="default"} 3', body)
+        self.assertIn('cinnamonswirl_db_pool_connections{alias="default",state="idle"} 1', body)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch.object(settings, "PROFILE_DIR", self.directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = make_user()
+        self.client.force_login(self.user)
+        models.Reminder.objects.create(recipient=self.user.id, message="Profiled", freq="DAILY",
+                                       dtstart=datetime(2022, 12, 1, 15), next_fire_at=datetime(2022, 12, 1, 15))
+
+    def get(self, **kwargs):
+        return self.client.get(reverse('home'), secure=True, **kwargs)
+
+    def test_signed_header(self):
+        response = self.get(HTTP_X_PROFILE=profiling.profile_token())
+        path = os.path.join(self.directory.name, response['X-Profile-Id'])
+        with open(f"{path}.json") as file:
+            profile = json.load(file)
+        self.assertEqual((profile['view'], profile['status']), ("home", 200))
+        self.assertGreater(len(profile['queries']), 0)
+        with open(f"{path}.folded") as file:
+            lines = file.read().splitlines()
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+
+    def test_forged_or_missing_header(self):
+        self.assertNotIn('X-Profile-Id', self.get(HTTP_X_PROFILE="forged:token"))
+        self.assertNotIn('X-Profile-Id', self.get())
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_staff_query_parameter(self):
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('home'), {'profile': 1}, secure=True))
+        with mock.patch.object(settings, "PROFILE_STAFF_IDS", {self.user.id}):
+            self.assertIn('X-Profile-Id', self.client.get(reverse('home'), {'profile': 1}, secure=True))
+
+    @mock.patch.object(settings, "PROFILE_RATE_LIMIT", 2)
+    def test_rate_limit(self):
+        token = profiling.profile_token()
+        profiled = ['X-Profile-Id' in self.get(HTTP_X_PROFILE=token) for _ in range(3)]
+        self.assertEqual(profiled, [True, True, False])
+
+    def test_sampler_sees_the_thread(self):
+        sampler = profiling.Sampler(threading.get_ident(), 0.001)
+        sampler.start()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        sampler.stop()
+        self.assertGreater(sampler.samples, 0)
+        self.assertTrue(any("test_sampler_sees_the_thread" in stack for stack in sampler.stacks))
+
+
+class StartupTests(TestCase):
+    def test_warm_up(self):
+        zones.transitions.cache_clear()
+        timings = warmup.warm()
+        self.assertEqual(set(timings), {'urls', 'templates', 'timezones'})
+        self.assertEqual(zones.transitions.cache_info().currsize, len(forms.SUPPORTED_TIMEZONES) + 1)
+
+    def test_web_workers_do_not_import_requests_or_debug_toolbar(self):
+        code = "import sys, App.wsgi, App.urls; print(sorted({'requests', 'debug_toolbar'} & set(sys.modules)))"
+        environment = dict(os.environ, DJANGO_SETTINGS_MODULE="App.settings", DEBUG="False")
+        environment.pop("DEBUG_TOOLBAR", None)
+        output = subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=environment,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.splitlines()[-1], "[]")
+
+
+class ProductionProfileTests(SimpleTestCase):
+    @staticmethod
+    def settings(**environment) -> subprocess.CompletedProcess:
+        code = ("import json; from App import settings as s; database = s.DATABASES['default']; "
+                "loaders = s.TEMPLATES[0]['OPTIONS'].get('loaders', [[None]]); "
+                "print(json.dumps([database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS'], loaders[0][0], "
+                "s.DEBUG_TOOLBAR, s.LOGGING['root']['level']]))")
+        ignored = ("DEBUG", "DEBUG_TOOLBAR", "CONN_MAX_AGE", "DJANGO_LOGGING_LEVEL", "DB_POOL")
+        environment = dict({key: value for key, value in os.environ.items() if key not in ignored}, **environment)
+        return subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=environment,
+                              capture_output=True, text=True)
+
+    def test_production(self):
+        result = self.settings(DJANGO_PROFILE="production", DEBUG_TOOLBAR="True")
+        self.assertEqual(json.loads(result.stdout),
+                         [600, True, "django.template.loaders.cached.Loader", False, "INFO"])
+
+    def test_development(self):
+        result = self.settings(DJANGO_PROFILE="development")
+        self.assertEqual(json.loads(result.stdout), [0, False, None, False, "DEBUG"])
+
+    def test_pooled_connections_are_given_back_after_each_request(self):
+        result = self.settings(DJANGO_PROFILE="production", DB_POOL="True")
+        self.assertEqual(json.loads(result.stdout)[:2], [0, False])
+        code = "from App import settings as s; print(s.DATABASES['default']['ENGINE'])"
+        engine = subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                env=dict(os.environ, DB_POOL="True")).stdout.strip()
+        self.assertEqual(engine, "CinnamonSwirl.db.sqlite3")
+
+    def test_production_refuses_debug(self):
+        result = self.settings(DJANGO_PROFILE="production", DEBUG="True")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("DEBUG cannot be True", result.stderr)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.works = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0
+        self.pool = pool.ConnectionPool("test", validate=lambda connection: connection.works, size=2, timeout=0.05,
+                                        max_age=60, clock=lambda: self.now)
+
+    def test_reuses_the_last_connection_returned(self):
+        first, second = self.pool.acquire(FakeConnection), self.pool.acquire(FakeConnection)
+        self.pool.release(first)
+        self.pool.release(second)
+        self.assertIs(self.pool.acquire(FakeConnection), second)
+        self.assertEqual(self.pool.status()['opened'], 2)
+
+    def test_times_out_when_all_are_in_use(self):
+        self.pool.clock = time.monotonic
+        connections = [self.pool.acquire(FakeConnection) for _ in range(2)]
+        with self.assertRaises(pool.PoolTimeout):
+            self.pool.acquire(FakeConnection)
+        threading.Timer(0.01, self.pool.release, (connections[0],)).start()
+        self.assertIs(self.pool.acquire(FakeConnection), connections[0])
+
+    def test_replaces_invalid_expired_and_broken_connections(self):
+        invalid, broken = self.pool.acquire(FakeConnection), self.pool.acquire(FakeConnection)
+        self.pool.release(invalid)
+        invalid.works = False
+        self.pool.release(broken, reusable=False)
+        self.assertIsNot(self.pool.acquire(FakeConnection), invalid)
+        replacement = self.pool.acquire(FakeConnection)
+        self.pool.release(replacement)
+        self.now = 61
+        self.assertIsNot(self.pool.acquire(FakeConnection), replacement)
+        self.assertTrue(invalid.closed and broken.closed and replacement.closed)
+        status = self.pool.status()
+        self.assertEqual((status['discarded_invalid'], status['discarded_broken'], status['discarded_expired']),
+                         (1, 1, 1))
+        self.assertEqual((status['open'], status['in_use']), (2, 2))
+
+    def test_a_failed_connect_frees_its_place(self):
+        with self.assertRaises(ConnectionError):
+            self.pool.acquire(mock.Mock(side_effect=ConnectionError))
+        self.assertEqual(self.pool.status()['open'], 0)
+
+
+class PooledBackendTests(SimpleTestCase):
+    """
+    | The pooled SQLite backend against a database in a file, since Django never closes an in memory one. Each
+        wrapper is made the way Django makes one for each thread.
+    """
+    def setUp(self):
+        from CinnamonSwirl.db.sqlite3.base import DatabaseWrapper
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = dict(connection.settings_dict, ENGINE="CinnamonSwirl.db.sqlite3",
+                                  NAME=os.path.join(directory.name, "pool.sqlite3"),
+                                  POOL={'SIZE': 2, 'TIMEOUT': 5, 'MAX_AGE': 600})
+        self.wrapper = lambda: DatabaseWrapper(self.settings_dict, alias="pooled")
+        self.addCleanup(pool.pools.pop, "pooled", None)
+        metrics_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics_directory.cleanup)
+        patcher = mock.patch.object(metrics, "store", metrics.MetricStore(metrics_directory.name, flush_seconds=3600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_threads_share_a_bounded_number_of_connections(self):
+        opened, errors = [], []
+
+        def request():
+            wrapper = self.wrapper()
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    opened.append(id(wrapper.connection))
+                time.sleep(0.01)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                wrapper.close()
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(set(opened)), 2)
+        status = pool.pools["pooled"].status()
+        self.assertEqual((status['acquired'], status['in_use'], status['idle']), (8, 0, status['opened']))
+        totals = metrics.store.collect()
+        self.assertEqual(totals[(metrics.POOL_CONNECTIONS, (("alias", "pooled"), ("state", "in_use")))], [0])
+        self.assertEqual(sum(totals[(metrics.POOL_WAIT, (("alias", "pooled"), ("outcome", "ok")))][:-1]), 8)
+
+    def test_timeout_is_an_operational_error(self):
+        from django.db import OperationalError
+        self.settings_dict['POOL'] = dict(self.settings_dict['POOL'], SIZE=1, TIMEOUT=0.01)
+        holder, waiter = self.wrapper(), self.wrapper()
+        holder.ensure_connection()
+        with self.assertRaises(OperationalError):
+            waiter.ensure_connection()
+        holder.close()
+        waiter.ensure_connection()
+        waiter.close()
+
+    def test_transactions_are_not_carried_over(self):
+        first = self.wrapper()
+        with first.cursor() as cursor:
+            cursor.execute("CREATE TABLE note (text TEXT)")
+        first.set_autocommit(False)
+        with first.cursor() as cursor:
+            cursor.execute("INSERT INTO note VALUES ('uncommitted')")
+        first.close()
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM note")
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertTrue(second.get_autocommit())
+        second.close()
+
+    def test_a_dropped_connection_is_replaced(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+        raw.close()  # As if the server had dropped it
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertIsNot(second.connection, raw)
+        second.close()
+        self.assertEqual(pool.pools["pooled"].status()['discarded_invalid'], 1)
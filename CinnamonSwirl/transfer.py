@@ -0,0 +1,195 @@
+import csv
+import json
+from typing import Iterable, Iterator
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+
+from CinnamonSwirl import models, views
+from CinnamonSwirl.api import JsonFields, login_json_required, owned_reminders, reminder_json
+from CinnamonSwirl.fragments import reminder_fragments
+
+FORMATS = ("ndjson", "csv")
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# The columns of an export, in the API's field names. Imports read the same columns, and ignore the ones that are
+# only ever written by the server.
+EXPORT_FIELDS = ("id", "version", "message", "timezone", "startDate", "startTime", "schedule_interval",
+                 "schedule_units", "count", "schedule_days", "schedule_hours", "schedule_end_date",
+                 "schedule_end_time", "finished", "next_fire_at")
+LIST_FIELDS = ("schedule_days", "schedule_hours")
+
+# An import reports at most this many failed rows individually. The count covers all of them.
+MAX_REPORTED_ERRORS = 1000
+
+
+class _Line:
+    """
+    | Hands csv.writer's output straight back instead of buffering it.
+    """
+    def write(self, value):
+        return value
+
+
+def export_reminders(queryset, export_format: str = "ndjson", chunk_size: int = 2000) -> Iterator[str]:
+    """
+    | Yields the reminders of queryset as NDJSON lines or CSV rows, in id order. Rows are read a chunk at a time by
+        primary key, on every database backend, so memory stays flat however many there are.
+    :raises ValueError: If the format is not one of FORMATS
+    """
+    if export_format not in FORMATS:
+        raise ValueError(f"Unknown format: {export_format}")
+    writer = csv.writer(_Line())
+    if export_format == "csv":
+        yield writer.writerow(EXPORT_FIELDS)
+
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by("pk")[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        if export_format == "ndjson":
+            yield "".join(f"{json.dumps(reminder_json(reminder), separators=(',', ':'))}\n" for reminder in chunk)
+        else:
+            lines = []
+            for reminder in chunk:
+                row = reminder_json(reminder)
+                for field in LIST_FIELDS:
+                    row[field] = ",".join(str(value) for value in row[field])
+                lines.append(writer.writerow(["" if row[field] is None else row[field] for field in EXPORT_FIELDS]))
+            yield "".join(lines)
+
+
+def read_rows(lines: Iterable, import_format: str) -> Iterator[tuple[int, JsonFields | None, str | None]]:
+    """
+    | Reads an import one line at a time. Yields (line number, fields, None) for each row, or (line number, None,
+        error) for a row that could not be read at all. Lines can be bytes or str.
+    :raises ValueError: If the format is not one of FORMATS
+    """
+    if import_format not in FORMATS:
+        raise ValueError(f"Unknown format: {import_format}")
+    lines = (line.decode("utf-8") if isinstance(line, bytes) else line for line in lines)
+
+    if import_format == "ndjson":
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None, "Not valid JSON."
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "Expected a JSON object."
+                continue
+            yield number, JsonFields(row), None
+        return
+
+    reader = csv.DictReader(lines)
+    for row in reader:
+        fields = JsonFields((key, value) for key, value in row.items() if key is not None)
+        for field in LIST_FIELDS:
+            value = fields.get(field)
+            fields[field] = [item for item in value.split(",") if item.strip()] if value else None
+        yield reader.line_num, fields, None
+
+
+class ReminderImporter:
+    """
+    | Creates reminders for one user from many rows at once. Every row goes through the same validation as the
+        reminder form. Valid rows are inserted with bulk_create, chunk_size at a time, each chunk in its own
+        transaction, so a large import never holds one long transaction and what was committed stays committed if a
+        later chunk fails. Rows that do not validate are skipped and reported by line number.
+    | Imports always create new reminders. Ids and versions in the rows are ignored.
+    """
+    def __init__(self, user_id: int, chunk_size: int = 1000):
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows: Iterable[tuple[int, JsonFields | None, str | None]]) -> dict:
+        """
+        | Imports the rows from read_rows and returns the created and failed counts, plus the first
+            MAX_REPORTED_ERRORS errors as {"line", "error"}.
+        """
+        chunk = []
+        for number, fields, error in rows:
+            if fields is not None:
+                fields["recipient"] = self.user_id
+                fields.pop("reminder_id", None)
+                try:
+                    chunk.append(models.Reminder(**views.build_reminder_kwargs(fields, self.user_id)))
+                except AssertionError:
+                    error = "One or more required values were missing."
+                except (ValueError, TypeError, ValidationError, PermissionError) as exception:
+                    error = f"One or more values were not understood: {exception}"
+            if error is not None:
+                self.fail(number, error)
+            if len(chunk) >= self.chunk_size:
+                self.save(chunk)
+                chunk = []
+        if chunk:
+            self.save(chunk)
+        return {"created": self.created, "failed": self.failed, "errors": self.errors}
+
+    def fail(self, line: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def save(self, chunk: list):
+        with transaction.atomic():
+            models.Reminder.objects.bulk_create(chunk, batch_size=self.chunk_size)
+        self.created += len(chunk)
+        reminder_fragments.invalidate(self.user_id)  # bulk_create does not send post_save
+
+
+def request_format(request, default: str = "ndjson") -> str | None:
+    """
+    | The format asked for with ?format=, or else the one the request body's Content-Type names. None if unknown.
+    """
+    requested = request.GET.get("format")
+    if requested is None:
+        content_type = request.content_type
+        requested = next((name for name, value in CONTENT_TYPES.items() if value == content_type), default)
+    return requested if requested in FORMATS else None
+
+
+@require_http_methods(["GET"])
+@login_json_required
+def reminders_export(request):
+    """
+    | |login|
+    | Optional ?format=ndjson (default) or ?format=csv, and ?finished=. |contains| Every one of the user's reminders,
+        one per line, streamed as it is read.
+    """
+    export_format = request_format(request)
+    if export_format is None:
+        return JsonResponse({'error': f'format must be one of {", ".join(FORMATS)}.'}, status=400)
+    response = StreamingHttpResponse(export_reminders(owned_reminders(request), export_format),
+                                     content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="reminders.{export_format}"'
+    return response
+
+
+@require_http_methods(["POST"])
+@login_json_required
+def reminders_import(request):
+    """
+    | |login|
+    | |requires| A body of NDJSON lines or CSV rows in the export's format, with a Content-Type of
+        application/x-ndjson or text/csv, or ?format=.
+    | |contains| JSON with the created and failed counts and the errors by line number. Rows that validate are
+        created even when others fail.
+    """
+    import_format = request_format(request)
+    if import_format is None:
+        return JsonResponse({'error': f'format must be one of {", ".join(FORMATS)}.'}, status=400)
+    # Read the body line by line rather than through request.body, so it is never held in memory whole.
+    result = ReminderImporter(user_id=request.user.id).run(read_rows(request, import_format))
+    return JsonResponse(result, status=200 if result["created"] or not result["failed"] else 400)
@@ -1,5 +1,5 @@
 from django.urls import path
-from CinnamonSwirl import views
+from CinnamonSwirl import agenda, api, ics, metrics, transfer, views
 
 # See django docs on URLs
 urlpatterns = [
@@ -9,6 +9,18 @@ urlpatterns = [
     path('oauth/discord_login', views.discord_login, name='discord_login'),
     path('oauth/redirect', views.discord_login_redirect, name='discord_login_redirect'),
     path('setup', views.Setup.as_view(), name='setup'),
+    path('agenda', views.agenda_view, name='agenda'),
     path('forget', views.forget, name='forget'),
-    path('reset', views.reset, name='reset')
+    path('reset', views.reset, name='reset'),
+    path('api/dispatch/claim', api.dispatch_claim, name='dispatch_claim'),
+    path('api/dispatch/ack', api.dispatch_ack, name='dispatch_ack'),
+    path('api/cache_stats', api.cache_stats, name='cache_stats'),
+    path('api/reminders', api.reminders, name='api_reminders'),
+    path('api/reminders/<int:reminder_id>', api.reminder, name='api_reminder'),
+    path('api/reminders/export', transfer.reminders_export, name='api_reminders_export'),
+    path('api/reminders/import', transfer.reminders_import, name='api_reminders_import'),
+    path('api/agenda', agenda.agenda, name='api_agenda'),
+    path('calendar/<str:token>.ics', ics.feed, name='calendar_feed'),
+    path('calendar/rotate', views.rotate_feed, name='rotate_feed'),
+    path('metrics', metrics.metrics, name='metrics')
 ]
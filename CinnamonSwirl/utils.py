@@ -1,21 +1,28 @@
-import discord
-import requests
-from App import settings
+from CinnamonSwirl import models
 
 
-def send_webhook_message(message):
-    with requests.Session() as session:
-        webhook = discord.SyncWebhook.from_url(settings.DISCORD_WEBHOOK_URL, session=session)
-        webhook.send(message, username='CinnamonSwirl Backend')
+def queue_webhook_message(message):
+    """
+    | Adds a message to the outbox. It is sent by the dispatch_webhooks command once the surrounding transaction
+        commits, and not at all if it rolls back.
+    """
+    return models.WebhookOutbox.objects.create(message=message)
 
 
-def send_test_message_signal(discord_user_id):
+def queue_test_message_signal(discord_user_id):
     message = f"test:{discord_user_id}"
-    send_webhook_message(message)
+    queue_webhook_message(message)
     return True
 
 
-def send_channel_creation_signal(discord_user_id):
+def queue_channel_creation_signal(discord_user_id):
     message = f"channel:{discord_user_id}"
-    send_webhook_message(message)
+    queue_webhook_message(message)
     return True
+
+
+def reminder_signal(reminder) -> str:
+    """
+    | The webhook message that has the bot deliver a reminder to its recipient.
+    """
+    return f"reminder:{reminder.recipient}:{reminder.pk}:{reminder.message}"
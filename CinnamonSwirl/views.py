@@ -1,28 +1,25 @@
 import logging
 from datetime import datetime
-from zoneinfo import ZoneInfo
-from configparser import ConfigParser
-from pathlib import Path
 
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
-from django.db.models import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import F, ObjectDoesNotExist
 from django.http import HttpResponseForbidden, HttpResponseBadRequest
 from django.shortcuts import redirect, reverse, render
+from django.utils.safestring import mark_safe
+from django.utils.timezone import now
 from django.views.decorators.http import require_http_methods
-from requests import post as requests_post, get as requests_get
 
-from CinnamonSwirl import filters, forms, models, tables, utils
+from CinnamonSwirl import agenda, filters, forms, ics, metrics, models, profiling, schedule, tables, utils, zones
+from CinnamonSwirl.fragments import reminder_fragments
+from CinnamonSwirl.pagination import KeysetPaginator
 
 from App import settings
 
-BASE_DIR = Path(__file__).resolve().parent.parent
-configuration = ConfigParser()
-configuration.read(f"{BASE_DIR}\\config.cfg")
-
 # Provided by Discord's OAuth2 URL Generator in your application's OAuth2 settings. Note the scope must be changed if
 #  further permissions are desired.
 auth_url = settings.DISCORD_AUTH_URL
@@ -38,6 +35,8 @@ def exchange_code(code: str):
     Interacts with Discord's OAuth2 API, identifying this app, specifying permissions desired, and giving an access
     code generated from a user authorizing the application using the DISCORD_AUTH_URL environment variable.
     """
+    import requests  # Only logging in needs it, and it takes longer to import than the rest of the app
+
     data = {
         'client_id': settings.DISCORD_CLIENT_ID,
         'client_secret': settings.DISCORD_CLIENT_SECRET,
@@ -51,36 +50,45 @@ def exchange_code(code: str):
         'Content-Type': 'application/x-www-form-urlencoded'
     }
 
-    response = requests_post('https://discord.com/api/oauth2/token', data=data, headers=headers)
-    credentials = response.json()
-    access_token = credentials['access_token']
-    response = requests_get('https://discord.com/api/v10/users/@me', headers={
-        'Authorization': f'Bearer {access_token}'
-    })
-    return response.json()
+    with metrics.timed(metrics.OAUTH_EXCHANGE):
+        response = requests.post('https://discord.com/api/oauth2/token', data=data, headers=headers)
+        credentials = response.json()
+        access_token = credentials['access_token']
+        response = requests.get('https://discord.com/api/v10/users/@me', headers={
+            'Authorization': f'Bearer {access_token}'
+        })
+        return response.json()
 
 
-def parse_reminder(request) -> bool:
+def build_reminder_kwargs(data, user_id: int) -> dict:
     """
-    | |requires| All relevant fields for a Reminder. At least timezone, startDate, startTime, message and timezone.
-
-    Attempts to format the request attributes from the supplied request and sends them to the Reminder
-    model manager. If fed an existing reminder via a reminder_id parameter in the request, it will attempt to
-    update that existing reminder instead of making a new one. This function only tries to look at POST requests.
+    | Validates the fields of one reminder, in the form's format, and turns them into the keyword arguments of a
+        Reminder for user_id. Nothing is saved. See parse_reminder, and transfer.ReminderImporter for many at once.
     :raises AssertionError: If an attribute is missing
     :raises ValueError: If a date was invalid
+    :raises PermissionError: If the reminder is for someone else
     """
     required_fields = ["timezone", "startDate", "startTime", "message", "timezone"]
     for field in required_fields:
-        assert request.POST.get(field)
+        assert data.get(field)
 
-    timezone = request.POST.get('timezone')
+    # Do not allow users to make reminders for other people, or to hand theirs over to someone else!
+    if not int(data.get('recipient', -1)) == int(user_id):
+        raise PermissionError
 
-    start_datetime = time_to_utc(date=request.POST.get('startDate'), time=request.POST.get('startTime'),
+    timezone = data.get('timezone')
+    if not zones.is_known(timezone):
+        raise ValueError(f"Unknown timezone: {timezone}")
+    if len(data.get('message')) > models.Reminder._meta.get_field('message').max_length:
+        raise ValueError("The message is too long.")
+
+    start_datetime = time_to_utc(date=data.get('startDate'), time=data.get('startTime'),
                                  timezone=timezone)
 
-    kwargs = {"dtstart": start_datetime, "timezone": timezone, "message": request.POST.get('message'),
-              "recipient": request.POST.get('recipient'), "finished": False}
+    # The schedule fields are always written so that clearing them on the form also clears them on an update.
+    kwargs = {"dtstart": start_datetime, "timezone": timezone, "message": data.get('message'),
+              "recipient": data.get('recipient'), "finished": False, "until": None, "byweekday": 0,
+              "byhour": 0}
 
     class CleanedRoutineData:
         """
@@ -88,12 +96,12 @@ def parse_reminder(request) -> bool:
         but is not acceptable by the Reminder model's manager. The values are cycled through and set to None in that
         case.
         """
-        def __init__(self, _request):
-            self.count = request.POST.get('count', None)
-            self.schedule_end_date = request.POST.get('schedule_end_date', None)
-            self.schedule_end_time = request.POST.get('schedule_end_time', None)
-            self.schedule_days = request.POST.getlist('schedule_days', None)
-            self.schedule_hours = request.POST.getlist('schedule_hours', None)
+        def __init__(self, _data):
+            self.count = _data.get('count', None)
+            self.schedule_end_date = _data.get('schedule_end_date', None)
+            self.schedule_end_time = _data.get('schedule_end_time', None)
+            self.schedule_days = _data.getlist('schedule_days', None)
+            self.schedule_hours = _data.getlist('schedule_hours', None)
 
             fields_to_clean = ("count", "schedule_end_date", "schedule_end_time", "schedule_days", "schedule_hours")
             for _field in fields_to_clean:
@@ -101,7 +109,7 @@ def parse_reminder(request) -> bool:
                 if type(value) is str and not value:
                     setattr(self, _field, None)
 
-    cleaned_routine_data = CleanedRoutineData(request)
+    cleaned_routine_data = CleanedRoutineData(data)
 
     if cleaned_routine_data.schedule_end_date:
         assert cleaned_routine_data.schedule_end_time
@@ -111,37 +119,60 @@ def parse_reminder(request) -> bool:
         # Count and Until cannot coexist in datetime.rrule. We will prioritize until over count.
         kwargs.update({"until": schedule_end_datetime, "count": None})
 
-    # For the next two blocks, we want to turn a list of strings into a string. [1, 2, 3] is the goal.
+    # For the next two blocks, we want to turn a list of strings into a bitmask. See schedule.to_mask
     if cleaned_routine_data.schedule_days:
-        days = []
-        for day in cleaned_routine_data.schedule_days:
-            days.append(int(day))
-        kwargs.update({"byweekday": str(days)})
+        kwargs.update({"byweekday": schedule.to_mask(cleaned_routine_data.schedule_days, "byweekday")})
 
+    # Hours stay in the reminder's own timezone. schedule.local_zone expands them there, one occurrence at a time.
     if cleaned_routine_data.schedule_hours:
-        hours = []
-        offset = int(datetime.utcnow().astimezone(ZoneInfo(timezone)).strftime('%z')[:3])
-        for hour in cleaned_routine_data.schedule_hours:
-            hours.append(int(hour) - offset)
-        kwargs.update({"byhour": str(hours)})
+        kwargs.update({"byhour": schedule.to_mask(cleaned_routine_data.schedule_hours, "byhour")})
 
-    kwargs.update({"interval": request.POST.get('schedule_interval'), "freq": request.POST.get('schedule_units'),
+    interval = int(data.get('schedule_interval') or 1)
+    if interval < 1:
+        raise ValueError("The interval must be at least 1.")
+    kwargs.update({"interval": interval, "freq": data.get('schedule_units'),
                    "count": cleaned_routine_data.count})
 
-    reminder_id = request.POST.get('reminder_id')
+    # Precompute the next occurrence so polling for due reminders never has to expand rrules.
+    kwargs["next_fire_at"] = schedule.next_occurrence(models.Reminder(**kwargs))
+    kwargs["finished"] = kwargs["next_fire_at"] is None
+    # An edit drops any outstanding lease so a bot holding the old schedule cannot acknowledge over the new one.
+    kwargs.update({"leased_until": None, "lease_token": None})
+
+    return kwargs
+
+
+def parse_reminder(request, data=None) -> int:
+    """
+    | |requires| All relevant fields for a Reminder. At least timezone, startDate, startTime, message and timezone.
+
+    Attempts to format the request attributes from the supplied request and sends them to the Reminder
+    model manager. If fed an existing reminder via a reminder_id parameter in the request, it will attempt to
+    update that existing reminder instead of making a new one. Unless given data, this function only looks at POST
+    requests.
+    The reminder's next_fire_at is recomputed every time. A schedule with no occurrences left is saved as finished.
+    Returns the id of the saved reminder.
+    :param data: The fields, in the form's format, when they do not come from request.POST, such as from the API
+    :raises AssertionError: If an attribute is missing
+    :raises ValueError: If a date was invalid
+    :raises PermissionError: If the reminder is for, or belongs to, someone else
+    """
+    if data is None:
+        data = request.POST
+    kwargs = build_reminder_kwargs(data, request.user.id)
+
+    reminder_id = data.get('reminder_id')
 
     if reminder_id:
-        try:
-            models.Reminder.objects.filter(pk=reminder_id, recipient=request.user.id).update(**kwargs)
-        except ObjectDoesNotExist:
+        updated = models.Reminder.objects.filter(pk=reminder_id, recipient=request.user.id).update(
+            version=F('version') + 1, changed_at=now(), **kwargs)
+        if not updated:
             raise PermissionError
-        return True
+        schedule.rule_cache.invalidate(int(reminder_id))
+        reminder_fragments.invalidate(request.user.id)  # update() does not send post_save
+        return int(reminder_id)
     else:
-        # Do not allow users to make reminders for other people!
-        if not int(request.POST.get('recipient', -1)) == int(request.user.id):
-            raise PermissionError
-        models.Reminder.objects.create(**kwargs)
-        return True
+        return models.Reminder.objects.create(**kwargs).pk
 
 
 def time_to_utc(date: str, time: str, timezone: str) -> datetime:
@@ -152,9 +183,7 @@ def time_to_utc(date: str, time: str, timezone: str) -> datetime:
     :return: datetime in UTC timezone with tzinfo removed.
     """
     date_time = datetime.strptime(f"{date} {time}", '%Y-%m-%d %H:%M')
-    time_in_local = date_time.replace(tzinfo=ZoneInfo(timezone))
-    time_in_utc = time_in_local.astimezone(ZoneInfo("UTC"))
-    return time_in_utc.replace(tzinfo=None)
+    return zones.to_utc(timezone, date_time)
 
 
 @require_http_methods(["GET"])
@@ -180,17 +209,14 @@ def discord_login_redirect(request):
     """
     code = request.GET.get('code')
     user = exchange_code(code)
-    if not settings.REGISTRATIONS_ENABLED:
-        try:
-            assert 'id' in user.keys()
-            models.DiscordUser.objects.get(id=user['id'])
-        except (ObjectDoesNotExist, AssertionError):
-            return redirect('home')
     discord_user = authenticate(request, user=user)
+    if discord_user is None:
+        return redirect('home')
     login(request, discord_user)
     return redirect('home')
 
 
+@method_decorator(profiling.profiled, name='dispatch')
 class HomeView(View):
     def get(self, request):
         """
@@ -200,17 +226,72 @@ class HomeView(View):
         """
         if request.user.is_authenticated:
             if not request.user.in_setup:
-                filtered_data = filters.RemindersFilter(request=request, queryset=models.Reminder.objects.all())
-                # Actual results of the filter is found as filtered_data.qs, not .data as that dumps the raw input
-                # of the filter.
-                table = tables.RemindersTable(data=filtered_data.qs, empty_text="You currently have no reminders!")
-                return render(request, 'get_reminders.html', {'table': table,
+                # The table only changes when one of the user's reminders does, so it is rendered once per page, sort
+                # and filter and then served from reminder_fragments until then.
+                variant = f"{settings.REMINDERS_PAGE_SIZE}?{request.GET.urlencode()}"
+                generation = reminder_fragments.generation(request.user.id)
+                fragment = reminder_fragments.get(request.user.id, variant, generation)
+                if fragment is None:
+                    fragment = self.render_table(request)
+                    reminder_fragments.set(request.user.id, variant, fragment, generation)
+                return render(request, 'get_reminders.html', {'table_html': mark_safe(fragment['table']),
+                                                              'next_page': fragment['next_page'],
+                                                              'previous_page': fragment['previous_page'],
                                                               'CreateButtonForm': forms.CreateButtonForm,
                                                               'LogoutButtonForm': forms.LogoutButtonForm,
-                                                              'invite_link': settings.DISCORD_SERVER_INVITE_LINK})
+                                                              'invite_link': settings.DISCORD_SERVER_INVITE_LINK,
+                                                              'calendar_url': request.build_absolute_uri(
+                                                                  reverse('calendar_feed',
+                                                                          args=[ics.feed_token(request.user)]))})
             return redirect(reverse('setup'))
         return render(request, "index.html", {'auth_url': auth_url})
 
+    def render_table(self, request) -> dict:
+        """
+        | Queries one page of the user's reminders and renders it. Returns the table's HTML and the links to the pages
+            either side.
+        """
+        filtered_data = filters.RemindersFilter(request=request, queryset=models.Reminder.objects.all())
+        # Actual results of the filter is found as filtered_data.qs, not .data as that dumps the raw input
+        # of the filter.
+        sort = request.GET.get('sort')
+        paginator = KeysetPaginator(queryset=tables.RemindersTable.queryset(filtered_data.qs),
+                                    order_by=tables.RemindersTable.order_field(sort),
+                                    page_size=settings.REMINDERS_PAGE_SIZE)
+        page = paginator.page(request.GET.get('cursor'))
+        table = tables.RemindersTable(data=tables.PresortedData(page.rows), order_by=sort,
+                                      empty_text="You currently have no reminders!")
+        return {'table': str(table.as_html(request)),
+                'next_page': self.page_link(request, page.next_cursor),
+                'previous_page': self.page_link(request, page.previous_cursor)}
+
+    @staticmethod
+    def page_link(request, cursor: str | None) -> str | None:
+        """
+        | A link to the page at cursor that keeps the current sort and filters.
+        """
+        if cursor is None:
+            return None
+        query = request.GET.copy()
+        query['cursor'] = cursor
+        return f"?{query.urlencode()}"
+
+
+@login_required(login_url='oauth/discord_login')
+@require_http_methods(["GET"])
+def agenda_view(request):
+    """
+    | |login|
+
+    Lists the next occurrences of all the user's reminders together, in order, each in its reminder's timezone. Takes
+    the same ?limit=, ?start= and ?end= as the agenda API.
+    """
+    try:
+        start, end, limit = agenda.read_window(request)
+    except ValueError:
+        return HttpResponseBadRequest()
+    return render(request, 'agenda.html', {'occurrences': agenda.upcoming(request.user.id, start, end, limit)})
+
 
 @login_required(login_url='oauth/discord_login')
 @require_http_methods(["GET"])
@@ -223,6 +304,7 @@ def forget(request):
     """
     models.Reminder.objects.filter(recipient=request.user.id).delete()
     models.DiscordUser.objects.filter(id=request.user.id).delete()
+    reminder_fragments.invalidate(request.user.id)
 
     return render(request, "forgotten.html", {'home': reverse('home')})
 
@@ -248,10 +330,23 @@ def reset(request):
     """
     request.user.in_setup = True
     request.user.setup_flags = 0
-    request.user.save()
+    request.user.save(update_fields=['in_setup', 'setup_flags'])
+    return redirect(reverse('home'))
+
+
+@login_required(login_url='oauth/discord_login')
+@require_http_methods(["GET"])
+def rotate_feed(request):
+    """
+    | Replaces the user's calendar feed URL with a new one. The old URL stops working at once.
+    | |login|
+    | |redirect| Home
+    """
+    ics.rotate_feed_secret(request.user)
     return redirect(reverse('home'))
 
 
+@method_decorator(profiling.profiled, name='dispatch')
 class ReminderView(View):
     # Where is PUT and DELETE? crispy forms doesn't support using PUT on forms, so we can only GET and POST.
     @method_decorator(login_required(login_url="oath/discord_login"))
@@ -315,6 +410,7 @@ class ReminderView(View):
                 return HttpResponseForbidden()
 
             if reminder:
+                schedule.rule_cache.invalidate(reminder.pk)
                 reminder.delete()
 
             return redirect("home")
@@ -339,6 +435,7 @@ class ReminderView(View):
         return redirect("reminder", error=message, id=reminder_id)
 
 
+@method_decorator(profiling.profiled, name='dispatch')
 class Setup(View):
     @method_decorator(login_required(login_url="oath/discord_login"))
     def get(self, request):
@@ -348,29 +445,30 @@ class Setup(View):
             if request.user.setup_flags == 1:  # User needs to choose how to get messages
                 return render(request, 'setup.html', {'SuppliedForm': forms.MessagePreferenceForm})
             if request.user.setup_flags == 2:  # User needs to test a message
-                utils.send_test_message_signal(request.user.id)
+                utils.queue_test_message_signal(request.user.id)
                 return render(request, 'setup.html', {'SuppliedForm': forms.TestMessageForm})
 
         return HttpResponseBadRequest
 
     @method_decorator(login_required(login_url="oath/discord_login"))
+    @method_decorator(transaction.atomic)  # Signals are only queued if the user's progress is saved too
     def post(self, request):
         if not request.user.setup_flags and request.POST.get('guild_join_confirmation', None):  # User joined our guild
             return self.next(request)
         if request.user.setup_flags == 1 and request.POST.get('message_preference', None):  # User chose a method
             if request.POST.get("message_preference", None):
-                utils.send_channel_creation_signal(request.user.id)
+                utils.queue_channel_creation_signal(request.user.id)
                 self.save_preference(request, "message_preference")
             return self.next(request)
         if request.user.setup_flags == 2 and request.POST.get('message_confirmation', None):  # User confirms test
             request.user.in_setup = False
-            request.user.save()
+            request.user.save(update_fields=['in_setup'])
             return redirect(reverse('home'))
         return redirect(reverse('setup'))
 
     def next(self, request):
         request.user.setup_flags += 1
-        request.user.save()
+        request.user.save(update_fields=['setup_flags'])
         return self.get(request)
 
     @staticmethod
@@ -378,4 +476,4 @@ class Setup(View):
         value = request.POST.get(attribute, None)
         if value:
             setattr(request.user, attribute, value)
-            request.user.save()
+            request.user.save(update_fields=[attribute])
@@ -0,0 +1,60 @@
+import logging
+import os
+import time
+from zoneinfo import ZoneInfo
+
+from django.apps import apps
+from django.db import connections
+from django.template import engines
+from django.urls import resolve, reverse
+
+from CinnamonSwirl import forms, zones
+
+logger = logging.getLogger(__name__)
+
+# Templates the app renders that do not live in its templates directory.
+LIBRARY_TEMPLATES = ("django_tables2/bootstrap.html",)
+
+
+def urls():
+    """
+    | Imports every view and builds the resolver's lookup tables, which Django otherwise does on the first request.
+    """
+    resolve(reverse('home'))
+
+
+def templates() -> int:
+    """
+    | Compiles the app's templates into the cached template loader. Returns how many there were.
+    """
+    directory = os.path.join(apps.get_app_config('CinnamonSwirl').path, "templates")
+    names = [name for name in os.listdir(directory) if name.endswith(".html")] + list(LIBRARY_TEMPLATES)
+    for engine in engines.all():
+        for name in names:
+            engine.get_template(name)
+    return len(names)
+
+
+def timezones():
+    """
+    | Loads the supported zones and works out their transition tables, which take the better part of a second
+        together and would otherwise hold up the first reminder form.
+    """
+    for name in forms.SUPPORTED_TIMEZONES + ("UTC",):
+        ZoneInfo(name)
+        zones.transitions(name)
+
+
+def warm() -> dict:
+    """
+    | Does the work each process would otherwise do on its first requests. Returns how long each step took, in
+        seconds. Opens no database connection, and closes any that were, so it is safe to run before forking.
+    """
+    timings = {}
+    for step in (urls, templates, timezones):
+        start = time.perf_counter()
+        step()
+        timings[step.__name__] = time.perf_counter() - start
+    connections.close_all()
+    logger.info("Warmed up in " + ", ".join(f"{step} {seconds * 1000:.1f} ms" for step, seconds in timings.items()))
+    return timings
@@ -0,0 +1,143 @@
+import logging
+import math
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from CinnamonSwirl import metrics, models
+from App import settings
+
+WEBHOOK_USERNAME = 'CinnamonSwirl Backend'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def webhook_session() -> requests.Session:
+    """
+    | One requests.Session per process, so connections to the webhook are kept alive and reused instead of a new TLS
+        handshake for every message.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=settings.WEBHOOK_POOL_SIZE))
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=settings.WEBHOOK_POOL_SIZE))
+                _session = session
+    return _session
+
+
+class WebhookRateLimited(requests.RequestException):
+    """
+    | Discord answered 429. retry_after is how many seconds it asked us to wait.
+    """
+    def __init__(self, retry_after: float, **kwargs):
+        super().__init__(f"Rate limited, retry after {retry_after} seconds", **kwargs)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None, now: datetime | None = None, default: float = 1) -> float:
+    """
+    | How many seconds a Retry-After header asks us to wait. It is either a number of seconds or an HTTP date. Anything
+        else, or no header at all, gives default, so a malformed header never stops a send from being retried.
+
+    >>> parse_retry_after("2.5")
+    2.5
+    >>> parse_retry_after("Thu, 01 Dec 2022 09:00:30 GMT", now=datetime(2022, 12, 1, 9))
+    30.0
+    >>> parse_retry_after("soon")
+    1
+    """
+    if value is None:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return default
+        if retry_at.tzinfo is not None:
+            retry_at = retry_at.astimezone(timezone.utc).replace(tzinfo=None)
+        seconds = (retry_at - (now or datetime.utcnow())).total_seconds()
+    return max(seconds, 0) if math.isfinite(seconds) else default
+
+
+def send_webhook_message(message):
+    """
+    | Posts a message to DISCORD_WEBHOOK_URL right away, over the pooled session.
+    :raises requests.RequestException: If the webhook could not be reached or refused the message
+    """
+    with metrics.timed(metrics.WEBHOOK_SEND) as result:
+        response = webhook_session().post(settings.DISCORD_WEBHOOK_URL,
+                                          json={'content': message, 'username': WEBHOOK_USERNAME},
+                                          timeout=settings.WEBHOOK_TIMEOUT)
+        if response.status_code == 429:
+            result['outcome'] = "rate_limited"
+            raise WebhookRateLimited(retry_after=parse_retry_after(response.headers.get('Retry-After')),
+                                     response=response)
+        response.raise_for_status()
+
+
+class WebhookDispatcher:
+    """
+    | Drains the WebhookOutbox in batches. Identical signals waiting in the outbox, such as a user asking for the test
+        message several times, are sent once. Failed sends are retried with exponential backoff, and given up on
+        after max_attempts.
+    | Only run one dispatcher at a time.
+    """
+    def __init__(self, batch_size: int = 100, base_delay: float = 5, max_delay: float = 300, max_attempts: int = 10,
+                 send=send_webhook_message):
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.send = send
+
+    def backoff(self, attempts: int) -> timedelta:
+        """
+        >>> WebhookDispatcher(base_delay=5, max_delay=60).backoff(3)
+        datetime.timedelta(seconds=20)
+        """
+        return timedelta(seconds=min(self.base_delay * 2 ** (attempts - 1), self.max_delay))
+
+    def drain_once(self, now: datetime | None = None) -> int:
+        """
+        | Sends one batch of due outbox rows. Returns how many rows were settled, sent or given up on, so the caller
+            knows whether to go straight on to the next batch.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        batch = list(models.WebhookOutbox.objects.filter(next_attempt_at__lte=now).order_by('id')[:self.batch_size])
+        pending = {}
+        for row in batch:
+            pending.setdefault(row.message, []).append(row)
+
+        sent, retry, dropped = [], [], []
+        for message, rows in pending.items():
+            try:
+                self.send(message)
+                sent.append(message)
+            except requests.RequestException as error:
+                delay = timedelta(seconds=error.retry_after) if isinstance(error, WebhookRateLimited) else None
+                for row in rows:
+                    row.attempts += 1
+                    row.last_error = str(error)[:500]
+                    row.next_attempt_at = now + max(delay or timedelta(0), self.backoff(row.attempts))
+                    (dropped if row.attempts >= self.max_attempts else retry).append(row)
+                logging.warning(f"Webhook message {message!r} failed: {error}")
+
+        if sent:
+            # Anything queued before this batch started is covered by the send, even if it was not in the batch.
+            models.WebhookOutbox.objects.filter(message__in=sent, created_at__lte=now).delete()
+        if retry:
+            models.WebhookOutbox.objects.bulk_update(retry, ['attempts', 'last_error', 'next_attempt_at'])
+        if dropped:
+            logging.error(f"Giving up on {len(dropped)} webhook messages after {self.max_attempts} attempts.")
+            models.WebhookOutbox.objects.filter(pk__in=[row.pk for row in dropped]).delete()
+        return len(batch) - len(retry)
@@ -0,0 +1,119 @@
+import bisect
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import NamedTuple
+from zoneinfo import ZoneInfo, available_timezones
+
+# The years the transition tables cover. Times outside them are converted by zoneinfo instead.
+FIRST_YEAR = 1970
+LAST_YEAR = 2100
+
+# Zones never change their offset twice in one day, so scanning a day at a time finds every transition.
+SCAN_STEP = timedelta(days=1)
+
+TABLE_START, TABLE_END = datetime(FIRST_YEAR, 1, 1), datetime(LAST_YEAR + 1, 1, 1)
+# A day of room on either side, so to_utc can look a day back and ahead without leaving the table.
+COVERED_FROM, COVERED_UNTIL = TABLE_START + SCAN_STEP, TABLE_END - SCAN_STEP
+
+
+class Transitions(NamedTuple):
+    """
+    | When a zone's UTC offset changes, in naive UTC. offsets[i] applies from instants[i] until instants[i + 1].
+    """
+    instants: list
+    offsets: list
+
+
+@lru_cache(maxsize=1)
+def _known_zones() -> frozenset:
+    # localtime is whichever zone the server happens to be set to, so it cannot mean anything to a reminder.
+    return frozenset(available_timezones() - {"localtime"})
+
+
+def is_known(name) -> bool:
+    """
+    | Whether name is an IANA zone a reminder can be kept in. Checked before a zone from a user is ever loaded.
+
+    >>> is_known("US/Central"), is_known("Mars/Olympus"), is_known("../etc/passwd"), is_known(None)
+    (True, False, False, False)
+    """
+    return isinstance(name, str) and name in _known_zones()
+
+
+def _offset(zone: ZoneInfo, utc: datetime) -> timedelta:
+    return utc.replace(tzinfo=timezone.utc).astimezone(zone).utcoffset()
+
+
+@lru_cache(maxsize=64)
+def transitions(name: str) -> Transitions:
+    """
+    | Every change of the zone's UTC offset between FIRST_YEAR and LAST_YEAR, to the second. Worked out once per zone
+        and process by scanning a day at a time and bisecting the days where the offset changed.
+    :raises zoneinfo.ZoneInfoNotFoundError: If the zone does not exist
+    """
+    zone = ZoneInfo(name)
+    instants, offsets = [TABLE_START], [_offset(zone, TABLE_START)]
+    day = TABLE_START
+    while day < TABLE_END:
+        following = day + SCAN_STEP
+        if _offset(zone, following) != offsets[-1]:
+            low, high = day, following  # The offset changes after low and by high
+            while high - low > timedelta(seconds=1):
+                middle = low + (high - low) // 2
+                if _offset(zone, middle) == offsets[-1]:
+                    low = middle
+                else:
+                    high = middle
+            instants.append(high.replace(microsecond=0))
+            offsets.append(_offset(zone, high))
+        day = following
+    return Transitions(instants, offsets)
+
+
+def utc_offset(name: str, utc: datetime) -> timedelta:
+    """
+    | The zone's offset from UTC at a naive UTC time. A bisect of the zone's transitions.
+
+    >>> utc_offset("US/Central", datetime(2022, 7, 1))
+    datetime.timedelta(days=-1, seconds=68400)
+    """
+    if not COVERED_FROM <= utc < COVERED_UNTIL:
+        return _offset(ZoneInfo(name), utc)
+    table = transitions(name)
+    return table.offsets[bisect.bisect_right(table.instants, utc) - 1]
+
+
+def to_local(name: str, utc: datetime) -> datetime:
+    """
+    | A naive UTC time as naive wall clock time in the zone.
+
+    >>> to_local("US/Central", datetime(2022, 12, 1, 15))
+    datetime.datetime(2022, 12, 1, 9, 0)
+    """
+    return utc + utc_offset(name, utc)
+
+
+def to_utc(name: str, local: datetime) -> datetime:
+    """
+    | Naive wall clock time in the zone as naive UTC. Reads the same way as zoneinfo with fold=0: a time that happens
+        twice when the clocks go back is the first of the two, and a time skipped when they go forward is read with
+        the offset from before the change.
+
+    >>> to_utc("US/Central", datetime(2022, 11, 6, 1, 30))
+    datetime.datetime(2022, 11, 6, 6, 30)
+    >>> to_utc("US/Central", datetime(2022, 3, 13, 2, 30))
+    datetime.datetime(2022, 3, 13, 8, 30)
+    """
+    if not COVERED_FROM <= local < COVERED_UNTIL:
+        return local.replace(tzinfo=ZoneInfo(name)).astimezone(timezone.utc).replace(tzinfo=None)
+    # No offset is a day or more, so the instant lies within a day of local, and at most one change can come in that.
+    table = transitions(name)
+    index = bisect.bisect_right(table.instants, local - SCAN_STEP) - 1
+    before = table.offsets[index]
+    if index + 1 == len(table.instants) or table.instants[index + 1] > local + SCAN_STEP:
+        return local - before  # No change anywhere near, which is nearly always
+    after = table.offsets[index + 1]
+    for offset in (before, after):
+        if utc_offset(name, local - offset) == offset:
+            return local - offset
+    return local - before
@@ -0,0 +1,17 @@
+"""
+Performance benchmarks. These are scripts, not tests, run from the repository root, for example:
+python -m benchmarks.bench_schedule
+benchmarks.suite times the web app's hot paths together and saves the results as JSON, so two runs can be compared.
+benchmarks.factories makes the synthetic users and reminders it runs on.
+benchmarks.bench_startup times what a new worker does before it can answer.
+"""
+import os
+import sys
+
+import django
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'App.settings')
+
+django.setup()
@@ -0,0 +1,69 @@
+"""
+Logins per second through DiscordAuthenticationBackend, against the query pattern it replaced: an existence check in
+the view, a filter() materialized with len(), then create_user for new users.
+Runs on a throwaway test database for whichever backend the settings pick, SQLite by default or MySQL when MYSQL_HOST
+is set.
+"""
+import argparse
+import time
+
+import benchmarks  # noqa: F401 Sets up django before the app is imported
+from django.db import connection
+from CinnamonSwirl import models
+
+
+def profile(user_id: int, username: str = "Bench") -> dict:
+    return {'id': user_id, 'username': username, 'discriminator': '0001', 'avatar': None, 'public_flags': 0,
+            'flags': 0, 'locale': 'en-US', 'mfa_enabled': False}
+
+
+def previous_login(user: dict):
+    models.DiscordUser.objects.get(id=user['id'])  # The check discord_login_redirect made with registrations closed
+    return previous_registration(user)
+
+
+def previous_registration(user: dict):
+    find_user = models.DiscordUser.objects.filter(id=user['id'])
+    if len(find_user) == 0:
+        return models.DiscordUser.objects.create_user(user=user)
+    return find_user[0]
+
+
+def current_login(user: dict):
+    return models.DiscordUser.objects.login_from_discord(user, create=True)
+
+
+def rate(login, users: list) -> float:
+    start = time.perf_counter()
+    for user in users:
+        login(user)
+    return len(users) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2000)
+    arguments = parser.parse_args()
+
+    test_database = connection.creation.create_test_db(verbosity=0)
+    try:
+        print(f"{connection.vendor} ({test_database}), {arguments.users} logins each")
+        print(f"{'case':<36}{'before':>12}{'after':>12}")
+        for name, before, after, existing in (("first login", previous_registration, current_login, False),
+                                              ("returning user", previous_login, current_login, True)):
+            results = []
+            for offset, login in ((0, before), (arguments.users, after)):
+                users = [profile(offset + i + 1) for i in range(arguments.users)]
+                if existing:
+                    for user in users:
+                        current_login(user)
+                    users = [profile(user['id'], username="Renamed") for user in users]
+                results.append(rate(login, users))
+            print(f"{name:<36}{results[0]:>8.0f} /s{results[1]:>8.0f} /s")
+            models.DiscordUser.objects.all().delete()
+    finally:
+        connection.creation.destroy_test_db(test_database, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
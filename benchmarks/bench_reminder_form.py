@@ -0,0 +1,60 @@
+"""
+Requests per second for the create and edit reminder pages, GET /reminder and GET /reminder?id=<id>, rendered through
+the test client on a throwaway test database. Building the ReminderForm alone, without rendering it, is timed too.
+"""
+import argparse
+import time
+import timeit
+from datetime import datetime
+
+import benchmarks  # noqa: F401 Sets up django before the app is imported
+from django.db import connection
+from django.test import Client, RequestFactory
+from CinnamonSwirl import forms, models, schedule
+
+
+def rate(client: Client, path: str, params: dict, requests: int) -> float:
+    client.get(path, params, secure=True)  # Warm up
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path, params, secure=True)
+        assert response.status_code == 200, response.status_code
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    arguments = parser.parse_args()
+
+    test_database = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = models.DiscordUser.objects.create(id=1, username="Bench", public_flags=0, flags=0, locale="en-US",
+                                                 mfa_enabled=False, discord_tag="Bench#0001",
+                                                 last_login=datetime.utcnow(), in_setup=False, setup_flags=3)
+        reminder = models.Reminder.objects.create(recipient=user.id, message="Bench", timezone="US/Eastern",
+                                                  freq="WEEKLY", dtstart=datetime(2022, 12, 1, 14, 30),
+                                                  byweekday=schedule.to_mask([0, 2, 4]),
+                                                  byhour=schedule.to_mask([14, 20], "byhour"), count=10)
+        client = Client()
+        client.force_login(user)
+        session = client.session
+        session['timezone'] = "US/Eastern"
+        session.save()
+
+        for name, params in (("create, GET /reminder", {}), ("edit, GET /reminder?id=", {'id': reminder.pk})):
+            print(f"{name:<30}{rate(client, '/reminder', params, arguments.requests):>8.0f} requests/s")
+
+        request = RequestFactory().get('/reminder')
+        request.user, request.session = user, client.session
+        for name, instance in (("create, ReminderForm()", None), ("edit, ReminderForm()", reminder)):
+            loops = arguments.requests * 10
+            seconds = min(timeit.repeat(lambda: forms.ReminderForm(request=request, reminder=instance),
+                                        number=loops, repeat=3)) / loops
+            print(f"{name:<30}{seconds * 1e6:>8.0f} us")
+    finally:
+        connection.creation.destroy_test_db(test_database, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
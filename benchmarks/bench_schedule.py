@@ -0,0 +1,41 @@
+"""
+Compares the closed-form next occurrence in CinnamonSwirl.schedule against expanding the same rule with dateutil.rrule.
+"""
+import argparse
+import timeit
+from datetime import datetime, timedelta
+
+import benchmarks  # noqa: F401 Sets up django before the app is imported
+from CinnamonSwirl import models, schedule
+
+NOW = datetime(2023, 6, 1, 12, 0, 30)
+
+CASES = {
+    "MINUTELY, started 6 months ago": models.Reminder(freq="MINUTELY", interval=1,
+                                                      dtstart=NOW - timedelta(days=182, seconds=17)),
+    "HOURLY every 3, started 1 year ago": models.Reminder(freq="HOURLY", interval=3,
+                                                          dtstart=NOW - timedelta(days=365, minutes=7)),
+    "DAILY, started 2 years ago": models.Reminder(freq="DAILY", interval=1, dtstart=NOW - timedelta(days=730, hours=5)),
+    "WEEKLY, started 2 years ago": models.Reminder(freq="WEEKLY", interval=1, dtstart=NOW - timedelta(days=731)),
+    "MONTHLY, started 5 years ago": models.Reminder(freq="MONTHLY", interval=1, dtstart=datetime(2018, 3, 14, 9)),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    print(f"{'schedule':<38}{'rrule':>14}{'fast path':>14}{'speedup':>10}")
+    for name, reminder in CASES.items():
+        assert schedule.simple_next_occurrence(reminder, NOW) == schedule.build_rule(reminder).after(NOW, inc=True)
+        slow = min(timeit.repeat(lambda: schedule.build_rule(reminder).after(NOW, inc=True),
+                                 number=1, repeat=arguments.repeat))
+        fast_loops = 10000
+        fast = min(timeit.repeat(lambda: schedule.next_occurrence(reminder, NOW),
+                                 number=fast_loops, repeat=arguments.repeat)) / fast_loops
+        print(f"{name:<38}{slow * 1e6:>11.1f} us{fast * 1e6:>11.2f} us{slow / fast:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
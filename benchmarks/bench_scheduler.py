@@ -0,0 +1,96 @@
+"""
+Sustained deliveries per second through CinnamonSwirl.scheduler.Scheduler with a large number of active reminders.
+The scheduler runs on a fake clock, so the time measured is its own work and the database's, not time spent sleeping.
+Messages go nowhere by default. With --http they are posted through the pooled webhook session to a local stub
+server, which measures the whole delivery path.
+Runs on a throwaway test database.
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import benchmarks  # noqa: F401 Sets up django before the app is imported
+from django.db import connection
+from CinnamonSwirl import models, schedule, scheduler, webhooks
+
+from App import settings
+
+START = datetime(2022, 12, 1, 9)
+
+
+class Webhook(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def create_reminders(count: int, spread: int):
+    """
+    | count HOURLY reminders whose first occurrences are spread over the first spread seconds. One in five is on set
+        weekdays, which takes the rrule path instead of the arithmetic one.
+    """
+    batch = []
+    for i in range(count):
+        dtstart = START + timedelta(seconds=i * spread // count)
+        reminder = models.Reminder(recipient=i % 1000, message=f"Reminder {i}", freq="HOURLY", dtstart=dtstart,
+                                   next_fire_at=dtstart,
+                                   byweekday=schedule.to_mask(range(7)) if i % 5 == 0 else 0)
+        batch.append(reminder)
+        if len(batch) == 5000:
+            models.Reminder.objects.bulk_create(batch)
+            batch = []
+    models.Reminder.objects.bulk_create(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reminders", type=int, default=100000)
+    parser.add_argument("--spread", type=int, default=600, help="Seconds the first occurrences are spread over.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=settings.WEBHOOK_POOL_SIZE)
+    parser.add_argument("--http", action="store_true", help="Post to a local stub webhook.")
+    arguments = parser.parse_args()
+
+    server = None
+    send = (lambda message: None)
+    if arguments.http:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Webhook)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        send = webhooks.send_webhook_message
+
+    test_database = connection.creation.create_test_db(verbosity=0)
+    try:
+        create_reminders(arguments.reminders, arguments.spread)
+        print(f"{connection.vendor}, {arguments.reminders} active reminders over {arguments.spread}s, "
+              f"batches of {arguments.batch_size}, {'http' if arguments.http else 'no'} delivery")
+
+        clock = scheduler.FakeClock(START)
+        runner = scheduler.Scheduler(send=send, clock=clock, batch_size=arguments.batch_size,
+                                     workers=arguments.workers if arguments.http else 1, max_sleep=1)
+        url = f"http://127.0.0.1:{server.server_port}/api/webhooks/1/token" if server else None
+        with mock.patch.object(settings, "DISCORD_WEBHOOK_URL", url):
+            start = time.perf_counter()
+            while runner.delivered < arguments.reminders:
+                runner.run(iterations=1)
+            seconds = time.perf_counter() - start
+        print(f"{'deliveries':<16}{runner.delivered / seconds:>10.0f} /s{seconds:>10.1f} s")
+        assert not models.Reminder.objects.filter(next_fire_at__lt=START + timedelta(hours=1)).exists()
+    finally:
+        connection.creation.destroy_test_db(test_database, verbosity=0)
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Times what a new worker does before it can answer: importing the app, as python -X importtime reports it, and the
+steps of CinnamonSwirl.warmup. Each run is a fresh interpreter, so nothing is already imported or cached. The modules
+that take longest to import, with everything they import, are listed after the totals.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# What gunicorn does to load the app, and what the first request does after it: load the URLconf and every view.
+BOOT = "import App.wsgi, App.urls"
+WARM = BOOT + "; import json; from CinnamonSwirl import warmup; print(json.dumps(warmup.warm()))"
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def run(code: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    environment = dict(os.environ, DJANGO_SETTINGS_MODULE="App.settings", DJANGO_LOGGING_LEVEL="WARNING")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    return subprocess.run(command, cwd=ROOT, env=environment, capture_output=True, text=True, check=True)
+
+
+def parse(report: str) -> list:
+    """
+    | The modules in a -X importtime report, as (name, self microseconds, cumulative microseconds, depth).
+
+    >>> parse("import time: self [us] | cumulative | imported package\\nimport time:       120 |        450 |   json")
+    [('json', 120, 450, 1)]
+    """
+    return [(match[4], int(match[1]), int(match[2]), len(match[3]) // 2)
+            for match in map(LINE.match, report.splitlines()) if match]
+
+
+def import_time(runs: int) -> tuple:
+    """
+    | The total import time of each of runs boots, in milliseconds, and the modules of the last one.
+    """
+    totals, modules = [], []
+    for _ in range(runs):
+        modules = parse(run(BOOT, importtime=True).stderr)
+        totals.append(sum(self_us for _, self_us, _, _ in modules) / 1000)
+    return totals, modules
+
+
+def result(timings: list) -> dict:
+    """
+    | timings in the same shape as benchmarks.suite.measure, so it can be saved and compared with the other cases.
+    """
+    timings = sorted(timings)
+    return {'median_ms': round(statistics.median(timings), 4),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+            'queries': 0, 'iterations': len(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest modules to list.")
+    arguments = parser.parse_args()
+
+    totals, modules = import_time(arguments.runs)
+    warm = [json.loads(run(WARM).stdout.splitlines()[-1]) for _ in range(arguments.runs)]
+    print(f"{'step':<24}{'median':>12}{'p95':>12}")
+    for name, timings in [("imports", totals)] + [(f"warmup.{step}", [steps[step] * 1000 for steps in warm])
+                                                  for step in warm[0]]:
+        timing = result(timings)
+        print(f"{name:<24}{timing['median_ms']:>9.1f} ms{timing['p95_ms']:>9.1f} ms")
+
+    print(f"\n{'module':<48}{'cumulative':>14}")
+    slowest = sorted(((cumulative, name) for name, _, cumulative, _ in modules), reverse=True)[:arguments.top]
+    for cumulative, name in slowest:
+        print(f"{name:<48}{cumulative / 1000:>11.1f} ms")
+    # Neither should be imported by a web worker any more. The first is slow to import, the second unsafe.
+    heavy = [name for name in ("requests", "debug_toolbar") if any(module == name for module, *_ in modules)]
+    print(f"\n{len(modules)} modules imported{', including ' + ' and '.join(heavy) if heavy else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Requests per second through Django's WSGI handler, called the way gunicorn calls it, under each DJANGO_PROFILE. Unlike
+the test client, the handler fires request_started and request_finished, so connections are closed and opened again
+as CONN_MAX_AGE says, and everything is logged as DJANGO_LOGGING_LEVEL says.
+Each profile runs in a fresh interpreter, since settings are read once at startup, on a throwaway SQLite database in a
+file, so connecting costs what it costs on disk. Set MYSQL_HOST to run on MySQL, where every connection is also a
+network round trip and a login.
+python -m benchmarks.bench_throughput
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wsgiref.util
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PROFILES = ("development", "production")
+
+
+def environ(path: str, session: str) -> dict:
+    path, _, query = path.partition("?")
+    environment = {'REQUEST_METHOD': "GET", 'PATH_INFO': path, 'QUERY_STRING': query, 'wsgi.url_scheme': "https",
+                   'HTTP_HOST': "testserver", 'SERVER_PORT': "443", 'HTTP_COOKIE': f"sessionid={session}"}
+    wsgiref.util.setup_testing_defaults(environment)
+    return environment
+
+
+def call(handler, environment: dict) -> str:
+    statuses = []
+    body = handler(environment, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()  # Fires request_finished, which is when connections past CONN_MAX_AGE are closed
+    return statuses[0]
+
+
+def serve(requests: int, users: int, reminders: int) -> dict:
+    """
+    | Runs in the child interpreter. Returns each page's throughput and how many database connections were opened.
+    """
+    import benchmarks  # noqa: F401 Sets up django before the app is imported
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from django.test import Client
+    from benchmarks import factories
+    from CinnamonSwirl import models
+    from App import settings
+
+    directory = tempfile.TemporaryDirectory()
+    if connection.vendor == "sqlite":
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory.name, "throughput.sqlite3")
+    test_database = connection.creation.create_test_db(verbosity=0)
+    try:
+        made = factories.make_users(users)
+        factories.make_reminders(made, reminders)
+        client = Client()
+        client.force_login(made[0])
+        session = client.cookies['sessionid'].value
+        reminder = models.Reminder.objects.filter(recipient=made[0].id).first()
+        paths = ["/", "/reminder", f"/reminder?id={reminder.pk}", "/agenda"]
+        connection.close()
+        start = time.perf_counter()
+        for _ in range(100):
+            connection.ensure_connection()
+            connection.close()
+        connect_ms = (time.perf_counter() - start) * 10
+
+        handler = WSGIHandler()
+        for path in paths:
+            status = call(handler, environ(path, session))
+            assert status.startswith("200"), (path, status)
+        opened = []
+        connection_created.connect(lambda **kwargs: opened.append(kwargs['connection'].alias), weak=False)
+        pages = {}
+        for path in paths:
+            timings = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                call(handler, environ(path, session))
+                timings.append(time.perf_counter() - start)
+            pages[path.replace(str(reminder.pk), "<id>")] = {
+                'per_second': round(requests / sum(timings), 1),
+                'median_ms': round(statistics.median(timings) * 1000, 3)}
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(test_database, verbosity=0)
+        directory.cleanup()
+    return {'profile': settings.DJANGO_PROFILE, 'vendor': connection.vendor, 'pages': pages,
+            'connections': len(opened), 'connect_ms': round(connect_ms, 3)}
+
+
+def best(rounds: list) -> dict:
+    """
+    | One profile's rounds together: each page's best throughput and median, which are the least disturbed by
+        whatever else the machine was doing.
+    """
+    result = dict(rounds[0], connect_ms=min(run['connect_ms'] for run in rounds))
+    result['pages'] = {page: {'per_second': max(run['pages'][page]['per_second'] for run in rounds),
+                              'median_ms': min(run['pages'][page]['median_ms'] for run in rounds)}
+                       for page in rounds[0]['pages']}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per page.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--reminders", type=int, default=50, help="Reminders per user.")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="Times to run each profile, taking turns. Each page's best round is shown.")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.serve:
+        print(json.dumps(serve(arguments.requests, arguments.users, arguments.reminders)))
+        return
+
+    rounds = {profile: [] for profile in PROFILES}
+    command = [sys.executable, "-m", "benchmarks.bench_throughput", "--serve", "--requests", str(arguments.requests),
+               "--users", str(arguments.users), "--reminders", str(arguments.reminders)]
+    for _ in range(arguments.rounds):
+        for profile in PROFILES:
+            # Logs go where a worker's would, but are not shown, so writing them is part of what is timed
+            output = subprocess.run(command, cwd=ROOT, env=dict(os.environ, DJANGO_PROFILE=profile), check=True,
+                                    text=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+            rounds[profile].append(json.loads(output.splitlines()[-1]))
+
+    development, production = (best(rounds[profile]) for profile in PROFILES)
+    print(f"{development['vendor']}, {arguments.requests} requests per page, best of {arguments.rounds} rounds. "
+          f"Opening a connection takes {development['connect_ms']:.3f} ms.")
+    print(f"Connections opened per round: {development['connections']} in development, "
+          f"{production['connections']} in production")
+    print(f"{'page':<20}{'development':>24}{'production':>24}{'change':>9}")
+    for page, before in development['pages'].items():
+        after = production['pages'][page]
+        print(f"{page:<20}{before['per_second']:>8.1f}/s{before['median_ms']:>11.3f} ms"
+              f"{after['per_second']:>8.1f}/s{after['median_ms']:>11.3f} ms"
+              f"{after['per_second'] / before['per_second'] - 1:>+9.1%}")
+
+
+if __name__ == "__main__":
+    main()
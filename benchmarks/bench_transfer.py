@@ -0,0 +1,73 @@
+"""
+Rows per second for bulk importing and exporting reminders through CinnamonSwirl.transfer, with the peak memory
+python allocated along the way. Runs on a throwaway test database.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime
+
+import benchmarks  # noqa: F401 Sets up django before the app is imported
+from django.db import connection
+from CinnamonSwirl import models, transfer
+
+
+def rows(count: int):
+    for i in range(count):
+        # Every fifth reminder is on set weekdays, which takes the rrule path instead of the arithmetic one.
+        weekdays = i % 5 == 0
+        yield json.dumps({'message': f"Reminder {i}", 'timezone': "US/Central", 'startDate': "2022-12-01",
+                          'startTime': f"{i % 24:02}:{i % 60:02}", 'schedule_interval': 1 if weekdays else i % 7 + 1,
+                          'schedule_units': "DAILY" if weekdays else ("DAILY", "WEEKLY", "HOURLY")[i % 3],
+                          'schedule_days': [i % 7, (i + 3) % 7] if weekdays else [], 'count': 10})
+
+
+def measure(work):
+    """
+    | Times work, then runs it again under tracemalloc, which slows it down too much to time, for the peak memory.
+    """
+    start = time.perf_counter()
+    result = work()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    work()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    arguments = parser.parse_args()
+
+    test_database = connection.creation.create_test_db(verbosity=0)
+    try:
+        for user_id in (1, 2):
+            models.DiscordUser.objects.create(id=user_id, username="Bench", public_flags=0, flags=0, locale="en-US",
+                                              mfa_enabled=False, discord_tag="Bench#0001",
+                                              last_login=datetime.utcnow())
+        print(f"{connection.vendor}, {arguments.rows} rows")
+
+        users = iter((1, 2))
+        result, seconds, peak = measure(lambda: transfer.ReminderImporter(user_id=next(users)).run(
+            transfer.read_rows(rows(arguments.rows), "ndjson")))
+        assert result["created"] == arguments.rows, result
+        print(f"{'import':<16}{arguments.rows / seconds:>10.0f} rows/s{peak / 2 ** 20:>10.1f} MiB peak")
+
+        for export_format in transfer.FORMATS:
+            def export():
+                size = 0
+                for chunk in transfer.export_reminders(models.Reminder.objects.filter(recipient=1), export_format):
+                    size += len(chunk)
+                return size
+            size, seconds, peak = measure(export)
+            print(f"{'export ' + export_format:<16}{arguments.rows / seconds:>10.0f} rows/s"
+                  f"{peak / 2 ** 20:>10.1f} MiB peak{size / 2 ** 20:>10.1f} MiB written")
+    finally:
+        connection.creation.destroy_test_db(test_database, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares UTC offset lookups in CinnamonSwirl.zones, a bisect of each zone's cached transitions, against converting
+with zoneinfo the way the form and views used to, and times expanding an hourly rule in local time.
+"""
+import argparse
+import itertools
+import timeit
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import benchmarks  # noqa: F401 Sets up django before the app is imported
+from CinnamonSwirl import models, schedule, zones
+
+NOW = datetime(2023, 6, 1, 12, 0, 30)
+ZONE = "US/Central"
+
+
+def strftime_offset():
+    return int(NOW.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(ZONE)).strftime('%z')[:3])
+
+
+def zoneinfo_to_utc():
+    return NOW.replace(tzinfo=ZoneInfo(ZONE)).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=100000)
+    arguments = parser.parse_args()
+
+    zones.transitions(ZONE)  # Built once per process, so not part of any lookup
+    cases = {"offset": (strftime_offset, lambda: zones.utc_offset(ZONE, NOW)),
+             "local to UTC": (zoneinfo_to_utc, lambda: zones.to_utc(ZONE, NOW))}
+    print(f"{'lookup':<16}{'zoneinfo':>14}{'table':>14}{'speedup':>10}")
+    for name, (slow_call, fast_call) in cases.items():
+        slow = min(timeit.repeat(slow_call, number=arguments.number, repeat=arguments.repeat)) / arguments.number
+        fast = min(timeit.repeat(fast_call, number=arguments.number, repeat=arguments.repeat)) / arguments.number
+        print(f"{name:<16}{slow * 1e9:>11.0f} ns{fast * 1e9:>11.0f} ns{slow / fast:>9.1f}x")
+
+    reminder = models.Reminder(freq="DAILY", dtstart=NOW - timedelta(days=365), timezone=ZONE,
+                               byhour=schedule.to_mask([8, 12, 17], "byhour"))
+    loops = 1000
+    seconds = min(timeit.repeat(lambda: list(itertools.islice(schedule.iter_occurrences(reminder, NOW), 30)),
+                                number=loops, repeat=arguments.repeat)) / loops
+    print(f"{'30 local hours':<16}{seconds * 1e6:>25.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Synthetic users and reminders for the benchmarks, written straight to the database with bulk_create. Everything is
+drawn from a seeded random.Random, so the same arguments always make the same data.
+"""
+import random
+from datetime import datetime, timedelta
+
+import benchmarks  # noqa: F401 Sets up django before the app is imported
+from CinnamonSwirl import models, schedule
+
+NOW = datetime(2023, 6, 1, 12)
+TIMEZONES = ("US/Eastern", "US/Central", "US/Mountain", "US/Pacific")
+CHUNK_SIZE = 5000
+
+
+def daily(rng):
+    return {"freq": "DAILY", "interval": rng.choice([1, 1, 1, 2, 3])}
+
+
+def weekdays(rng):
+    return {"freq": "WEEKLY", "byweekday": schedule.to_mask(rng.sample(range(7), rng.randint(1, 5)), "byweekday")}
+
+
+def hours(rng):
+    return {"freq": "DAILY", "byhour": schedule.to_mask(rng.sample(range(7, 23), rng.randint(1, 3)), "byhour")}
+
+
+def monthly(rng):
+    return {"freq": "MONTHLY", "interval": rng.choice([1, 1, 3, 6])}
+
+
+def hourly(rng):
+    return {"freq": "HOURLY", "interval": rng.choice([1, 2, 4, 8])}
+
+
+def counted(rng):
+    return {"freq": rng.choice(["DAILY", "WEEKLY"]), "count": rng.randint(2, 30)}
+
+
+def ending(rng):
+    return {"freq": "DAILY", "until": NOW + timedelta(days=rng.randint(-30, 180))}
+
+
+# What reminders people make, and how often, roughly as the app sees them: mostly plain daily and weekly ones.
+RULE_MIX = ((daily, 30), (weekdays, 25), (hours, 15), (monthly, 10), (hourly, 5), (counted, 10), (ending, 5))
+
+
+def profile(user_id: int) -> dict:
+    """
+    | What Discord sends back about a user, as the login path reads it.
+    """
+    return {'id': user_id, 'username': f"Bench {user_id}", 'discriminator': f"{user_id % 10000:04}", 'avatar': None,
+            'public_flags': 0, 'flags': 0, 'locale': 'en-US', 'mfa_enabled': False}
+
+
+def make_users(count: int, first_id: int = 1) -> list:
+    """
+    | count set up users with ids from first_id on.
+    """
+    users = [models.DiscordUser(id=user_id, username=f"Bench {user_id}", public_flags=0, flags=0, locale="en-US",
+                                mfa_enabled=False, discord_tag=f"Bench#{user_id % 10000:04}", last_login=NOW,
+                                in_setup=False, setup_flags=3)
+             for user_id in range(first_id, first_id + count)]
+    models.DiscordUser.objects.bulk_create(users, batch_size=CHUNK_SIZE)
+    return users
+
+
+def make_reminder(rng: random.Random, recipient: int) -> models.Reminder:
+    """
+    | One unsaved reminder with a rule drawn from RULE_MIX, started some time in the last year, with next_fire_at
+        worked out the way parse_reminder does it.
+    """
+    rules, weights = zip(*RULE_MIX)
+    fields = rng.choices(rules, weights)[0](rng)
+    reminder = models.Reminder(recipient=recipient, message=f"Reminder {rng.getrandbits(32):08x}",
+                               timezone=rng.choice(TIMEZONES),
+                               dtstart=NOW - timedelta(minutes=rng.randrange(365 * 1440)), **fields)
+    reminder.next_fire_at = schedule.next_occurrence(reminder, NOW)
+    reminder.finished = reminder.next_fire_at is None
+    return reminder
+
+
+def make_reminders(users: list, per_user: int, seed: int = 0) -> int:
+    """
+    | per_user reminders for each of users. Returns how many were made.
+    """
+    rng = random.Random(seed)
+    batch, made = [], 0
+    for user in users:
+        for _ in range(per_user):
+            batch.append(make_reminder(rng, user.id))
+            if len(batch) == CHUNK_SIZE:
+                models.Reminder.objects.bulk_create(batch)
+                made, batch = made + len(batch), []
+    models.Reminder.objects.bulk_create(batch)
+    return made + len(batch)
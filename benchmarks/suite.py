@@ -0,0 +1,193 @@
+"""
+Times the web app's hot paths on synthetic data and counts the queries each one makes: the home page, the reminder
+form's GET and POST, parse_reminder, building a ReminderForm, RemindersTable.render_time and logging in. How long a
+new worker takes to import the app is measured too, with python -X importtime. See benchmarks.bench_startup.
+Results can be saved as JSON with --output and compared against an earlier run with --compare. Anything slower than
+the earlier run by more than --threshold, or making more queries, is flagged, and the exit status is then 1.
+Runs on a throwaway test database, for example:
+python -m benchmarks.suite --output before.json
+python -m benchmarks.suite --compare before.json
+"""
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from unittest import mock
+
+import django
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from benchmarks import bench_startup, factories
+from CinnamonSwirl import forms, models, tables, views
+from CinnamonSwirl.api import reminder_json
+from CinnamonSwirl.fragments import reminder_fragments
+
+from App import settings
+
+
+def measure(call, iterations: int, warmup: int = 5) -> dict:
+    """
+    | The median and 95th percentile time of call, in milliseconds, and the queries it made the last time it ran.
+    """
+    for _ in range(warmup):
+        call()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    with CaptureQueriesContext(connection) as queries:
+        call()
+    timings.sort()
+    return {'median_ms': round(statistics.median(timings), 4),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+            'queries': len(queries), 'iterations': iterations}
+
+
+def expect(response, status: int):
+    assert response.status_code == status, (response.status_code, status)
+    return response
+
+
+def form_fields(reminder) -> dict:
+    """
+    | The fields the reminder form would POST to save reminder unchanged.
+    """
+    fields = {key: value for key, value in reminder_json(reminder).items()
+              if key not in ('id', 'version', 'finished', 'next_fire_at') and value not in (None, [])}
+    fields.update({'recipient': reminder.recipient, 'reminder_id': reminder.pk})
+    return fields
+
+
+def cases(user, reminder) -> dict:
+    """
+    | The hot paths by name, each a function that goes through it once for user.
+    """
+    client = Client()
+    client.force_login(user)
+    session = client.session
+    session['timezone'] = "US/Central"
+    session.save()
+    factory = RequestFactory()
+    fields = form_fields(reminder)
+    post = factory.post(reverse('reminder'), fields)
+    post.user = user
+    form_request = factory.get(reverse('reminder'), {'id': reminder.pk})
+    form_request.user, form_request.session = user, {'timezone': "US/Central"}
+    page = list(models.Reminder.objects.filter(recipient=user.id).order_by('pk')[:settings.REMINDERS_PAGE_SIZE])
+    login_client = Client()
+
+    def home_uncached():
+        reminder_fragments.invalidate(user.id)
+        expect(client.get(reverse('home'), secure=True), 200)
+
+    def render_times():
+        for row in page:
+            tables.RemindersTable.render_time(row, row.next_fire_at or row.dtstart)
+
+    def login():
+        login_client.cookies.clear()
+        with mock.patch.object(views, "exchange_code", return_value=factories.profile(user.id)):
+            expect(login_client.get(reverse('discord_login_redirect'), {'code': 'bench'}, secure=True), 302)
+        assert login_client.session.get('_auth_user_id') == str(user.id)
+
+    return {
+        "HomeView.get": lambda: expect(client.get(reverse('home'), secure=True), 200),
+        "HomeView.get, table not cached": home_uncached,
+        "ReminderView.get, create": lambda: expect(client.get(reverse('reminder'), secure=True), 200),
+        "ReminderView.get, edit": lambda: expect(client.get(reverse('reminder'), {'id': reminder.pk}, secure=True),
+                                                 200),
+        "ReminderView.post, edit": lambda: expect(client.post(reverse('reminder'), fields, secure=True), 302),
+        "parse_reminder": lambda: views.parse_reminder(post),
+        "ReminderForm, edit": lambda: forms.ReminderForm(request=form_request, reminder=reminder),
+        f"RemindersTable.render_time x{len(page)}": render_times,
+        "login, returning user": login,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    | The names of the cases that got slower than threshold allows, or make more queries, than in baseline.
+
+    >>> compare({'a': {'median_ms': 1.3, 'queries': 2}}, {'a': {'median_ms': 1.0, 'queries': 2}}, 0.25)
+    ['a']
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['median_ms'] > before['median_ms'] * (1 + threshold) or result['queries'] > before['queries']:
+            regressions.append(name)
+    return regressions
+
+
+def report(results: dict, baseline: dict | None, regressions: list):
+    print(f"{'case':<40}{'median':>12}{'p95':>12}{'queries':>9}{'change':>10}")
+    for name, result in results.items():
+        change = ""
+        if baseline and name in baseline:
+            change = f"{result['median_ms'] / baseline[name]['median_ms'] - 1:+.0%}"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<40}{result['median_ms']:>9.3f} ms{result['p95_ms']:>9.3f} ms{result['queries']:>9}"
+              f"{change:>10}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--reminders", type=int, default=200, help="Reminders per user.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters to time imports in. 0 skips.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    parser.add_argument("--compare", help="An earlier --output to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="How much slower than the earlier run a case may get before it is flagged.")
+    arguments = parser.parse_args()
+    logging.disable(logging.DEBUG)  # The views log every request at DEBUG, which would be timed too
+
+    baseline = None
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)['results']
+
+    test_database = connection.creation.create_test_db(verbosity=0)
+    try:
+        caches['default'].clear()
+        users = factories.make_users(arguments.users)
+        made = factories.make_reminders(users, arguments.reminders, seed=arguments.seed)
+        user = users[0]
+        reminder = models.Reminder.objects.filter(recipient=user.id, byhour__gt=0).first() or \
+            models.Reminder.objects.filter(recipient=user.id).first()
+        print(f"{connection.vendor}, {arguments.users} users, {made} reminders, {arguments.iterations} iterations")
+        results = {name: measure(call, arguments.iterations) for name, call in cases(user, reminder).items()}
+    finally:
+        connection.creation.destroy_test_db(test_database, verbosity=0)
+    if arguments.startup_runs:
+        results["startup imports"] = bench_startup.result(bench_startup.import_time(arguments.startup_runs)[0])
+
+    regressions = compare(results, baseline, arguments.threshold) if baseline else []
+    report(results, baseline, regressions)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump({'meta': {'vendor': connection.vendor, 'users': arguments.users, 'reminders': made,
+                                'iterations': arguments.iterations, 'seed': arguments.seed,
+                                'python': platform.python_version(), 'django': django.get_version(),
+                                'at': datetime.utcnow().isoformat(timespec='seconds')},
+                       'results': results}, file, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s) past {arguments.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Read by gunicorn from the working directory. Anything given on the command line, such as --bind in build.dockerfile,
+still applies on top.
+The app is loaded and warmed up once in the master process, and every worker is forked from it ready to answer, so
+starting more workers, or replacing one after max_requests, does not make anyone wait on imports, template compiling
+or timezone tables. Set GUNICORN_PRELOAD=False to load the app in each worker instead, for example to have workers
+pick up code changes on a HUP; each worker then warms up after it loads the app.
+"""
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from CinnamonSwirl import warmup
+        warmup.warm()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from CinnamonSwirl import warmup
+        warmup.warm()